@@ -1,93 +1,423 @@
 import os
+import json
+import time
 import logging
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context, get_template_attribute, send_file
 from urllib.parse import urlparse
-import time
 
-from seo.analyzer import analyze_seo
-from seo.page_speed import check_page_speed
-from seo.content import analyze_content
-from seo.competitors import compare_with_competitors
+from seo.jobs import JobQueue, ensure_workers, analysis_cache_key, crawl_job_key, batch_output_path
+from seo.pipeline import ANALYSIS_DEADLINE
+from seo.cache import create_cache
+from seo.batch import read_urls
+from seo.metrics import registry, timed, STAGE_ERRORS
+from seo.competitors import MAX_COMPETITORS
+from seo.keyword_index import get_index
+from seo.duplicates import get_store as get_fingerprint_store
+from seo.history import get_history, METRICS, DEFAULT_POINTS
+from seo.models import AnalysisResult, to_dict
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
+app.jinja_env.globals['max_competitors'] = MAX_COMPETITORS
+
+results_cache = create_cache('results')
+job_queue = JobQueue()
 
-seo_results_cache = {}
+STREAM_POLL_INTERVAL = 0.25
+STREAM_GRACE = 30
+STAGE_TEMPLATES = {
+    'basic_seo': 'partials/basic_seo.html',
+    'content_analysis': 'partials/content_analysis.html',
+    'speed_results': 'partials/speed_results.html',
+    'competitor_analysis': 'partials/competitor_analysis.html',
+    'link_health': 'partials/link_health.html',
+}
+# Stages rendered as a panel only, without summary and recommendation fragments
+PANEL_ONLY_STAGES = ('competitor_analysis', 'link_health')
+STREAMED_STAGES = list(STAGE_TEMPLATES)
 
 @app.route('/')
 def index():
     """Render the main page with the URL input form"""
     return render_template('index.html')
 
+def split_urls(value):
+    """Competitor URLs from a list, or from text with one URL per line or comma separated"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(',', '\n').splitlines()
+    return [item.strip() for item in value if item and item.strip()]
+
+def parse_flag(value):
+    """Boolean of a JSON or form field"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'on', 'true', 'yes')
+    return bool(value)
+
+def validate_submission(url, competitor_urls):
+    """
+    Normalize submitted URLs
+    Returns the URL, the list of competitor URLs and an error message (or None)
+    """
+    url = (url or '').strip()
+
+    if not url:
+        return None, [], "Please enter a valid URL"
+
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+
+    parsed_url = urlparse(url)
+    if not parsed_url.netloc:
+        return None, [], "Invalid URL format"
+
+    normalized = []
+    for competitor_url in competitor_urls:
+        if not competitor_url.startswith(('http://', 'https://')):
+            competitor_url = 'https://' + competitor_url
+        if not urlparse(competitor_url).netloc:
+            return None, [], f"Invalid competitor URL: {competitor_url}"
+        if competitor_url != url and competitor_url not in normalized:
+            normalized.append(competitor_url)
+
+    if len(normalized) > MAX_COMPETITORS:
+        return None, [], f"Please enter at most {MAX_COMPETITORS} competitor URLs"
+
+    return url, normalized, None
+
+def submit_analysis(url, competitor_urls, check_links=False):
+    """Queue an analysis, or record cached results as a finished job; returns the job id"""
+    params = {'url': url, 'competitor_urls': competitor_urls, 'check_links': check_links}
+    cache_key = analysis_cache_key(params)
+    results = results_cache.get(cache_key)
+    if results is not None:
+        logger.debug(f"Using cached results for {url}")
+        return job_queue.add_finished('analyze', params, results)
+    logger.debug(f"Queueing analysis for URL: {url}")
+    job_id = job_queue.enqueue('analyze', params, dedupe_key=cache_key)
+    ensure_workers()
+    return job_id
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
     """Process the URL and perform SEO analysis"""
     try:
-        url = request.form.get('url', '').strip()
-        competitor_url = request.form.get('competitor_url', '').strip()
-        
-        if not url:
-            return render_template('index.html', error="Please enter a valid URL")
-        
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-            
-        parsed_url = urlparse(url)
-        if not parsed_url.netloc:
-            return render_template('index.html', error="Invalid URL format")
-
-        cache_key = f"{url}_{competitor_url}"
-        current_time = time.time()
-        if cache_key in seo_results_cache and current_time - seo_results_cache[cache_key]['timestamp'] < 1800:
-            logger.debug(f"Using cached results for {url}")
-            results = seo_results_cache[cache_key]['data']
-        else:
-            logger.debug(f"Analyzing URL: {url}")
-            
-            basic_seo = analyze_seo(url)
-            content_analysis = analyze_content(url)
-            speed_results = check_page_speed(url)
-            
-            competitor_analysis = None
-            if competitor_url:
-                if not competitor_url.startswith(('http://', 'https://')):
-                    competitor_url = 'https://' + competitor_url
-                competitor_analysis = compare_with_competitors(url, competitor_url)
-            
-            results = {
-                'url': url,
-                'basic_seo': basic_seo,
-                'content_analysis': content_analysis,
-                'speed_results': speed_results,
-                'competitor_analysis': competitor_analysis,
-                'competitor_url': competitor_url
-            }
-            
-            seo_results_cache[cache_key] = {
-                'data': results,
-                'timestamp': current_time
-            }
-            
-        session['seo_results'] = results
-        
-        return render_template('results.html', results=results)
+        competitor_urls = split_urls(request.form.get('competitor_urls')) + split_urls(request.form.getlist('competitor_url'))
+        url, competitor_urls, error = validate_submission(request.form.get('url'), competitor_urls)
+        if error:
+            return render_template('index.html', error=error)
+
+        # The session only references the job; results stay in the server-side job store
+        session['seo_job_id'] = submit_analysis(url, competitor_urls, parse_flag(request.form.get('check_links')))
+        return redirect(url_for('job_results', job_id=session['seo_job_id']))
         
     except Exception as e:
         logger.error(f"Error during analysis: {str(e)}", exc_info=True)
         return render_template('index.html', error=f"An error occurred: {str(e)}")
 
+@app.route('/results/<job_id>')
+def job_results(job_id):
+    """Show the results of an analysis or crawl job, or a page that waits for it to finish"""
+    job = job_queue.get(job_id, with_result=True)
+    if job is None:
+        return render_template('index.html', error="Analysis not found or expired"), 404
+    if job['status'] == 'failed':
+        return render_template('index.html', error=f"An error occurred: {job['error']}")
+    if job['kind'] == 'batch':
+        return redirect(url_for('job_result', job_id=job_id))
+    if job['status'] != 'done':
+        if job['kind'] == 'crawl':
+            return render_template('job_pending.html', job=job)
+        return render_template('results_stream.html', job=job)
+
+    with timed('render'):
+        if job['kind'] == 'crawl':
+            return render_template('crawl_report.html', report=job['result'])
+        return render_template('results.html', results=job['result'], job_id=job_id)
+
+@app.route('/results/<job_id>/events')
+def job_events(job_id):
+    """Stream each stage's rendered results to the browser as Server-Sent Events"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': "Job not found"}), 404
+
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    def generate():
+        sent = set()
+        last_seq = 0
+        give_up_at = time.monotonic() + ANALYSIS_DEADLINE + STREAM_GRACE
+        while True:
+            for seq, stage, result in job_queue.get_stages(job_id, after=last_seq):
+                last_seq = seq
+                sent.add(stage)
+                yield event('stage', render_stage(job_id, job['params'], stage, result))
+
+            current = job_queue.get(job_id, with_result=True)
+            if current['status'] == 'done':
+                for stage in STREAMED_STAGES:
+                    if stage not in sent and current['result'].get(stage) is not None:
+                        yield event('stage', render_stage(job_id, job['params'], stage, current['result'][stage]))
+                yield event('done', {'timed_out_stages': current['result'].get('timed_out_stages', [])})
+                return
+            if current['status'] == 'failed':
+                yield event('failed', {'error': current['error']})
+                return
+            if time.monotonic() > give_up_at:
+                yield event('failed', {'error': "Analysis is taking longer than expected"})
+                return
+
+            yield ": waiting\n\n"
+            time.sleep(STREAM_POLL_INTERVAL)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def render_stage(job_id, params, stage, result):
+    """Render the page fragments of one finished stage, keyed by element id"""
+    results = {'url': params['url'], 'competitor_urls': params.get('competitor_urls', []), stage: result}
+    template = STAGE_TEMPLATES[stage]
+    fragments = {}
+    try:
+        with timed('render'):
+            if stage in PANEL_ONLY_STAGES:
+                fragments[f'panel-{stage}'] = get_template_attribute(template, 'panel')(results, job_id)
+            else:
+                for part in ('summary', 'recommendations', 'panel'):
+                    fragments[f'{part}-{stage}'] = get_template_attribute(template, part)(results)
+    except Exception as e:
+        logger.error(f"Error rendering stage {stage}: {str(e)}", exc_info=True)
+        STAGE_ERRORS.inc(stage='render')
+        fragments = {f'panel-{stage}': get_template_attribute('partials/stage_error.html', 'panel')(stage, result)}
+    return {'stage': stage, 'fragments': fragments}
+
+@app.route('/api/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status of an analysis job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/jobs/<job_id>/result')
+def job_result(job_id):
+    """
+    Return the results of a finished analysis, crawl or batch job
+    Batch results are sent as the job's JSON lines file, one page per line.
+    Stage timings are only included when ?timings=1 is given
+    """
+    job = job_queue.get(job_id, with_result=True)
+    if job is None:
+        return jsonify({'error': "Job not found"}), 404
+    if job['status'] == 'failed':
+        return jsonify({'status': job['status'], 'error': job['error']}), 500
+    if job['status'] != 'done':
+        return jsonify({'status': job['status']}), 202
+    if job['kind'] == 'batch':
+        output_path = os.path.abspath(batch_output_path(job_id))
+        if not os.path.exists(output_path):
+            return jsonify({'error': "Batch results not found"}), 404
+        return send_file(output_path, mimetype='application/x-ndjson')
+    results = job['result']
+    if request.args.get('timings') != '1':
+        results = {key: value for key, value in results.items() if key != 'timings'}
+    return jsonify(results)
+
+@app.route('/api/v1/analyze', methods=['POST'])
+def api_analyze():
+    """
+    Submit a URL for analysis
+    Accepts JSON or form fields 'url' and optional 'competitor_urls' (a list,
+    or text with one URL per line) or a single 'competitor_url', and 'check_links'
+    to also check every link on the page
+    Returns the result id and status with a Location header to poll
+    """
+    data = request.get_json(silent=True) or request.form
+    competitor_urls = split_urls(data.get('competitor_urls')) + split_urls(data.get('competitor_url'))
+    url, competitor_urls, error = validate_submission(data.get('url'), competitor_urls)
+    if error:
+        return jsonify({'error': error}), 400
+    try:
+        job_id = submit_analysis(url, competitor_urls, parse_flag(data.get('check_links')))
+    except Exception as e:
+        logger.error(f"Error submitting analysis of {url}: {str(e)}", exc_info=True)
+        return jsonify({'error': "Could not queue the analysis"}), 500
+
+    job = job_queue.get(job_id)
+    location = url_for('api_result', result_id=job_id)
+    response = jsonify({'id': job_id, 'status': job['status'], 'url': url, 'result_url': location})
+    response.headers['Location'] = location
+    return response, 202
+
+@app.route('/api/v1/results/<result_id>')
+def api_result(result_id):
+    """
+    Return an analysis result as compact JSON
+    Pending results answer 202 with their status; ?timings=1 adds stage timings
+    """
+    job = job_queue.get(result_id, with_result=True)
+    if job is None or job['kind'] != 'analyze':
+        return jsonify({'error': "Result not found"}), 404
+    result = AnalysisResult.from_job(job, with_timings=request.args.get('timings') == '1')
+    if job['status'] == 'failed':
+        return jsonify(to_dict(result)), 500
+    if job['status'] != 'done':
+        return jsonify(to_dict(result)), 202
+    return jsonify(to_dict(result))
+
+@app.route('/api/v1/keywords')
+def api_keywords():
+    """
+    TF-IDF keywords of one or more analyzed pages from the keyword index
+    Pass each page as a 'url' query parameter; with several pages the shared
+    keywords are returned under 'overlap'
+    """
+    urls = request.args.getlist('url')
+    if not urls:
+        return jsonify({'error': "Please give at least one url"}), 400
+    limit = request.args.get('limit', 10, type=int)
+    index = get_index()
+    top_keywords = index.top_keywords(urls, limit=limit)
+    if top_keywords is None:
+        return jsonify({'error': "Page not indexed; analyze it first"}), 404
+    response = {'urls': urls, 'indexed_pages': len(index), 'top_keywords': top_keywords}
+    if len(urls) > 1:
+        response['overlap'] = index.overlap(urls, limit=limit)
+    return jsonify(response)
+
+@app.route('/api/v1/duplicates')
+def api_duplicates():
+    """
+    Duplicate titles, meta descriptions and near-duplicate pages among all
+    crawled and batch-analyzed pages of a site, given as ?site=<host>
+    """
+    site = (request.args.get('site') or '').strip()
+    if not site:
+        return jsonify({'error': "Please give a site host"}), 400
+    return jsonify(dict(get_fingerprint_store().duplicates(site), site=site))
+
+@app.route('/api/v1/history')
+def api_history():
+    """
+    Score history of an analyzed page, given as ?url=<url>
+    Returns one metric (?metric=, overall_score by default) as [time, value]
+    points, downsampled to at most ?points= points; ?since= and ?until= take Unix times
+    """
+    url = (request.args.get('url') or '').strip()
+    metric = request.args.get('metric', 'overall_score')
+    if not url:
+        return jsonify({'error': "Please give a url"}), 400
+    if metric not in METRICS:
+        return jsonify({'error': f"Unknown metric; use one of {', '.join(METRICS)}"}), 400
+    return jsonify(get_history().series(
+        url, metric,
+        start=request.args.get('since', type=float),
+        end=request.args.get('until', type=float),
+        points=request.args.get('points', DEFAULT_POINTS, type=int),
+    ))
+
+@app.route('/api/v1/history/<report>')
+def api_history_report(report):
+    """
+    Score history across pages: 'trends', 'regressions' or 'week-over-week'
+    of a metric (?metric=), optionally for one site (?site=<host>) and limited
+    to ?limit= pages; regressions take a ?threshold=, trends ?since= and ?until=
+    """
+    metric = request.args.get('metric', 'overall_score')
+    if metric not in METRICS:
+        return jsonify({'error': f"Unknown metric; use one of {', '.join(METRICS)}"}), 400
+    site = (request.args.get('site') or '').strip() or None
+    limit = request.args.get('limit', 100, type=int)
+    history = get_history()
+    if report == 'trends':
+        trends = history.trends(metric, site=site, start=request.args.get('since', type=float),
+                                end=request.args.get('until', type=float), limit=limit)
+        return jsonify({'metric': metric, 'site': site, 'trends': trends})
+    if report == 'regressions':
+        regressions = history.regressions(metric, threshold=request.args.get('threshold', 1, type=float),
+                                          site=site, since=request.args.get('since', type=float), limit=limit)
+        return jsonify({'metric': metric, 'site': site, 'regressions': regressions})
+    if report == 'week-over-week':
+        return jsonify(history.week_over_week(metric, site=site, limit=limit))
+    return jsonify({'error': "Unknown report"}), 404
+
 @app.route('/competitor-analysis')
 def competitor_analysis():
     """Show detailed competitor analysis"""
-    results = session.get('seo_results')
+    job_id = request.args.get('job_id') or session.get('seo_job_id')
+    job = job_queue.get(job_id, with_result=True) if job_id else None
+    results = job['result'] if job and job['status'] == 'done' else None
     if not results or not results.get('competitor_analysis'):
         return redirect(url_for('index'))
     
     return render_template('competitor_analysis.html', results=results)
 
+@app.route('/batch', methods=['POST'])
+def batch_analyze():
+    """
+    Queue the analysis of a list of URLs as a background job
+    With a 'sitemap' field (a site or sitemap URL) the pages listed in the
+    site's sitemaps are analyzed instead; 'changed_only' skips pages whose
+    lastmod is not later than their last audit
+    Redirects to the job status; the results are at /api/jobs/<job_id>/result as JSON lines
+    """
+    if request.form.get('sitemap'):
+        params = {'sitemap': request.form['sitemap'].strip(), 'changed_only': parse_flag(request.form.get('changed_only'))}
+    else:
+        upload = request.files.get('urls')
+        if upload:
+            text = upload.read().decode('utf-8', errors='replace')
+        else:
+            text = request.form.get('urls') or request.get_data(as_text=True)
+        urls = list(read_urls(text.splitlines()))
+        if not urls:
+            return jsonify({'error': "No URLs provided"}), 400
+        params = {'urls': urls}
+
+    job_id = job_queue.enqueue('batch', params)
+    ensure_workers()
+    return redirect(url_for('job_status', job_id=job_id), code=303)
+
+@app.route('/crawl', methods=['POST'])
+def crawl():
+    """
+    Queue a crawl of a site from a seed URL and redirect to its report page
+    With ?format=json the redirect goes to the job status instead
+    """
+    url = request.form.get('url', '').strip()
+    if not url:
+        return render_template('index.html', error="Please enter a valid URL")
+    try:
+        max_pages = min(int(request.form.get('max_pages', 50)), 500)
+        max_depth = min(int(request.form.get('max_depth', 2)), 10)
+    except ValueError:
+        return render_template('index.html', error="Invalid crawl limits")
+
+    params = {'url': url, 'max_pages': max_pages, 'max_depth': max_depth}
+    job_id = job_queue.enqueue('crawl', params, dedupe_key=crawl_job_key(params))
+    ensure_workers()
+    if request.args.get('format') == 'json':
+        return redirect(url_for('job_status', job_id=job_id), code=303)
+    return redirect(url_for('job_results', job_id=job_id), code=303)
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Report hit, miss and eviction counters of the results cache"""
+    return jsonify(results_cache.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Expose stage timings, byte counters, cache hit ratios and error counts to Prometheus"""
+    return Response(registry.exposition(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('index.html', error="Page not found"), 404
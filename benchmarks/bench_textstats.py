@@ -0,0 +1,160 @@
+"""
+Benchmark the shared text statistics engine against the inline text
+statistics analyze_content used before it, and check both give the same output
+
+Usage: python benchmarks/bench_textstats.py [--documents 200] [--words 2000]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from seo.textstats import text_stats, flesch_reading_ease, rank_keywords, batch_text_stats, corpus_summary
+
+
+def legacy_stats(text_content):
+    """Text statistics exactly as analyze_content computed them before seo.textstats"""
+    word_count = len(text_content.split())
+    paragraph_count = len(re.split(r'\n\s*\n', text_content))
+
+    words = re.findall(r'\b[a-zA-Z]{3,15}\b', text_content.lower())
+    stop_words = {'the', 'and', 'are', 'for', 'was', 'with', 'this', 'that', 'from', 'they', 'were', 'have', 'what', 'your', 'will', 'been'}
+    filtered_words = [word for word in words if word not in stop_words]
+
+    word_freq = Counter(filtered_words)
+    total_words = len(filtered_words)
+
+    top_keywords = []
+    if total_words > 0:
+        for word, count in word_freq.most_common(10):
+            density = (count / total_words) * 100
+            top_keywords.append({'word': word, 'count': count, 'density': round(density, 2)})
+
+    sentences = re.split(r'[.!?]+', text_content)
+    sentence_count = len([s for s in sentences if len(s.strip()) > 0])
+
+    if sentence_count == 0 or word_count == 0:
+        readability_score = 0
+    else:
+        avg_sentence_length = word_count / sentence_count
+
+        def count_syllables(word):
+            word = word.lower()
+            if len(word) <= 3:
+                return 1
+            if word.endswith('es') or word.endswith('ed'):
+                word = word[:-2]
+            elif word.endswith('e'):
+                word = word[:-1]
+            vowels = 'aeiouy'
+            count = 0
+            prev_is_vowel = False
+            for char in word:
+                is_vowel = char in vowels
+                if is_vowel and not prev_is_vowel:
+                    count += 1
+                prev_is_vowel = is_vowel
+            return max(1, count)
+
+        syllable_count = sum(count_syllables(word) for word in text_content.split())
+        avg_syllables_per_word = syllable_count / word_count
+        readability_score = 206.835 - (1.015 * avg_sentence_length) - (84.6 * avg_syllables_per_word)
+        readability_score = max(0, min(100, readability_score))
+
+    return {
+        'word_count': word_count,
+        'paragraph_count': paragraph_count,
+        'sentence_count': sentence_count,
+        'top_keywords': top_keywords,
+        'readability': readability_score,
+    }
+
+
+def engine_stats(text_content):
+    stats = text_stats(text_content)
+    return {
+        'word_count': stats['word_count'],
+        'paragraph_count': stats['paragraph_count'],
+        'sentence_count': stats['sentence_count'],
+        'top_keywords': rank_keywords(stats),
+        'readability': flesch_reading_ease(stats),
+    }
+
+
+VOCABULARY = ('search engine optimization content readability keyword density ranking website page '
+              'analysis meta title description heading image link crawl index mobile speed performance '
+              'user experience structured data schema canonical sitemap robots the and for with this that '
+              'a an of to in is it on be are was were have from your will been').split()
+PUNCTUATION = ['', '', '', '', ',', '.', '!', '?', '...', '.)', '"', '-', '.?!']
+ODD_TOKENS = ['e.g.', 'U.S.A.', '3.14', 'naïve', 'café', 'co-operate', '...', '?!', 'HTML5', 'don\'t',
+              'snake_case', 'x' * 20, 'İstanbul', ' ', '—']
+
+
+def make_document(rng, words):
+    parts = []
+    for _ in range(words):
+        token = rng.choice(ODD_TOKENS) if rng.random() < 0.05 else rng.choice(VOCABULARY)
+        if rng.random() < 0.1:
+            token = token.capitalize()
+        parts.append(token + rng.choice(PUNCTUATION))
+        roll = rng.random()
+        if roll < 0.02:
+            parts.append(rng.choice(['\n\n', '\n \n', '\n\t\n\n', ' \n  ']))
+        elif roll < 0.05:
+            parts.append('\n')
+    return ' '.join(parts)
+
+
+def time_it(func, documents, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for document in documents:
+            func(document)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--words', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [make_document(rng, rng.randint(0, args.words)) for _ in range(args.documents)]
+    documents += ['', '   ', '\n\n', '...', 'One.', 'no terminator', 'a . . b', '!!!x', 'x.\n\n\ny?']
+
+    mismatches = 0
+    for index, document in enumerate(documents):
+        expected, actual = legacy_stats(document), engine_stats(document)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"Mismatch in document {index}:\n  legacy: {expected}\n  engine: {actual}")
+    print(f"Checked {len(documents)} documents: {mismatches} mismatches")
+
+    legacy_time = time_it(legacy_stats, documents, args.repeat)
+    engine_time = time_it(engine_stats, documents, args.repeat)
+    started = time.perf_counter()
+    summary = corpus_summary(batch_text_stats(documents))
+    batch_time = time.perf_counter() - started
+    total_words = summary['total_words']
+
+    print(f"legacy:  {legacy_time:.3f}s ({total_words / legacy_time:,.0f} words/s)")
+    print(f"engine:  {engine_time:.3f}s ({total_words / engine_time:,.0f} words/s), "
+          f"{legacy_time / engine_time:.1f}x faster")
+    print(f"batch:   {batch_time:.3f}s including corpus summary "
+          f"(average readability {summary['average_readability']:.1f})")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
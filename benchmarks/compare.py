@@ -0,0 +1,59 @@
+"""
+Compare two benchmark result files and flag regressions
+
+Usage: python benchmarks/compare.py baseline.json candidate.json [--threshold 0.10]
+Exits with status 1 when any p50, p99 or peak memory grows, or throughput
+drops, by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+# metric, whether a larger value is better
+METRICS = (('throughput', True), ('p50', False), ('p99', False), ('peak_memory_bytes', False))
+
+
+def load(path):
+    with open(path, encoding='utf-8') as source:
+        report = json.load(source)
+    return report['meta'], {(result['benchmark'], result['page']): result for result in report['results']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    baseline_meta, baseline = load(args.baseline)
+    candidate_meta, candidate = load(args.candidate)
+    print(f"baseline {baseline_meta.get('revision')} ({baseline_meta.get('created_at')}) -> "
+          f"candidate {candidate_meta.get('revision')} ({candidate_meta.get('created_at')})")
+    print(f"{'benchmark':<26} {'page':<12} " + ' '.join(f"{metric:>18}" for metric, _ in METRICS))
+
+    regressions = []
+    for key in sorted(set(baseline) & set(candidate)):
+        cells = []
+        for metric, higher_is_better in METRICS:
+            before, after = baseline[key][metric], candidate[key][metric]
+            change = (after - before) / before if before else 0.0
+            worse = -change if higher_is_better else change
+            flag = ' !' if worse > args.threshold else '  '
+            if worse > args.threshold:
+                regressions.append((key, metric, change))
+            cells.append(f"{change * 100:>+15.1f}%{flag}")
+        print(f"{key[0]:<26} {key[1]:<12} " + ' '.join(cells))
+
+    missing = sorted(set(baseline) ^ set(candidate))
+    if missing:
+        print(f"Not in both files: {', '.join(f'{name}/{page}' for name, page in missing)}")
+    if regressions:
+        print(f"{len(regressions)} regressions above {args.threshold * 100:.0f}%")
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
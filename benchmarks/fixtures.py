@@ -0,0 +1,200 @@
+"""
+Synthetic pages and a local HTTP server for benchmarks
+
+The server serves generated pages under /pages/<name>.html (query strings are
+ignored, so callers can vary them to defeat caches) and answers PageSpeed API
+requests under /pagespeed with a canned Lighthouse result, so benchmarks
+never leave the machine.
+"""
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+VOCABULARY = ('search engine optimization content readability keyword density ranking website page '
+              'analysis meta title description heading image link crawl index mobile speed performance '
+              'user experience structured data schema canonical sitemap robots audit backlink traffic '
+              'the and for with this that a an of to in is it on be are was were have from your will').split()
+
+# name, target size in bytes, links, images, words (None fills the page with text)
+DEFAULT_PROFILES = [
+    {'name': '10kb', 'size': 10 * 1024, 'links': 20, 'images': 5, 'words': None},
+    {'name': '100kb', 'size': 100 * 1024, 'links': 100, 'images': 20, 'words': None},
+    {'name': '1mb', 'size': 1024 * 1024, 'links': 500, 'images': 100, 'words': None},
+    {'name': '1mb-scripts', 'size': 1024 * 1024, 'links': 50, 'images': 10, 'words': 2000},
+    {'name': '5mb', 'size': 5 * 1024 * 1024, 'links': 2000, 'images': 300, 'words': None},
+    {'name': '20mb', 'size': 20 * 1024 * 1024, 'links': 5000, 'images': 1000, 'words': None},
+]
+
+LIGHTHOUSE_AUDITS = {
+    'first-contentful-paint': (0.92, '1.1 s', 1100),
+    'speed-index': (0.71, '3.9 s', 3900),
+    'largest-contentful-paint': (0.55, '3.4 s', 3400),
+    'interactive': (0.81, '4.2 s', 4200),
+    'total-blocking-time': (0.95, '120 ms', 120),
+    'cumulative-layout-shift': (0.88, '0.08', 0.08),
+    'render-blocking-resources': (0.4, 'Potential savings of 600 ms', 600),
+    'uses-optimized-images': (0.6, 'Potential savings of 120 KiB', 122880),
+}
+
+
+def _sentence(rng, words):
+    sentence = ' '.join(rng.choice(VOCABULARY) for _ in range(words))
+    return sentence[0].upper() + sentence[1:] + rng.choice('...!?')
+
+
+def _paragraph(rng, words):
+    parts = []
+    while words > 0:
+        length = min(words, rng.randint(6, 20))
+        parts.append(_sentence(rng, length))
+        words -= length
+    return '<p>' + ' '.join(parts) + '</p>\n'
+
+
+def generate_page(size, links=20, images=5, words=None, seed=0, name='page'):
+    """
+    Build an HTML page of roughly `size` bytes with the given numbers of links
+    and images. With `words` set the text is limited to that many words and the
+    page is padded to size with inline scripts; otherwise text fills the page.
+    Returns the page as UTF-8 bytes
+    """
+    rng = random.Random(seed)
+    head = (
+        '<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">\n'
+        f'<title>Benchmark page {name} about search engine optimization</title>\n'
+        '<meta name="description" content="A generated page used to benchmark the SEO analyzer '
+        'with a controlled size, link count and image count.">\n'
+        f'<link rel="canonical" href="/pages/{name}.html">\n</head>\n<body>\n'
+        '<header><nav><a href="/">Home</a> <a href="/about">About</a></nav></header>\n'
+        f'<main>\n<h1>Benchmark page {name}</h1>\n'
+    )
+    tail = '</main>\n<footer><p>Generated footer text</p></footer>\n</body>\n</html>\n'
+
+    blocks = []
+    for index in range(links):
+        if index % 2:
+            blocks.append(f'<a href="https://external{index % 50}.example/path/{index}">External {index}</a>\n')
+        else:
+            blocks.append(f'<a href="/pages/{name}.html?link={index}">Internal {index}</a>\n')
+    for index in range(images):
+        alt = f' alt="Image {index}"' if index % 4 else ''
+        blocks.append(f'<img src="/images/{index}.png"{alt}>\n')
+    rng.shuffle(blocks)
+
+    body = []
+    body_size = len(head) + len(tail) + sum(len(block) for block in blocks)
+    written_words = 0
+    section = 0
+    while True:
+        if words is not None and written_words >= words:
+            break
+        if words is None and body_size >= size:
+            break
+        if section % 5 == 0:
+            heading = f'<h2>Section {section}</h2>\n' if section % 10 == 0 else f'<h3>Section {section}</h3>\n'
+            body.append(heading)
+            body_size += len(heading)
+        count = 80 if words is None else min(80, words - written_words)
+        paragraph = _paragraph(rng, count)
+        body.append(paragraph)
+        body_size += len(paragraph)
+        written_words += count
+        section += 1
+
+    # Interleave links and images with the text
+    step = max(1, len(body) // max(1, len(blocks)))
+    content = []
+    for index, paragraph in enumerate(body):
+        content.append(paragraph)
+        if index % step == 0 and blocks:
+            content.append(blocks.pop())
+    content.extend(blocks)
+
+    padding = []
+    while body_size < size:
+        chunk = min(size - body_size, 64 * 1024)
+        script = '<script>var data = "' + 'x' * max(0, chunk - 40) + '";</script>\n'
+        padding.append(script)
+        body_size += len(script)
+
+    return (head + ''.join(content) + ''.join(padding) + tail).encode('utf-8')
+
+
+def lighthouse_response():
+    """Canned PageSpeed API response with the audits check_page_speed reads"""
+    audits = {
+        audit_id: {'title': audit_id.replace('-', ' ').capitalize(), 'description': 'Benchmark audit',
+                   'score': score, 'displayValue': display, 'numericValue': numeric,
+                   'scoreDisplayMode': 'numeric', 'details': {'items': [{'url': '/x.js', 'wastedMs': 10}] * 20}}
+        for audit_id, (score, display, numeric) in LIGHTHOUSE_AUDITS.items()
+    }
+    return {'lighthouseResult': {'categories': {'performance': {'score': 0.78}}, 'audits': audits}}
+
+
+class FixtureServer:
+    """
+    Threaded HTTP server on a free local port serving generated pages and a PageSpeed stub
+    """
+
+    def __init__(self, profiles=None, pagespeed_delay=0.0, seed=0):
+        self.pages = {
+            profile['name']: generate_page(profile['size'], profile['links'], profile['images'],
+                                           profile.get('words'), seed=seed, name=profile['name'])
+            for profile in (profiles or DEFAULT_PROFILES)
+        }
+        self.pagespeed_body = json.dumps(lighthouse_response()).encode('utf-8')
+        self.pagespeed_delay = pagespeed_delay
+        self.pagespeed_requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; avoid delayed-ACK stalls on keep-alive
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path == '/pagespeed':
+                    server.pagespeed_requests += 1
+                    if server.pagespeed_delay:
+                        time.sleep(server.pagespeed_delay)
+                    return self._send(200, server.pagespeed_body, 'application/json')
+                if path.startswith('/pages/') and path.endswith('.html'):
+                    body = server.pages.get(path[len('/pages/'):-len('.html')])
+                    if body is not None:
+                        return self._send(200, body, 'text/html; charset=utf-8')
+                return self._send(404, b'Not found', 'text/plain')
+
+            def _send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def page_url(self, name, query=''):
+        return f"{self.base_url}/pages/{name}.html" + (f"?{query}" if query else '')
+
+    @property
+    def pagespeed_url(self):
+        return f"{self.base_url}/pagespeed"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
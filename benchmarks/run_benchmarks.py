@@ -0,0 +1,176 @@
+"""
+Benchmark the analysis functions and the /analyze route against local fixture pages
+
+Starts a fixture HTTP server with generated pages from 10 KB to 20 MB and a
+PageSpeed API stub, then measures throughput, p50/p99 latency and peak
+traced memory of analyze_seo, analyze_content, compare_with_competitors and
+the full /analyze route. Runs fully offline.
+
+Usage: python benchmarks/run_benchmarks.py -o results.json [--iterations 20] [--pages 10kb,1mb]
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixtures import FixtureServer, DEFAULT_PROFILES
+
+BENCHMARKS = ('analyze_seo', 'analyze_content', 'compare_with_competitors', 'analyze_route')
+LARGE_PAGE_BYTES = 4 * 1024 * 1024
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def measure(func, iterations):
+    """
+    Call func(i) for each iteration and summarize the latencies
+    Peak memory is measured on one extra traced call so tracing does not skew timings
+    """
+    func(-1)
+    latencies = []
+    started = time.perf_counter()
+    for iteration in range(iterations):
+        call_started = time.perf_counter()
+        func(iteration)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    func(iterations)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'throughput': round(iterations / elapsed, 3),
+        'p50': round(percentile(latencies, 0.5), 6),
+        'p99': round(percentile(latencies, 0.99), 6),
+        'mean': round(sum(latencies) / len(latencies), 6),
+        'peak_memory_bytes': peak,
+    }
+
+
+def route_runner(client, url):
+    """One full /analyze request: submit, wait for the job and render the results page"""
+    def run(iteration):
+        response = client.post('/analyze', data={'url': f"{url}?run={iteration}-{time.monotonic_ns()}"})
+        job_id = response.headers['Location'].rsplit('/', 1)[1]
+        while True:
+            status = client.get(f'/api/jobs/{job_id}').get_json()['status']
+            if status in ('done', 'failed'):
+                break
+            time.sleep(0.005)
+        if status == 'failed':
+            raise RuntimeError(f"Analysis job {job_id} failed")
+        client.get(f'/results/{job_id}')
+    return run
+
+
+def comparison_urls(url, iteration):
+    """
+    Main and competitor URLs for one comparison, unique to the call so the
+    site_analyses and PageSpeed caches never answer it and every site is analyzed
+    """
+    run = f"{iteration}-{time.monotonic_ns()}"
+    return f"{url}?run={run}", [f"{url}?run={run}&c=1"]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the SEO analyzer benchmark suite offline")
+    parser.add_argument('-o', '--output', default='benchmark-results.json', help="JSON file to write")
+    parser.add_argument('--iterations', type=int, default=20, help="Calls per benchmark and page")
+    parser.add_argument('--large-iterations', type=int, default=3, help="Calls per benchmark for pages over 4 MB")
+    parser.add_argument('--pages', help="Comma separated page profiles (default: all)")
+    parser.add_argument('--benchmarks', help=f"Comma separated benchmarks (default: {','.join(BENCHMARKS)})")
+    parser.add_argument('--pagespeed-delay', type=float, default=0.0, help="Seconds the PageSpeed stub waits")
+    parser.add_argument('--max-body', type=int, default=64 * 1024 * 1024, help="SEO_MAX_BODY_BYTES for the run")
+    args = parser.parse_args()
+
+    profiles = DEFAULT_PROFILES
+    if args.pages:
+        wanted = args.pages.split(',')
+        profiles = [profile for profile in DEFAULT_PROFILES if profile['name'] in wanted]
+    benchmarks = args.benchmarks.split(',') if args.benchmarks else list(BENCHMARKS)
+
+    with FixtureServer(profiles, pagespeed_delay=args.pagespeed_delay) as server, \
+            tempfile.TemporaryDirectory(prefix='seo-bench-') as data_dir:
+        # Settings are read at import time, so they must be set before importing the app
+        os.environ.update({
+            'SEO_DATA_DIR': data_dir,
+            'PAGESPEED_API_URL': server.pagespeed_url,
+            'PAGESPEED_RATE': '100000',
+            'PAGESPEED_BURST': '100000',
+            'SEO_MAX_BODY_BYTES': str(args.max_body),
+            'SEO_JOB_POLL_INTERVAL': '0.01',
+            'LOG_LEVEL': os.environ.get('LOG_LEVEL', 'ERROR'),
+        })
+        from seo.analyzer import analyze_seo
+        from seo.content import analyze_content
+        from seo.competitors import compare_with_competitors
+
+        functions = {
+            'analyze_seo': lambda url: (lambda i: analyze_seo(url)),
+            'analyze_content': lambda url: (lambda i: analyze_content(url)),
+            'compare_with_competitors': lambda url: (lambda i: compare_with_competitors(*comparison_urls(url, i))),
+        }
+        if 'analyze_route' in benchmarks:
+            import app as web
+            client = web.app.test_client()
+            functions['analyze_route'] = lambda url: route_runner(client, url)
+
+        results = []
+        for profile in profiles:
+            page_bytes = len(server.pages[profile['name']])
+            iterations = args.large_iterations if page_bytes > LARGE_PAGE_BYTES else args.iterations
+            for name in benchmarks:
+                summary = measure(functions[name](server.page_url(profile['name'])), iterations)
+                summary.update({'benchmark': name, 'page': profile['name'], 'page_bytes': page_bytes})
+                results.append(summary)
+                print(f"{name:<26} {profile['name']:<12} {summary['throughput']:>9.2f}/s  "
+                      f"p50 {summary['p50'] * 1000:>9.1f} ms  p99 {summary['p99'] * 1000:>9.1f} ms  "
+                      f"peak {summary['peak_memory_bytes'] / 1048576:>7.1f} MiB", flush=True)
+
+    report = {
+        'meta': {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'iterations': args.iterations,
+            'large_iterations': args.large_iterations,
+            'pagespeed_delay': args.pagespeed_delay,
+            'max_body_bytes': args.max_body,
+            # The route runs analyses in job worker processes, which tracemalloc cannot see
+            'route_memory_scope': 'web process only',
+        },
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
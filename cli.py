@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import logging
+import argparse
+
+from seo.batch import run_batch, read_urls, open_url_source, load_checkpoint, write_results, DEFAULT_CONCURRENCY, DEFAULT_PER_HOST
+from seo import crawler
+from seo.sitemap import audit_sitemap, iter_sitemap_entries, changed_entries
+from seo.jobs import worker_loop, JOB_WORKERS
+from seo.replay import iter_replay
+from seo.rules import load_ruleset, rescore_results
+from seo.metrics import registry
+from seo.scheduler import ScheduleStore, run_scheduler, parse_interval
+
+
+def batch_command(args):
+    """Analyze a list of URLs and write JSON lines results"""
+    source = open_url_source(args.input)
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    checkpoint = args.checkpoint
+    if checkpoint is None and args.output:
+        checkpoint = args.output + '.checkpoint'
+    try:
+        count = run_batch(
+            read_urls(source),
+            output,
+            checkpoint=checkpoint,
+            concurrency=args.concurrency,
+            per_host=args.per_host,
+            processes=args.processes,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if source is not sys.stdin:
+            source.close()
+    logging.info(f"Analyzed {count} URLs")
+
+
+def crawl_command(args):
+    """Crawl a site from a seed URL and write the site report as JSON"""
+    report = crawler.crawl_site(
+        args.url,
+        max_depth=args.max_depth,
+        max_pages=args.max_pages,
+        concurrency=args.concurrency,
+        per_host=args.per_host,
+        respect_robots=not args.ignore_robots,
+    )
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        json.dump(report, output, indent=2)
+        output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+def sitemap_command(args):
+    """List or analyze the pages in a site's sitemaps"""
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    count = 0
+    mismatches = 0
+    try:
+        if args.urls_only:
+            entries = iter_sitemap_entries(args.url)
+            if args.changed_only:
+                entries = changed_entries(entries)
+            for entry in entries:
+                output.write(entry['url'] + '\n')
+                count += 1
+                if count == args.limit:
+                    break
+        else:
+            results = audit_sitemap(args.url, changed_only=args.changed_only, limit=args.limit,
+                                    concurrency=args.concurrency, per_host=args.per_host, processes=args.processes)
+            for result in results:
+                output.write(json.dumps(result, separators=(',', ':')) + '\n')
+                output.flush()
+                count += 1
+                if result['sitemap']['canonical_mismatch']:
+                    mismatches += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.urls_only:
+        logging.info(f"Listed {count} URLs")
+    else:
+        logging.info(f"Analyzed {count} URLs, {mismatches} with a canonical URL different from the sitemap")
+
+
+def replay_command(args):
+    """Analyze the pages of a WARC file, HAR file or snapshot directory without network access"""
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    checkpoint = args.checkpoint
+    if checkpoint is None and args.output:
+        checkpoint = args.output + '.checkpoint'
+    done = load_checkpoint(checkpoint)
+    if done:
+        logging.info(f"Resuming replay, skipping {len(done)} pages already analyzed")
+    try:
+        count = write_results(iter_replay(args.archive, processes=args.processes, skip=done), output, checkpoint)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    logging.info(f"Analyzed {count} archived pages")
+
+
+def rescore_command(args):
+    """Re-score stored JSON lines results with the current or a given ruleset"""
+    ruleset = load_ruleset(args.rules)
+    source = open_url_source(args.input)
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    count = 0
+    try:
+        results = (json.loads(line) for line in source if line.strip())
+        for result in rescore_results(results, ruleset):
+            output.write(json.dumps(result, separators=(',', ':')) + '\n')
+            count += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if source is not sys.stdin:
+            source.close()
+    logging.info(f"Re-scored {count} results")
+
+
+def worker_command(args):
+    """Run a job worker that consumes queued /analyze jobs"""
+    worker_loop()
+
+
+def schedule_command(args):
+    """Add, list or remove recurring audits, or run the scheduler"""
+    if args.action == 'run':
+        run_scheduler(workers=args.workers)
+        return
+    store = ScheduleStore()
+    if args.action == 'add':
+        interval = parse_interval(args.every)
+        if args.sitemap:
+            schedule_id = store.add_schedule('sitemap', args.sitemap, interval, {'check_links': args.check_links})
+        elif args.crawl:
+            schedule_id = store.add_schedule('crawl', args.crawl, interval,
+                                             {'max_pages': args.max_pages, 'max_depth': args.max_depth})
+        else:
+            source = open_url_source(args.urls)
+            try:
+                urls = list(dict.fromkeys(read_urls(source)))
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+            schedule_id = store.add_schedule('urls', args.urls, interval, {'check_links': args.check_links}, urls)
+        logging.info(f"Added schedule {schedule_id}")
+    elif args.action == 'remove':
+        if not store.remove_schedule(args.id):
+            logging.error(f"No schedule {args.id}")
+    else:
+        for schedule in store.schedules():
+            print(json.dumps(schedule))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SEO Analyzer command line tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch = subparsers.add_parser('batch', help="Analyze a list of URLs from a file or stdin")
+    batch.add_argument('input', nargs='?', default='-', help="File with one URL per line, '-' for stdin")
+    batch.add_argument('-o', '--output', help="JSON lines output file (default: stdout)")
+    batch.add_argument('--checkpoint', help="Checkpoint file for resuming (default: <output>.checkpoint)")
+    batch.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Maximum concurrent fetches")
+    batch.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST, help="Maximum concurrent fetches per host")
+    batch.add_argument('--processes', type=int, help="Analysis worker processes (default: CPU count)")
+    batch.set_defaults(func=batch_command)
+
+    crawl = subparsers.add_parser('crawl', help="Crawl a site from a seed URL and report on every page")
+    crawl.add_argument('url', help="Seed URL to start crawling from")
+    crawl.add_argument('-o', '--output', help="JSON report file (default: stdout)")
+    crawl.add_argument('--max-depth', type=int, default=crawler.DEFAULT_MAX_DEPTH, help="Maximum link depth from the seed")
+    crawl.add_argument('--max-pages', type=int, default=crawler.DEFAULT_MAX_PAGES, help="Maximum number of pages to crawl")
+    crawl.add_argument('--concurrency', type=int, default=crawler.DEFAULT_CONCURRENCY, help="Number of crawl workers")
+    crawl.add_argument('--per-host', type=int, default=crawler.DEFAULT_PER_HOST, help="Maximum concurrent requests to the host")
+    crawl.add_argument('--ignore-robots', action='store_true', help="Do not apply robots.txt rules")
+    crawl.set_defaults(func=crawl_command)
+
+    sitemap = subparsers.add_parser('sitemap', help="Analyze the pages listed in a site's sitemaps")
+    sitemap.add_argument('url', help="Site URL (sitemaps are found through robots.txt) or sitemap URL")
+    sitemap.add_argument('-o', '--output', help="JSON lines output file (default: stdout)")
+    sitemap.add_argument('--changed-only', action='store_true', help="Skip pages whose lastmod is not later than their last audit")
+    sitemap.add_argument('--limit', type=int, help="Maximum number of pages")
+    sitemap.add_argument('--urls-only', action='store_true', help="Only list the URLs, one per line, without analyzing them")
+    sitemap.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Maximum concurrent fetches")
+    sitemap.add_argument('--per-host', type=int, default=DEFAULT_PER_HOST, help="Maximum concurrent fetches per host")
+    sitemap.add_argument('--processes', type=int, help="Analysis worker processes (default: CPU count)")
+    sitemap.set_defaults(func=sitemap_command)
+
+    replay = subparsers.add_parser('replay', help="Analyze pages from a WARC file, HAR file or directory of saved HTML")
+    replay.add_argument('archive', help="A .warc, .warc.gz or .har file, or a directory of saved pages")
+    replay.add_argument('-o', '--output', help="JSON lines output file (default: stdout)")
+    replay.add_argument('--checkpoint', help="Checkpoint file for resuming (default: <output>.checkpoint)")
+    replay.add_argument('--processes', type=int, help="Analysis worker processes (default: CPU count)")
+    replay.set_defaults(func=replay_command)
+
+    rescore = subparsers.add_parser('rescore', help="Re-score stored results from their signals without fetching")
+    rescore.add_argument('input', nargs='?', default='-', help="JSON lines results from batch, sitemap or replay, '-' for stdin")
+    rescore.add_argument('-o', '--output', help="JSON lines output file (default: stdout)")
+    rescore.add_argument('--rules', help="Ruleset file (default: SEO_RULES_PATH or seo/rules.json)")
+    rescore.set_defaults(func=rescore_command)
+
+    schedule = subparsers.add_parser('schedule', help="Manage and run recurring audits")
+    actions = schedule.add_subparsers(dest='action', required=True)
+    add = actions.add_parser('add', help="Audit a URL list, a site's sitemaps or a site crawl at an interval")
+    targets = add.add_mutually_exclusive_group(required=True)
+    targets.add_argument('--urls', help="File with one URL per line, '-' for stdin")
+    targets.add_argument('--sitemap', help="Site URL or sitemap URL; the URL list is refreshed every interval")
+    targets.add_argument('--crawl', help="Seed URL of a site to crawl")
+    add.add_argument('--every', default='1d', help="Interval such as 6h, 1d or 1w (default: 1d)")
+    add.add_argument('--check-links', action='store_true', help="Also check every link on each page")
+    add.add_argument('--max-pages', type=int, default=crawler.DEFAULT_MAX_PAGES, help="Maximum pages per crawl")
+    add.add_argument('--max-depth', type=int, default=crawler.DEFAULT_MAX_DEPTH, help="Maximum crawl link depth")
+    actions.add_parser('list', help="List schedules as JSON lines")
+    remove = actions.add_parser('remove', help="Remove a schedule")
+    remove.add_argument('id', type=int, help="Schedule id")
+    run = actions.add_parser('run', help="Dispatch due audits to the job queue until stopped")
+    run.add_argument('--workers', type=int, default=JOB_WORKERS, help="Local job workers to start, 0 for external workers")
+    schedule.set_defaults(func=schedule_command)
+
+    worker = subparsers.add_parser('worker', help="Process queued analysis jobs")
+    worker.set_defaults(func=worker_command)
+
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
+    args = build_parser().parse_args()
+    try:
+        args.func(args)
+    finally:
+        registry.flush(force=True)
@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import logging
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from seo.analyzer import analyze_seo
+from seo.content import analyze_content
+from seo.duplicates import fingerprint_page, record_fingerprints
+from seo.fetcher import fetch_document
+from seo.history import record_run
+from seo.utils import normalize_url, get_domain
+from seo.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.environ.get('SEO_BATCH_CONCURRENCY', '16'))
+DEFAULT_PER_HOST = int(os.environ.get('SEO_BATCH_PER_HOST', '2'))
+
+
+def read_urls(lines):
+    """
+    Yield normalized URLs from lines of text
+    Blank lines and lines starting with '#' are skipped
+    """
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield normalize_url(line)
+
+
+def analyze_document(document):
+    """
+    Run the per-page analyses on a fetched document, store its duplicate-detection
+    fingerprint and append the run to the score history, at the archive time of a replayed page
+    Runs in a worker process, so it only takes and returns picklable values
+    """
+    result = {
+        'url': document.url,
+        'basic_seo': analyze_seo(document.url, document),
+        'content_analysis': analyze_content(document.url, document),
+    }
+    if 'error' not in result['basic_seo']:
+        record_fingerprints([fingerprint_page(document.url, document)])
+    record_run(document.url, result, run_at=document.fetched_at)
+    registry.flush()
+    return result
+
+
+def iter_batch(urls, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, processes=None, skip=None):
+    """
+    Analyze many URLs and yield one result dictionary per URL as each finishes
+    Fetches run on a thread pool limited to `concurrency` requests overall and
+    `per_host` requests per host; parsing and scoring run on a process pool.
+    Pool processes are spawned, not forked, since batches also run inside the
+    multithreaded web app. URLs are read lazily, so only a bounded window is held in memory.
+    """
+    processes = processes or os.cpu_count() or 1
+    max_waiting = concurrency * 4
+    max_analyses = processes * 4
+
+    urls = iter(urls)
+    exhausted = False
+    host_active = defaultdict(int)
+    waiting = defaultdict(deque)
+    waiting_count = 0
+    fetches = {}
+    analyses = {}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as analysis_pool:
+
+        def start_fetch(url, host):
+            host_active[host] += 1
+            fetches[fetch_pool.submit(fetch_document, url)] = (url, host)
+
+        while True:
+            while (not exhausted and len(fetches) < concurrency
+                   and waiting_count < max_waiting and len(analyses) < max_analyses):
+                url = next(urls, None)
+                if url is None:
+                    exhausted = True
+                    break
+                if skip is not None and url in skip:
+                    continue
+                host = get_domain(url)
+                if host_active[host] < per_host:
+                    start_fetch(url, host)
+                else:
+                    waiting[host].append(url)
+                    waiting_count += 1
+
+            if not fetches and not analyses:
+                break
+
+            done, _ = wait(list(fetches) + list(analyses), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in fetches:
+                    url, host = fetches.pop(future)
+                    host_active[host] -= 1
+                    if waiting[host]:
+                        start_fetch(waiting[host].popleft(), host)
+                        waiting_count -= 1
+                    else:
+                        del waiting[host]
+                        if not host_active[host]:
+                            del host_active[host]
+
+                    document = future.result()
+                    if document.error is not None:
+                        yield {'url': url, 'error': str(document.error)}
+                    else:
+                        analyses[analysis_pool.submit(analyze_document, document)] = url
+                else:
+                    url = analyses.pop(future)
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        logger.error(f"Error analyzing {url} in batch: {str(e)}", exc_info=True)
+                        yield {'url': url, 'error': str(e)}
+
+
+def load_checkpoint(path):
+    """Return the set of URLs already completed by an earlier run"""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def run_batch(urls, output, checkpoint=None, **options):
+    """
+    Analyze URLs and write results to `output` as JSON lines
+    Each completed URL is appended to the checkpoint file, so an interrupted
+    run resumes where it stopped when started again with the same checkpoint
+    Returns the number of URLs analyzed in this run
+    """
+    done = load_checkpoint(checkpoint)
+    if done:
+        logger.info(f"Resuming batch, skipping {len(done)} URLs already analyzed")
+
+    return write_results(iter_batch(urls, skip=done, **options), output, checkpoint)
+
+
+def trim_partial_line(path):
+    """Drop a last line left unfinished by an interrupted run, so resumed results start on a new line"""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position < end:
+            f.truncate(position)
+
+
+def write_results(results, output, checkpoint=None):
+    """
+    Write analysis results to `output` as JSON lines, appending each URL to the checkpoint file
+    Returns the number of results written
+    """
+    checkpoint_file = open(checkpoint, 'a', encoding='utf-8') if checkpoint else None
+    count = 0
+    try:
+        for result in results:
+            output.write(json.dumps(result, separators=(',', ':')) + '\n')
+            output.flush()
+            if checkpoint_file:
+                checkpoint_file.write(result['url'] + '\n')
+                checkpoint_file.flush()
+            count += 1
+    finally:
+        if checkpoint_file:
+            checkpoint_file.close()
+    return count
+
+
+def open_url_source(path):
+    """Open a URL list file, or stdin when the path is '-' or missing"""
+    if not path or path == '-':
+        return sys.stdin
+    return open(path, encoding='utf-8')
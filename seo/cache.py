@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from seo.utils import canonicalize_url, data_path
+from seo.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(url, *parts):
+    """Build a cache key from the canonical form of a URL and optional extra parts"""
+    key = canonicalize_url(url)
+    for part in parts:
+        key += '|' + (canonicalize_url(part) if part else '')
+    return key
+
+
+def record_lookup(name, hit):
+    """Count a lookup of a named cache in the cache metrics"""
+    if name is not None:
+        CACHE_REQUESTS.inc(cache=name, result='hit' if hit else 'miss')
+
+
+class MemoryCache:
+    """
+    In-process cache with LRU eviction and per-entry TTL
+    """
+
+    def __init__(self, max_entries=256, ttl=1800, name=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                record_lookup(self.name, False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_lookup(self.name, True)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            'backend': 'memory',
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class SQLiteCache:
+    """
+    Cache stored in a SQLite file so every worker process on a host shares it
+    Entries expire after their TTL and the least recently used are evicted
+    once the cache grows past max_entries. Eviction runs every few writes
+    rather than on each one, so the file may briefly hold a few entries more
+    than max_entries. Counters are kept in the same file.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=1800, name=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        # Writes between eviction passes; each pass counts the rows of the table
+        self.evict_every = min(64, max(1, max_entries // 16))
+        self._writes = 0
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                [('hits',), ('misses',), ('evictions',)]
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, conn, name, amount=1):
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (amount, name))
+
+    def get(self, key):
+        value = self.get_entry(key)[0]
+        record_lookup(self.name, value is not None)
+        return value
+
+    def get_entry(self, key):
+        """Return the cached value and its expiry time, or (None, None) on a miss"""
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= now:
+            if row is not None:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(conn, 'misses')
+            return None, None
+        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(conn, 'hits')
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, separators=(',', ':')), expires_at, now)
+        )
+        self._writes += 1
+        if self._writes >= self.evict_every:
+            self._writes = 0
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        overflow = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                (overflow,)
+            )
+            self._count(conn, 'evictions', overflow)
+
+    def delete(self, key):
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self):
+        self._connect().execute("DELETE FROM entries")
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        counters = dict(self._connect().execute("SELECT name, value FROM counters").fetchall())
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hits': counters.get('hits', 0),
+            'misses': counters.get('misses', 0),
+            'evictions': counters.get('evictions', 0),
+        }
+
+
+class TieredCache:
+    """
+    Small per-process memory cache in front of a shared cache
+    Hits in the shared tier are promoted into the memory tier
+    """
+
+    def __init__(self, local, shared, name=None):
+        self.local = local
+        self.shared = shared
+        self.name = name
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            record_lookup(self.name, True)
+            return value
+        value, expires_at = self.shared.get_entry(key)
+        if value is not None:
+            self.local.set(key, value, ttl=expires_at - time.time())
+        record_lookup(self.name, value is not None)
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.local.set(key, value, ttl)
+        self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def clear(self):
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        return {
+            'backend': 'tiered',
+            'local': self.local.stats(),
+            'shared': self.shared.stats(),
+        }
+
+
+def create_cache(name, max_entries=None, ttl=None):
+    """
+    Build a cache from environment settings
+    SEO_CACHE_BACKEND selects 'memory', 'sqlite' or 'tiered' (the default);
+    shared tiers are stored as <name>.sqlite3 in the data directory
+    """
+    backend = os.environ.get('SEO_CACHE_BACKEND', 'tiered')
+    if ttl is None:
+        ttl = int(os.environ.get('SEO_CACHE_TTL', '1800'))
+    if max_entries is None:
+        max_entries = int(os.environ.get('SEO_CACHE_SIZE', '10000'))
+    local_entries = int(os.environ.get('SEO_CACHE_LOCAL_SIZE', '256'))
+
+    if backend == 'memory':
+        return MemoryCache(max_entries=max_entries, ttl=ttl, name=name)
+
+    if backend == 'sqlite':
+        return SQLiteCache(data_path(f"{name}.sqlite3"), max_entries=max_entries, ttl=ttl, name=name)
+    shared = SQLiteCache(data_path(f"{name}.sqlite3"), max_entries=max_entries, ttl=ttl)
+    return TieredCache(MemoryCache(max_entries=min(local_entries, max_entries), ttl=ttl), shared, name=name)
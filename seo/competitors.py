@@ -1,154 +1,267 @@
-import requests
-from bs4 import BeautifulSoup
+import os
 import logging
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait
 from seo.analyzer import analyze_seo
 from seo.content import analyze_content
 from seo.page_speed import check_page_speed
+from seo.fetcher import fetch_document
+from seo.cache import create_cache, make_cache_key
+from seo.keyword_index import KEYWORD_INDEX_ENABLED, get_index
+from seo.metrics import STAGE_ERRORS
+from seo.rules import load_ruleset
 
 logger = logging.getLogger(__name__)
 
-def compare_with_competitors(main_url, competitor_url):
+MAX_COMPETITORS = int(os.environ.get('SEO_MAX_COMPETITORS', '10'))
+COMPARE_WORKERS = int(os.environ.get('SEO_COMPARE_WORKERS', '8'))
+KEYWORD_OVERLAP_LIMIT = 20
+
+# Separate from the stage executor: comparison stages block on these futures
+_executor = ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix='seo-compare')
+_site_cache = None
+
+
+def site_cache():
+    """Cache of per-URL analyses shared by all comparisons"""
+    global _site_cache
+    if _site_cache is None:
+        _site_cache = create_cache('site_analyses')
+    return _site_cache
+
+
+def analyze_site(url, deadline=None):
+    """
+    SEO, content and speed analysis of one site, reused from the cache when available
+    Returns a dictionary with 'basic_seo', 'content_analysis' and 'speed_results'
+    """
+    cached = site_cache().get(make_cache_key(url))
+    if cached is not None:
+        return cached
+
+    document = fetch_document(url, timeout=deadline.timeout(10) if deadline else 10)
+    analysis = {
+        'basic_seo': analyze_seo(url, document),
+        # Indexed for the keyword overlap, but kept out of the index's document frequencies
+        'content_analysis': analyze_content(url, document, index=True, counted=False),
+    }
+    if 'error' not in analysis['basic_seo']:
+        speed_timeout = deadline.timeout(30) if deadline else 30
+        analysis['speed_results'] = check_page_speed(url, document, timeout=speed_timeout)
+    else:
+        analysis['speed_results'] = {'performance_score': None}
+    remember_site(url, analysis)
+    return analysis
+
+
+def remember_site(url, analysis):
+    """Cache a complete analysis of a site; results with errors are not cached"""
+    if all(analysis.get(part) and 'error' not in analysis[part]
+           for part in ('basic_seo', 'content_analysis', 'speed_results')):
+        site_cache().set(make_cache_key(url), analysis)
+
+
+def site_metrics(url, analysis, is_main=False):
+    """One column of the comparison matrix"""
+    seo = analysis.get('basic_seo', {})
+    content = analysis.get('content_analysis', {})
+    headings = seo.get('headings', {})
+    metrics = {
+        'url': url,
+        'domain': urlparse(url).netloc,
+        'is_main': is_main,
+        'seo_score': seo.get('overall_score', 0),
+        'content_score': content.get('content_score', 0),
+        'performance_score': analysis.get('speed_results', {}).get('performance_score'),
+        'word_count': content.get('word_count', 0),
+        'readability': content.get('readability', {}).get('score', 0),
+        'title_length': seo.get('title', {}).get('length', 0),
+        'meta_desc_length': seo.get('meta_description', {}).get('length', 0),
+        'h1': headings.get('h1_count', 0),
+        'h2': headings.get('h2_count', 0),
+        'h3': headings.get('h3_count', 0),
+    }
+    error = seo.get('error') or content.get('error')
+    if error:
+        metrics['error'] = error
+    return metrics
+
+
+def keyword_overlap(urls, analyses):
     """
-    Compare the main website with a competitor website
-    Returns a dictionary with comparative metrics
+    Keywords used by at least two of the sites, computed over all of them at once
+    Uses every indexed keyword of the pages when they are in the keyword index,
+    otherwise only each site's top keywords. 'densities' lists each site's
+    density in site order (None where a site lacks the keyword)
     """
+    overlap = None
+    # Sites that could not be analyzed are not indexed and take no part in the overlap
+    analyzed = [index for index, analysis in enumerate(analyses)
+                if analysis.get('content_analysis') and 'error' not in analysis['content_analysis']]
+    if KEYWORD_INDEX_ENABLED and analyzed and analyzed[0] == 0:
+        try:
+            overlap = get_index().overlap([urls[index] for index in analyzed], limit=KEYWORD_OVERLAP_LIMIT)
+        except Exception as e:
+            logger.error(f"Error querying the keyword index: {str(e)}", exc_info=True)
+        for kw in overlap or []:
+            for field in ('densities', 'tfidf'):
+                values = [None] * len(urls)
+                for position, index in enumerate(analyzed):
+                    values[index] = kw[field][position]
+                kw[field] = values
+
+    if overlap is None:
+        densities = {}
+        for index, analysis in enumerate(analyses):
+            for kw in analysis.get('content_analysis', {}).get('top_keywords', []):
+                densities.setdefault(kw['word'], [None] * len(analyses))[index] = kw['density']
+        overlap = [
+            {'keyword': keyword, 'densities': values, 'site_count': sum(1 for value in values if value is not None)}
+            for keyword, values in densities.items()
+        ]
+        overlap = [kw for kw in overlap if kw['site_count'] >= 2]
+        overlap.sort(key=lambda kw: (kw['site_count'], max(value or 0 for value in kw['densities'][1:])),
+                     reverse=True)
+        overlap = overlap[:KEYWORD_OVERLAP_LIMIT]
+
+    for kw in overlap:
+        competitor_values = [value for value in kw['densities'][1:] if value is not None]
+        kw['main_density'] = kw['densities'][0]
+        kw['best_competitor_density'] = max(competitor_values) if competitor_values else None
+    return overlap
+
+
+def _ahead_of(main, competitors, metric):
+    """Competitors with a higher value of a metric than the main site, best first"""
+    ahead = [site for site in competitors
+             if site[metric] is not None and site[metric] > (main[metric] or 0)]
+    return sorted(ahead, key=lambda site: site[metric], reverse=True)
+
+
+def _insight(what, main, ahead, total, metric, unit=''):
+    best = ahead[0]
+    values = f"({best[metric]}{unit} vs {main[metric]}{unit})"
+    if total == 1:
+        return f"Competitor has {what} {values}"
+    return f"{len(ahead)} of {total} competitors have {what}, led by {best['domain']} {values}"
+
+
+def comparison_insights(sites, overlap, ruleset=None):
+    """
+    Insights and recommendations for the main site (sites[0]) against all competitors
+    Length limits and keyword thresholds come from the ruleset's 'comparison' settings
+    """
+    rules = (ruleset or load_ruleset())['comparison']
+    main = sites[0]
+    competitors = [site for site in sites[1:] if 'error' not in site]
+    insights = []
+    recommendations = []
+    if not competitors:
+        return insights, recommendations
+
+    ahead = _ahead_of(main, competitors, 'seo_score')
+    if ahead:
+        insights.append(_insight("a better overall SEO score", main, ahead, len(competitors), 'seo_score'))
+
+    ahead = _ahead_of(main, competitors, 'word_count')
+    if ahead:
+        insights.append(_insight("more content", main, ahead, len(competitors), 'word_count', ' words'))
+        recommendations.append(f"Increase content length to match or exceed competitor's {ahead[0]['word_count']} words")
+
+    if main['performance_score'] is not None:
+        ahead = _ahead_of(main, competitors, 'performance_score')
+        if ahead:
+            insights.append(_insight("a better page performance score", main, ahead, len(competitors),
+                                     'performance_score'))
+
+    stronger = [kw for kw in overlap
+                if kw['best_competitor_density'] is not None
+                and kw['best_competitor_density'] > (kw['main_density'] or 0)]
+    if overlap and len(stronger) > len(overlap) * rules['stronger_keyword_share']:
+        insights.append(f"Competitors use {len(stronger)} common keywords more effectively")
+
+    title_lengths = [site['title_length'] for site in competitors if site['title_length'] <= rules['max_title_length']]
+    if title_lengths and main['title_length'] < max(title_lengths):
+        recommendations.append("Optimize title tag length to match competitor's more descriptive title")
+
+    meta_lengths = [site['meta_desc_length'] for site in competitors if site['meta_desc_length'] <= rules['max_meta_desc_length']]
+    if meta_lengths and main['meta_desc_length'] < max(meta_lengths):
+        recommendations.append("Improve meta description to match competitor's more detailed description")
+
+    if stronger:
+        potential_keywords = [kw['keyword'] for kw in stronger[:rules['suggested_keywords']]]
+        recommendations.append(f"Consider optimizing for these competitor keywords: {', '.join(potential_keywords)}")
+
+    return insights, recommendations
+
+
+def compare_with_competitors(main_url, competitor_urls, main_results=None, deadline=None):
+    """
+    Compare the main website with one or more competitor websites
+    Every site is analyzed once, in parallel, and per-URL analyses are reused
+    from the cache; main_results (a dictionary with the main page's
+    'basic_seo', 'content_analysis' and 'speed_results', or a callable
+    returning one) avoids analyzing the main page again. Network timeouts
+    are capped by the deadline when one is given
+    Returns a dictionary with a comparison matrix over all sites
+    """
+    if isinstance(competitor_urls, str):
+        competitor_urls = [competitor_urls]
+    competitor_urls = list(competitor_urls)[:MAX_COMPETITORS]
     try:
-        main_seo = analyze_seo(main_url)
-        competitor_seo = analyze_seo(competitor_url)
-        
-        main_content = analyze_content(main_url)
-        competitor_content = analyze_content(competitor_url)
-        
-        if 'error' not in main_seo and 'error' not in competitor_seo:
-            main_speed = check_page_speed(main_url)
-            competitor_speed = check_page_speed(competitor_url)
+        futures = [_executor.submit(analyze_site, url, deadline) for url in competitor_urls]
+        if main_results is None:
+            main_analysis = analyze_site(main_url, deadline)
         else:
-            main_speed = {'performance_score': None}
-            competitor_speed = {'performance_score': None}
-        
-        main_domain = urlparse(main_url).netloc
-        competitor_domain = urlparse(competitor_url).netloc
-        
-        comparison = {
+            main_analysis = main_results() if callable(main_results) else main_results
+            remember_site(main_url, main_analysis)
+
+        done, _ = wait(futures, timeout=deadline.remaining() if deadline else None)
+        analyses = [main_analysis]
+        for url, future in zip(competitor_urls, futures):
+            if future not in done:
+                future.cancel()
+                analyses.append({'basic_seo': {'error': "Timed out"}})
+                continue
+            try:
+                analyses.append(future.result())
+            except Exception as e:
+                logger.error(f"Error analyzing competitor {url}: {str(e)}", exc_info=True)
+                analyses.append({'basic_seo': {'error': str(e)}})
+
+        urls = [main_url] + competitor_urls
+        sites = [site_metrics(url, analysis, is_main=index == 0)
+                 for index, (url, analysis) in enumerate(zip(urls, analyses))]
+        overlap = keyword_overlap(urls, analyses)
+        insights, recommendations = comparison_insights(sites, overlap)
+
+        return {
             'domains': {
-                'main': main_domain,
-                'competitor': competitor_domain
-            },
-            'seo_scores': {
-                'main': main_seo.get('overall_score', 0),
-                'competitor': competitor_seo.get('overall_score', 0)
-            },
-            'content_scores': {
-                'main': main_content.get('content_score', 0),
-                'competitor': competitor_content.get('content_score', 0)
+                'main': sites[0]['domain'],
+                'competitors': [site['domain'] for site in sites[1:]]
             },
-            'performance_scores': {
-                'main': main_speed.get('performance_score', 0),
-                'competitor': competitor_speed.get('performance_score', 0)
-            },
-            'word_counts': {
-                'main': main_content.get('word_count', 0),
-                'competitor': competitor_content.get('word_count', 0)
-            },
-            'readability': {
-                'main': main_content.get('readability', {}).get('score', 0),
-                'competitor': competitor_content.get('readability', {}).get('score', 0)
-            },
-            'title_length': {
-                'main': main_seo.get('title', {}).get('length', 0),
-                'competitor': competitor_seo.get('title', {}).get('length', 0)
-            },
-            'meta_desc_length': {
-                'main': main_seo.get('meta_description', {}).get('length', 0),
-                'competitor': competitor_seo.get('meta_description', {}).get('length', 0)
-            },
-            'headings': {
-                'main': {
-                    'h1': main_seo.get('headings', {}).get('h1_count', 0),
-                    'h2': main_seo.get('headings', {}).get('h2_count', 0),
-                    'h3': main_seo.get('headings', {}).get('h3_count', 0)
-                },
-                'competitor': {
-                    'h1': competitor_seo.get('headings', {}).get('h1_count', 0),
-                    'h2': competitor_seo.get('headings', {}).get('h2_count', 0),
-                    'h3': competitor_seo.get('headings', {}).get('h3_count', 0)
-                }
-            },
-            'keyword_overlap': []
+            'sites': sites,
+            'keyword_overlap': overlap,
+            'insights': insights,
+            'recommendations': recommendations
         }
-        
-        main_keywords = {kw['word']: kw['density'] for kw in main_content.get('top_keywords', [])}
-        competitor_keywords = {kw['word']: kw['density'] for kw in competitor_content.get('top_keywords', [])}
-        
-        common_keywords = set(main_keywords.keys()) & set(competitor_keywords.keys())
-        
-        for keyword in common_keywords:
-            comparison['keyword_overlap'].append({
-                'keyword': keyword,
-                'main_density': main_keywords[keyword],
-                'competitor_density': competitor_keywords[keyword]
-            })
-        
-        comparison['keyword_overlap'].sort(key=lambda x: x['competitor_density'], reverse=True)
-        
-        insights = []
-        
-        if comparison['seo_scores']['main'] < comparison['seo_scores']['competitor']:
-            insights.append(f"Competitor has a better overall SEO score ({comparison['seo_scores']['competitor']} vs {comparison['seo_scores']['main']})")
-        
-        main_wc = comparison['word_counts']['main']
-        competitor_wc = comparison['word_counts']['competitor']
-        
-        if main_wc < competitor_wc:
-            insights.append(f"Competitor has more content ({competitor_wc} words vs {main_wc} words)")
-        
-        if (comparison['performance_scores']['main'] is not None and 
-            comparison['performance_scores']['competitor'] is not None and
-            comparison['performance_scores']['main'] < comparison['performance_scores']['competitor']):
-            insights.append(f"Competitor has better page performance score ({comparison['performance_scores']['competitor']} vs {comparison['performance_scores']['main']})")
-        
-        if comparison['keyword_overlap']:
-            better_kw_count = 0
-            for kw in comparison['keyword_overlap']:
-                if kw['competitor_density'] > kw['main_density']:
-                    better_kw_count += 1
-            
-            if better_kw_count > len(comparison['keyword_overlap']) / 2:
-                insights.append(f"Competitor uses {better_kw_count} common keywords more effectively")
-        
-        recommendations = []
-        
-        if main_wc < competitor_wc:
-            recommendations.append(f"Increase content length to match or exceed competitor's {competitor_wc} words")
-        
-        if (comparison['title_length']['main'] < comparison['title_length']['competitor'] and 
-            comparison['title_length']['competitor'] <= 60):
-            recommendations.append("Optimize title tag length to match competitor's more descriptive title")
-        
-        if (comparison['meta_desc_length']['main'] < comparison['meta_desc_length']['competitor'] and 
-            comparison['meta_desc_length']['competitor'] <= 160):
-            recommendations.append("Improve meta description to match competitor's more detailed description")
-        
-        if comparison['keyword_overlap']:
-            potential_keywords = [kw['keyword'] for kw in comparison['keyword_overlap'] 
-                                 if kw['competitor_density'] > kw['main_density']]
-            if potential_keywords:
-                recommendations.append(f"Consider optimizing for these competitor keywords: {', '.join(potential_keywords[:3])}")
-        
-        comparison['insights'] = insights
-        comparison['recommendations'] = recommendations
-        
-        return comparison
-        
+
     except Exception as e:
         logger.error(f"Error comparing websites: {str(e)}", exc_info=True)
-        return {
-            'error': str(e),
-            'domains': {
-                'main': urlparse(main_url).netloc,
-                'competitor': urlparse(competitor_url).netloc
-            },
-            'insights': ["Could not complete competitor analysis due to error"],
-            'recommendations': ["Fix website access issues to enable competitor analysis"]
-        }
+        STAGE_ERRORS.inc(stage='competitor_analysis')
+        return comparison_error_result(main_url, competitor_urls, str(e))
+
+
+def comparison_error_result(main_url, competitor_urls, error):
+    """Result returned by compare_with_competitors when the comparison failed"""
+    if isinstance(competitor_urls, str):
+        competitor_urls = [competitor_urls]
+    return {
+        'error': error,
+        'domains': {
+            'main': urlparse(main_url).netloc,
+            'competitors': [urlparse(url).netloc for url in competitor_urls]
+        },
+        'insights': ["Could not complete competitor analysis due to error"],
+        'recommendations': ["Fix website access issues to enable competitor analysis"]
+    }
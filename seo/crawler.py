@@ -0,0 +1,270 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from collections import Counter
+from urllib.parse import urlparse, urldefrag
+from urllib.robotparser import RobotFileParser
+
+from seo.analyzer import analyze_seo
+from seo.content import analyze_content
+from seo.duplicates import fingerprint_page, find_duplicates, record_fingerprints
+from seo.fetcher import fetch_document
+from seo.history import record_run
+from seo.http_client import USER_AGENT
+from seo.utils import normalize_url, make_absolute_url, canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PAGES = int(os.environ.get('SEO_CRAWL_MAX_PAGES', '100'))
+DEFAULT_MAX_DEPTH = int(os.environ.get('SEO_CRAWL_MAX_DEPTH', '3'))
+DEFAULT_CONCURRENCY = int(os.environ.get('SEO_CRAWL_CONCURRENCY', '8'))
+DEFAULT_PER_HOST = int(os.environ.get('SEO_CRAWL_PER_HOST', '2'))
+
+
+class VisitedSet:
+    """
+    Set of URLs already seen, keyed by their canonical form
+    Only an 8-byte digest of each URL is kept, so large crawls stay compact
+    """
+
+    def __init__(self):
+        self._digests = set()
+
+    @staticmethod
+    def _digest(url):
+        return hashlib.blake2b(canonicalize_url(url).encode('utf-8'), digest_size=8).digest()
+
+    def add(self, url):
+        """Add a URL and return True if it had not been seen before"""
+        digest = self._digest(url)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def __contains__(self, url):
+        return self._digest(url) in self._digests
+
+    def __len__(self):
+        return len(self._digests)
+
+
+class HostPolicy:
+    """
+    Politeness state for one host: robots.txt rules, a concurrency limit
+    and the crawl delay between consecutive requests
+    """
+
+    def __init__(self, robots, per_host):
+        self.robots = robots
+        self.semaphore = asyncio.Semaphore(per_host)
+        self.delay = (robots.crawl_delay(USER_AGENT) or 0) if robots else 0
+        self.next_request = 0.0
+
+    def allowed(self, url):
+        if self.robots is None:
+            return True
+        return self.robots.can_fetch(USER_AGENT, url)
+
+    async def wait_turn(self):
+        if self.delay:
+            now = time.monotonic()
+            wait = self.next_request - now
+            self.next_request = max(now, self.next_request) + self.delay
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+
+def load_robots(url):
+    """
+    Fetch and parse robots.txt for the host of a URL
+    As in RFC 9309 and RobotFileParser.read, a 401 or 403 disallows the whole
+    host and any other 4xx allows it (None). A 5xx or a network error also
+    disallows it, since the rules could not be read
+    """
+    parsed = urlparse(url)
+    robots_url = f"{parsed.scheme}://{parsed.netloc}/robots.txt"
+    document = fetch_document(robots_url)
+    robots = RobotFileParser(robots_url)
+    if document.error is not None:
+        status = document.status_code
+        if status is not None and 400 <= status < 500 and status not in (401, 403):
+            return None
+        logger.warning(f"robots.txt of {parsed.netloc} is unavailable ({status or document.error}); not crawling the host")
+        robots.disallow_all = True
+        return robots
+    robots.parse(document.text.splitlines())
+    return robots
+
+
+def page_links(document, host):
+    """Absolute, fragment-free internal links of a page that stay on the host"""
+    links = []
+    for href in document.signals()['internal_links']:
+        absolute, _ = urldefrag(make_absolute_url(document.final_url, href))
+        parsed = urlparse(absolute)
+        if parsed.scheme in ('http', 'https') and parsed.netloc == host:
+            links.append(absolute)
+    return links
+
+
+def analyze_page(url, depth, document=None):
+    """
+    Fetch and analyze one crawled page, or analyze an already fetched document
+    The report entry is keyed by the page's final URL after redirects, and
+    the page's scores are appended to the score history
+    Returns its report entry, the document and its duplicate-detection fingerprint
+    """
+    if document is None:
+        document = fetch_document(url)
+    url = document.final_url
+    entry = {'url': url, 'depth': depth, 'status_code': document.status_code}
+    if document.error is not None:
+        entry['error'] = str(document.error)
+        return entry, document, None
+
+    basic_seo = analyze_seo(url, document)
+    content = analyze_content(url, document)
+    record_run(url, {'basic_seo': basic_seo, 'content_analysis': content})
+    entry.update({
+        'title': basic_seo.get('title', {}).get('content'),
+        'title_length': basic_seo.get('title', {}).get('length', 0),
+        'meta_description_length': basic_seo.get('meta_description', {}).get('length', 0),
+        'h1_count': basic_seo.get('headings', {}).get('h1_count', 0),
+        'images_missing_alt': basic_seo.get('images', {}).get('missing_alt_count', 0),
+        'overall_score': basic_seo.get('overall_score', 0),
+        'content_score': content.get('content_score', 0),
+        'word_count': content.get('word_count', 0),
+        'recommendations': basic_seo.get('recommendations', []) + content.get('recommendations', []),
+    })
+    return entry, document, fingerprint_page(url, document)
+
+
+async def _crawl(seed_url, max_depth, max_pages, concurrency, per_host, respect_robots):
+    # The seed goes through its own host's robots.txt and politeness before it is fetched
+    robots = await asyncio.to_thread(load_robots, seed_url) if respect_robots else None
+    policy = HostPolicy(robots, per_host)
+    if not policy.allowed(seed_url):
+        return [], 1, []
+    async with policy.semaphore:
+        await policy.wait_turn()
+        seed_document = await asyncio.to_thread(fetch_document, seed_url)
+
+    # The seed may redirect to another host (example.com -> www.example.com); crawl the host it lands on
+    host = urlparse(seed_document.final_url).netloc
+    if host != urlparse(seed_url).netloc:
+        robots = await asyncio.to_thread(load_robots, seed_document.final_url) if respect_robots else None
+        policy = HostPolicy(robots, per_host)
+
+    visited = VisitedSet()
+    reported = VisitedSet()
+    frontier = asyncio.Queue()
+    pages = []
+    fingerprints = []
+    skipped_by_robots = 0
+
+    visited.add(seed_url)
+    visited.add(seed_document.final_url)
+    await frontier.put((seed_url, 0))
+
+    async def worker():
+        nonlocal skipped_by_robots
+        while True:
+            url, depth = await frontier.get()
+            try:
+                if len(reported) >= max_pages:
+                    continue
+                document = seed_document if url == seed_url else None
+                if not policy.allowed(document.final_url if document else url):
+                    skipped_by_robots += 1
+                    continue
+                async with policy.semaphore:
+                    await policy.wait_turn()
+                    entry, document, fingerprint = await asyncio.to_thread(analyze_page, url, depth, document)
+                # A link that redirects to a page already crawled is the same page, not a duplicate of it
+                visited.add(document.final_url)
+                if len(reported) >= max_pages or not reported.add(document.final_url):
+                    continue
+                pages.append(entry)
+                if fingerprint is not None:
+                    fingerprints.append(fingerprint)
+                if document.error is None and depth < max_depth:
+                    for link in page_links(document, host):
+                        # Redirect aliases in visited do not count towards the limit, only crawled and queued pages
+                        if len(reported) + frontier.qsize() >= max_pages:
+                            break
+                        if visited.add(link):
+                            await frontier.put((link, depth + 1))
+            except Exception as e:
+                logger.error(f"Error crawling {url}: {str(e)}", exc_info=True)
+                pages.append({'url': url, 'depth': depth, 'error': str(e)})
+            finally:
+                frontier.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await frontier.join()
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+    return pages, skipped_by_robots, fingerprints
+
+
+def build_site_report(seed_url, pages, skipped_by_robots=0, duplicates=None):
+    """Summarize per-page crawl entries and duplicate clusters into a site-wide report"""
+    analyzed = [page for page in pages if 'error' not in page]
+    errors = [page for page in pages if 'error' in page]
+
+    def average(key):
+        if not analyzed:
+            return 0
+        return round(sum(page.get(key) or 0 for page in analyzed) / len(analyzed), 1)
+
+    if duplicates is None:
+        duplicates = {'duplicate_titles': [], 'duplicate_descriptions': [], 'near_duplicates': []}
+
+    issue_counts = Counter()
+    for page in analyzed:
+        issue_counts.update(set(page.get('recommendations', [])))
+
+    return {
+        'seed_url': seed_url,
+        'pages_crawled': len(pages),
+        'pages_analyzed': len(analyzed),
+        'pages_with_errors': len(errors),
+        'skipped_by_robots': skipped_by_robots,
+        'summary': {
+            'average_seo_score': average('overall_score'),
+            'average_content_score': average('content_score'),
+            'average_word_count': average('word_count'),
+            'missing_titles': len([p for p in analyzed if not p.get('title')]),
+            'missing_meta_descriptions': len([p for p in analyzed if not p.get('meta_description_length')]),
+            'missing_h1': len([p for p in analyzed if not p.get('h1_count')]),
+            'images_missing_alt': sum(p.get('images_missing_alt', 0) for p in analyzed),
+            'duplicate_titles': sum(len(group['urls']) for group in duplicates['duplicate_titles']),
+            'duplicate_meta_descriptions': sum(len(group['urls']) for group in duplicates['duplicate_descriptions']),
+            'near_duplicate_pages': sum(len(cluster['urls']) for cluster in duplicates['near_duplicates']),
+        },
+        'duplicates': duplicates,
+        'common_issues': [{'issue': issue, 'pages': count} for issue, count in issue_counts.most_common(10)],
+        'pages': sorted(pages, key=lambda page: (page['depth'], page['url'])),
+    }
+
+
+def crawl_site(seed_url, max_depth=DEFAULT_MAX_DEPTH, max_pages=DEFAULT_MAX_PAGES,
+               concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST, respect_robots=True):
+    """
+    Crawl a site from a seed URL following internal links
+    Stops at max_depth link hops or after max_pages pages, honours robots.txt
+    and limits concurrent requests to the host. Pages with duplicate titles,
+    meta descriptions or near-duplicate text are grouped in the report, and
+    their fingerprints are stored for later duplicate queries
+    Returns a site-wide report dictionary
+    """
+    seed_url = normalize_url(seed_url)
+    pages, skipped, fingerprints = asyncio.run(
+        _crawl(seed_url, max_depth, max_pages, concurrency, per_host, respect_robots))
+    record_fingerprints(fingerprints)
+    return build_site_report(seed_url, pages, skipped, find_duplicates(fingerprints))
@@ -0,0 +1,255 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from seo.utils import canonicalize_url, data_path
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+SIGNATURE_SIZE = 128
+LSH_BANDS = 16
+NEAR_DUPLICATE_THRESHOLD = float(os.environ.get('SEO_NEAR_DUPLICATE_THRESHOLD', '0.8'))
+
+WORD_PATTERN = re.compile(r'\w+')
+_BIN_BITS = SIGNATURE_SIZE.bit_length() - 1
+_VALUE_BITS = 24
+_EMPTY = 0xFFFFFFFF
+
+
+def text_hash(text):
+    """8-byte hex digest of a title or description, ignoring case and whitespace; None when empty"""
+    normalized = ' '.join((text or '').lower().split())
+    if not normalized:
+        return None
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def shingle_hashes(text, size=SHINGLE_SIZE):
+    """Distinct 64-bit hashes of the overlapping word shingles of a text"""
+    words = WORD_PATTERN.findall(text.lower())
+    return {
+        int.from_bytes(hashlib.blake2b(' '.join(words[i:i + size]).encode('utf-8'), digest_size=8).digest(), 'little')
+        for i in range(len(words) - size + 1)
+    }
+
+
+def minhash(text):
+    """
+    MinHash signature of a text's word shingles as an array of SIGNATURE_SIZE integers
+    Uses one-permutation hashing: each shingle hash is computed once and its
+    low bits pick the signature slot that keeps the minimum, so the cost is
+    linear in the text length. Empty slots borrow the next filled slot's
+    value, offset by the distance (rotation densification), so short texts
+    still compare correctly. Returns None for texts shorter than one shingle
+    """
+    hashes = shingle_hashes(text)
+    if not hashes:
+        return None
+    slots = [_EMPTY] * SIGNATURE_SIZE
+    value_mask = (1 << _VALUE_BITS) - 1
+    for value in hashes:
+        slot = value & (SIGNATURE_SIZE - 1)
+        value = (value >> _BIN_BITS) & value_mask
+        if value < slots[slot]:
+            slots[slot] = value
+    if _EMPTY in slots:
+        filled = list(slots)
+        for slot in range(SIGNATURE_SIZE):
+            if filled[slot] != _EMPTY:
+                continue
+            distance = 1
+            while filled[(slot + distance) % SIGNATURE_SIZE] == _EMPTY:
+                distance += 1
+            slots[slot] = filled[(slot + distance) % SIGNATURE_SIZE] | (distance << _VALUE_BITS)
+    return array('I', slots)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+def fingerprint_page(url, document):
+    """Title and description hashes and the MinHash signature of a fetched page's text"""
+    signals = document.signals()
+    text = document.extracted_text or signals['text'] or ''
+    return {
+        'url': url,
+        'title': signals['title'],
+        'description': signals['meta_description'],
+        'title_hash': text_hash(signals['title']),
+        'description_hash': text_hash(signals['meta_description']),
+        'signature': minhash(text),
+    }
+
+
+class DisjointSet:
+    """Union-find over hashable items with path halving"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent
+        parent.setdefault(item, item)
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, first, second):
+        self.parent[self.find(first)] = self.find(second)
+
+    def groups(self):
+        groups = defaultdict(list)
+        for item in self.parent:
+            groups[self.find(item)].append(item)
+        return [members for members in groups.values() if len(members) > 1]
+
+
+def _exact_groups(fingerprints, key, label):
+    groups = defaultdict(list)
+    for fingerprint in fingerprints:
+        if fingerprint.get(key):
+            groups[fingerprint[key]].append(fingerprint)
+    return [
+        {label: members[0][label], 'urls': sorted(member['url'] for member in members)}
+        for members in groups.values() if len(members) > 1
+    ]
+
+
+def find_duplicates(fingerprints, threshold=NEAR_DUPLICATE_THRESHOLD, bands=LSH_BANDS):
+    """
+    Duplicate titles, duplicate meta descriptions and clusters of near-duplicate text
+    Titles and descriptions are grouped by hash. Signatures are split into
+    bands; pages sharing a band bucket are candidates, and each candidate is
+    checked against the first page of its bucket only, so the work grows
+    about linearly with the number of pages. Verified pairs are merged into
+    clusters with union-find.
+    """
+    fingerprints = list(fingerprints)
+    rows = SIGNATURE_SIZE // bands
+    by_url = {}
+    buckets = defaultdict(list)
+    for fingerprint in fingerprints:
+        signature = fingerprint.get('signature')
+        if signature is None:
+            continue
+        by_url[fingerprint['url']] = signature
+        for band in range(bands):
+            buckets[(band, tuple(signature[band * rows:(band + 1) * rows]))].append(fingerprint['url'])
+
+    clusters = DisjointSet()
+    lowest = {}
+    for urls in buckets.values():
+        anchor = urls[0]
+        for url in urls[1:]:
+            if clusters.find(url) == clusters.find(anchor):
+                continue
+            score = similarity(by_url[anchor], by_url[url])
+            if score >= threshold:
+                clusters.union(url, anchor)
+                lowest[url] = min(lowest.get(url, 1.0), score)
+                lowest[anchor] = min(lowest.get(anchor, 1.0), score)
+
+    near_duplicates = [
+        {'urls': sorted(members), 'similarity': round(min(lowest[url] for url in members), 2)}
+        for members in clusters.groups()
+    ]
+    near_duplicates.sort(key=lambda cluster: len(cluster['urls']), reverse=True)
+
+    return {
+        'duplicate_titles': _exact_groups(fingerprints, 'title_hash', 'title'),
+        'duplicate_descriptions': _exact_groups(fingerprints, 'description_hash', 'description'),
+        'near_duplicates': near_duplicates,
+    }
+
+
+class FingerprintStore:
+    """
+    Fingerprints of analyzed pages stored in SQLite, indexed by site and by
+    title and description hash, so duplicates can be found across crawls and batches
+    """
+
+    def __init__(self, path=None):
+        self.path = path or data_path('fingerprints.sqlite3')
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "url TEXT PRIMARY KEY, site TEXT NOT NULL, title TEXT, description TEXT, "
+            "title_hash TEXT, description_hash TEXT, signature BLOB, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_site ON fingerprints (site)")
+        conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_title ON fingerprints (site, title_hash)")
+        conn.execute("CREATE INDEX IF NOT EXISTS fingerprints_description ON fingerprints (site, description_hash)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add_many(self, fingerprints):
+        """Store or replace the fingerprints of pages"""
+        now = time.time()
+        rows = [
+            (canonicalize_url(fp['url']), urlparse(fp['url']).netloc, fp['title'], fp['description'],
+             fp['title_hash'], fp['description_hash'],
+             fp['signature'].tobytes() if fp['signature'] is not None else None, now)
+            for fp in fingerprints
+        ]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def fingerprints(self, site):
+        """Stored fingerprints of a site's pages"""
+        rows = self._connect().execute(
+            "SELECT url, title, description, title_hash, description_hash, signature "
+            "FROM fingerprints WHERE site = ?", (site,))
+        for url, title, description, title_hash, description_hash, blob in rows:
+            signature = None
+            if blob is not None:
+                signature = array('I')
+                signature.frombytes(blob)
+            yield {'url': url, 'title': title, 'description': description, 'title_hash': title_hash,
+                   'description_hash': description_hash, 'signature': signature}
+
+    def duplicates(self, site, threshold=NEAR_DUPLICATE_THRESHOLD):
+        """Duplicate clusters among all stored pages of a site"""
+        return find_duplicates(self.fingerprints(site), threshold)
+
+
+_stores = {}
+
+
+def get_store():
+    """Fingerprint store of the current process"""
+    store = _stores.get(os.getpid())
+    if store is None:
+        store = _stores[os.getpid()] = FingerprintStore()
+    return store
+
+
+def record_fingerprints(fingerprints):
+    """Store page fingerprints; errors are logged, not raised"""
+    try:
+        get_store().add_many(fingerprints)
+    except Exception as e:
+        logger.error(f"Error storing page fingerprints: {str(e)}", exc_info=True)
@@ -0,0 +1,203 @@
+import os
+import logging
+from html.parser import HTMLParser
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+NON_CONTENT_TAGS = {'script', 'style', 'nav', 'footer', 'header'}
+
+HTML_PARSER = os.environ.get('SEO_HTML_PARSER', 'stream')
+MAX_LINKS = int(os.environ.get('SEO_MAX_LINKS', '5000'))
+MAX_TEXT_CHARS = int(os.environ.get('SEO_MAX_TEXT_CHARS', '5000000'))
+
+
+def empty_signals():
+    """Signal dictionary with nothing found yet"""
+    return {
+        'title': None,
+        'meta_description': None,
+        'h1_content': [],
+        'h2_count': 0,
+        'h3_count': 0,
+        'canonical': None,
+        'has_viewport': False,
+        'has_robots_meta': False,
+        'image_count': 0,
+        'images_missing_alt': 0,
+        'internal_links': [],
+        'external_links': [],
+        'internal_link_count': 0,
+        'external_link_count': 0,
+        'text': '',
+    }
+
+
+def classify_link(href, base_domain):
+    """Return 'internal', 'external' or None for a link href found on a page"""
+    if href.startswith('#') or not href:
+        return None
+    if href.startswith('/') or base_domain in href:
+        return 'internal'
+    if href.startswith(('http://', 'https://')):
+        return 'external'
+    return None
+
+
+class SignalExtractor(HTMLParser):
+    """
+    Event-driven extractor that collects on-page SEO signals in one pass
+    No document tree is built; only the signals themselves are kept, with
+    link lists and visible text capped so memory stays bounded
+    """
+
+    def __init__(self, base_url, max_links=MAX_LINKS, max_text_chars=MAX_TEXT_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.base_domain = urlparse(base_url).netloc
+        self.max_links = max_links
+        self.max_text_chars = max_text_chars
+        self.signals = empty_signals()
+
+        self._title_parts = None
+        self._title_done = False
+        self._open_h1 = []
+        self._skip_depth = 0
+        self._text_parts = []
+        self._text_chars = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        signals = self.signals
+
+        if tag == 'title':
+            if not self._title_done and self._title_parts is None:
+                self._title_parts = []
+        elif tag == 'meta':
+            name = attrs.get('name')
+            if name == 'description':
+                if signals['meta_description'] is None:
+                    signals['meta_description'] = attrs.get('content') or ''
+            elif name == 'viewport':
+                signals['has_viewport'] = True
+            elif name == 'robots':
+                signals['has_robots_meta'] = True
+        elif tag == 'link':
+            rel = attrs.get('rel') or ''
+            if signals['canonical'] is None and 'canonical' in rel.split():
+                signals['canonical'] = attrs.get('href') or ''
+        elif tag == 'h1':
+            self._open_h1.append([])
+        elif tag == 'h2':
+            signals['h2_count'] += 1
+        elif tag == 'h3':
+            signals['h3_count'] += 1
+        elif tag == 'img':
+            signals['image_count'] += 1
+            if not attrs.get('alt'):
+                signals['images_missing_alt'] += 1
+        elif tag == 'a' and 'href' in attrs:
+            href = attrs['href'] or ''
+            kind = classify_link(href, self.base_domain)
+            if kind is not None:
+                signals[f'{kind}_link_count'] += 1
+                links = signals[f'{kind}_links']
+                if len(links) < self.max_links:
+                    links.append(href)
+
+        if tag in NON_CONTENT_TAGS:
+            self._skip_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in NON_CONTENT_TAGS:
+            self._skip_depth -= 1
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._title_parts is not None:
+            self.signals['title'] = ''.join(self._title_parts).strip()
+            self._title_parts = None
+            self._title_done = True
+        elif tag == 'h1' and self._open_h1:
+            parts = self._open_h1.pop()
+            self.signals['h1_content'].append(''.join(parts).strip())
+        elif tag in NON_CONTENT_TAGS and self._skip_depth > 0:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+        for parts in self._open_h1:
+            parts.append(data)
+        if self._skip_depth == 0 and self._text_chars < self.max_text_chars:
+            stripped = data.strip()
+            if stripped:
+                self._text_parts.append(stripped)
+                self._text_chars += len(stripped) + 1
+
+    def close(self):
+        super().close()
+        if self._title_parts is not None:
+            self.signals['title'] = ''.join(self._title_parts).strip()
+            self._title_parts = None
+        while self._open_h1:
+            self.signals['h1_content'].append(''.join(self._open_h1.pop(0)).strip())
+        self.signals['text'] = ' '.join(self._text_parts)
+        self._text_parts = []
+        return self.signals
+
+
+def extract_signals(html, base_url, chunk_size=65536):
+    """
+    Collect on-page SEO signals from HTML in a single streaming pass
+    Accepts the markup as a string or as an iterable of string chunks
+    """
+    extractor = SignalExtractor(base_url)
+    if isinstance(html, str):
+        for start in range(0, len(html), chunk_size):
+            extractor.feed(html[start:start + chunk_size])
+    else:
+        for chunk in html:
+            extractor.feed(chunk)
+    return extractor.close()
+
+
+def extract_signals_bs4(soup, base_url, visible_text=''):
+    """
+    Reference implementation of extract_signals on a BeautifulSoup tree
+    Kept to validate the streaming extractor against
+    """
+    signals = empty_signals()
+    base_domain = urlparse(base_url).netloc
+
+    if soup.title:
+        signals['title'] = soup.title.get_text().strip()
+
+    meta_description_tag = soup.find('meta', attrs={'name': 'description'})
+    if meta_description_tag:
+        signals['meta_description'] = meta_description_tag.get('content', '')
+
+    signals['h1_content'] = [h.get_text().strip() for h in soup.find_all('h1')]
+    signals['h2_count'] = len(soup.find_all('h2'))
+    signals['h3_count'] = len(soup.find_all('h3'))
+
+    canonical_tag = soup.find('link', attrs={'rel': 'canonical'})
+    if canonical_tag:
+        signals['canonical'] = canonical_tag.get('href', '')
+
+    signals['has_viewport'] = bool(soup.find('meta', attrs={'name': 'viewport'}))
+    signals['has_robots_meta'] = bool(soup.find('meta', attrs={'name': 'robots'}))
+
+    images = soup.find_all('img')
+    signals['image_count'] = len(images)
+    signals['images_missing_alt'] = len([img for img in images if not img.get('alt')])
+
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        kind = classify_link(href, base_domain)
+        if kind is not None:
+            signals[f'{kind}_link_count'] += 1
+            if len(signals[f'{kind}_links']) < MAX_LINKS:
+                signals[f'{kind}_links'].append(href)
+
+    signals['text'] = visible_text
+    return signals
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import threading
+import requests
+from requests.structures import CaseInsensitiveDict
+from bs4 import BeautifulSoup, NavigableString, CData
+import trafilatura
+from seo.extractor import extract_signals, extract_signals_bs4, NON_CONTENT_TAGS, HTML_PARSER
+from seo.http_client import fetch, detect_encoding, MAX_BODY_BYTES
+from seo.metrics import FETCH_BYTES, FETCH_RESPONSES, STAGE_ERRORS, timed
+
+logger = logging.getLogger(__name__)
+
+
+class FetchedDocument:
+    """
+    A webpage downloaded once and shared by every analysis stage
+    Parse trees and extracted text are built lazily on first access
+    """
+
+    def __init__(self, url, final_url=None, status_code=None, headers=None, content=b'',
+                 encoding=None, error=None, truncated=False, fetched_at=None):
+        self.url = url
+        self.final_url = final_url or url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+        self.content = content
+        self.encoding = encoding
+        self.error = error
+        self.truncated = truncated
+        # Unix time of an archived response; None for a page fetched now
+        self.fetched_at = fetched_at
+
+        self._text = None
+        self._soup = None
+        self._extracted_text = None
+        self._extracted = False
+        self._signals = {}
+        self._lock = threading.RLock()
+
+    def raise_for_status(self):
+        """Re-raise the error recorded while fetching, if any"""
+        if self.error is not None:
+            raise self.error
+
+    @property
+    def not_modified(self):
+        """True when the server answered a conditional request with 304"""
+        return self.status_code == 304
+
+    @property
+    def content_hash(self):
+        """Digest of the raw body, used to detect unchanged pages"""
+        return hashlib.blake2b(self.content, digest_size=16).hexdigest()
+
+    @property
+    def text(self):
+        """Decoded body of the page"""
+        if self._text is None:
+            self._text = self.content.decode(self.encoding or 'utf-8', errors='replace')
+        return self._text
+
+    @property
+    def soup(self):
+        """BeautifulSoup tree of the page, built on first use"""
+        with self._lock:
+            if self._soup is None:
+                self._soup = BeautifulSoup(self.text, 'html.parser')
+        return self._soup
+
+    def signals(self, parser=None):
+        """
+        On-page SEO signals of the page, extracted once per parser
+        'stream' uses the single-pass extractor, 'bs4' the BeautifulSoup reference
+        """
+        parser = parser or HTML_PARSER
+        with self._lock:
+            if parser not in self._signals:
+                with timed('parse'):
+                    if parser == 'bs4':
+                        self._signals[parser] = extract_signals_bs4(self.soup, self.url, self.visible_text())
+                    else:
+                        self._signals[parser] = extract_signals(self.text, self.url)
+        return self._signals[parser]
+
+    @property
+    def extracted_text(self):
+        """Main text content as extracted by trafilatura, or None"""
+        with self._lock:
+            if not self._extracted:
+                with timed('text_extraction'):
+                    self._extracted_text = trafilatura.extract(self.text)
+                self._extracted = True
+        return self._extracted_text
+
+    def visible_text(self):
+        """
+        Text of the page outside of script, style and navigation elements
+        Walks the shared tree without modifying it
+        """
+        parts = []
+        for string in self.soup.find_all(string=True):
+            if type(string) not in (NavigableString, CData):
+                continue
+            if any(parent.name in NON_CONTENT_TAGS for parent in string.parents):
+                continue
+            stripped = string.strip()
+            if stripped:
+                parts.append(stripped)
+        return ' '.join(parts)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_soup'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+
+def fetch_document(url, timeout=10, max_bytes=MAX_BODY_BYTES, headers=None):
+    """
+    Download a webpage once so it can be shared across analyses
+    Bodies larger than max_bytes are cut off and the document marked truncated
+    Extra request headers, such as conditional request validators, may be given
+    Fetch errors are recorded on the returned document instead of being raised
+    """
+    try:
+        with timed('fetch'):
+            response, content, truncated = fetch(url, timeout=timeout, max_bytes=max_bytes, headers=headers)
+        FETCH_BYTES.inc(len(content))
+        FETCH_RESPONSES.inc(status=response.status_code)
+        return FetchedDocument(
+            url,
+            final_url=response.url,
+            status_code=response.status_code,
+            headers=response.headers,
+            content=content,
+            encoding=detect_encoding(response.headers, content),
+            truncated=truncated,
+        )
+    except requests.RequestException as e:
+        logger.warning(f"Error fetching {url}: {str(e)}")
+        STAGE_ERRORS.inc(stage='fetch')
+        if e.response is None:
+            FETCH_RESPONSES.inc(status='error')
+            return FetchedDocument(url, error=e)
+        # Keep the status of HTTP errors so broken pages can be reported as such
+        FETCH_RESPONSES.inc(status=e.response.status_code)
+        return FetchedDocument(url, final_url=e.response.url, status_code=e.response.status_code,
+                               headers=e.response.headers, error=e)
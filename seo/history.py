@@ -0,0 +1,394 @@
+"""
+Persistent history of analysis scores
+Every completed analysis appends one row per URL with its scores, word count
+and Core Web Vitals. New rows go to a small row table; once it holds
+HISTORY_CHUNK_ROWS rows they are sealed into a chunk that stores each metric
+as its own zlib-compressed array, so trend queries read only the columns they
+need and never touch stored result JSON.
+"""
+import os
+import math
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from array import array
+from urllib.parse import urlparse
+
+from seo.utils import canonicalize_url, data_path
+
+logger = logging.getLogger(__name__)
+
+HISTORY_ENABLED = os.environ.get('SEO_HISTORY', '1') != '0'
+HISTORY_CHUNK_ROWS = int(os.environ.get('SEO_HISTORY_CHUNK_ROWS', '1024'))
+DEFAULT_POINTS = 200
+WEEK = 7 * 86400
+
+
+def _section_value(section, key):
+    def extract(results):
+        result = results.get(section)
+        if not isinstance(result, dict) or 'error' in result:
+            return None
+        return result.get(key)
+    return extract
+
+
+def _speed_metric(key):
+    def extract(results):
+        metric = (results.get('speed_results') or {}).get(key)
+        return metric.get('raw_value') if isinstance(metric, dict) else None
+    return extract
+
+
+def _readability(results):
+    readability = _section_value('content_analysis', 'readability')(results)
+    return readability.get('score') if isinstance(readability, dict) else None
+
+
+# Metric name -> function taking it from an analysis result
+METRICS = {
+    'overall_score': _section_value('basic_seo', 'overall_score'),
+    'content_score': _section_value('content_analysis', 'content_score'),
+    'performance_score': _section_value('speed_results', 'performance_score'),
+    'word_count': _section_value('content_analysis', 'word_count'),
+    'readability': _readability,
+    'first_contentful_paint': _speed_metric('first_contentful_paint'),
+    'largest_contentful_paint': _speed_metric('largest_contentful_paint'),
+    'cumulative_layout_shift': _speed_metric('cumulative_layout_shift'),
+    'total_blocking_time': _speed_metric('total_blocking_time'),
+    'speed_index': _speed_metric('speed_index'),
+    'time_to_interactive': _speed_metric('time_to_interactive'),
+    'broken_links': _section_value('link_health', 'broken_count'),
+}
+
+# Metrics where a rise is a regression
+LOWER_IS_BETTER = {
+    'first_contentful_paint', 'largest_contentful_paint', 'cumulative_layout_shift', 'total_blocking_time',
+    'speed_index', 'time_to_interactive', 'broken_links',
+}
+
+
+def result_metrics(results):
+    """Metric values of one analysis result; metrics of failed or missing stages are None"""
+    values = {}
+    for name, extract in METRICS.items():
+        value = extract(results)
+        values[name] = float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+    return values
+
+
+def _encode(typecode, values):
+    return zlib.compress(array(typecode, values).tobytes())
+
+
+def _decode(typecode, blob):
+    values = array(typecode)
+    values.frombytes(zlib.decompress(blob))
+    return values
+
+
+def encode_times(times):
+    """Compressed run times: whole seconds, each stored as the difference from the previous one"""
+    deltas = []
+    previous = 0
+    for value in times:
+        deltas.append(value - previous)
+        previous = value
+    return _encode('q', deltas)
+
+
+def decode_times(blob):
+    times = []
+    total = 0
+    for delta in _decode('q', blob):
+        total += delta
+        times.append(total)
+    return times
+
+
+def encode_values(values):
+    """Compressed metric column; missing values are stored as NaN"""
+    return _encode('d', (math.nan if value is None else value for value in values))
+
+
+def decode_values(blob):
+    return [None if math.isnan(value) else value for value in _decode('d', blob)]
+
+
+def downsample(points, threshold):
+    """
+    Reduce a time series of (time, value) points to at most `threshold` points
+    with Largest-Triangle-Three-Buckets, which keeps the first and last points
+    and, from each bucket in between, the point that spans the largest triangle
+    with its neighbours, so peaks and dips survive
+    """
+    if threshold >= len(points) or threshold < 3:
+        return list(points)
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        following = points[end:min(int((bucket + 2) * every) + 1, len(points) - 1)] or [points[-1]]
+        average_time = sum(point[0] for point in following) / len(following)
+        average_value = sum(point[1] for point in following) / len(following)
+        previous_time, previous_value = points[previous]
+        previous = max(range(start, end), key=lambda index: abs(
+            (previous_time - average_time) * (points[index][1] - previous_value)
+            - (previous_time - points[index][0]) * (average_value - previous_value)))
+        sampled.append(points[previous])
+    sampled.append(points[-1])
+    return sampled
+
+
+class HistoryStore:
+    """
+    Per-URL score history stored in SQLite
+    Recent rows live in the 'pending' table, one column per metric; sealed
+    chunks keep the run times, URL ids and each metric as separate compressed
+    blobs in 'chunk_columns', with each chunk's time range in 'chunks' so
+    queries skip chunks outside the requested period
+    """
+
+    def __init__(self, path=None, chunk_rows=HISTORY_CHUNK_ROWS):
+        self.path = path or data_path('history.sqlite3')
+        self.chunk_rows = chunk_rows
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls (id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL, site TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS urls_site ON urls (site)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending (url_id INTEGER NOT NULL, run_at INTEGER NOT NULL, "
+            + ', '.join(f"{name} REAL" for name in METRICS) + ")")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, start_at INTEGER NOT NULL, end_at INTEGER NOT NULL, row_count INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS chunks_time ON chunks (end_at, start_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_columns ("
+            "chunk_id INTEGER NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (chunk_id, name)) WITHOUT ROWID")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _url_id(self, conn, url):
+        url = canonicalize_url(url)
+        conn.execute("INSERT OR IGNORE INTO urls (url, site) VALUES (?, ?)", (url, urlparse(url).netloc))
+        return conn.execute("SELECT id FROM urls WHERE url = ?", (url,)).fetchone()[0]
+
+    def record(self, url, metrics, run_at=None):
+        """Append one run of a URL; metrics maps METRICS names to values or None"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = [self._url_id(conn, url), int(run_at if run_at is not None else time.time())]
+            row += [metrics.get(name) for name in METRICS]
+            conn.execute(f"INSERT INTO pending VALUES ({', '.join('?' * len(row))})", row)
+            if conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0] >= self.chunk_rows:
+                self._seal(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _seal(self, conn):
+        """Move all pending rows into a new compressed chunk, ordered by run time"""
+        rows = conn.execute(f"SELECT url_id, run_at, {', '.join(METRICS)} FROM pending ORDER BY run_at").fetchall()
+        columns = list(zip(*rows))
+        chunk_id = conn.execute("INSERT INTO chunks (start_at, end_at, row_count) VALUES (?, ?, ?)",
+                                (columns[1][0], columns[1][-1], len(rows))).lastrowid
+        blobs = [('url_id', _encode('I', columns[0])), ('run_at', encode_times(columns[1]))]
+        blobs += [(name, encode_values(column)) for name, column in zip(METRICS, columns[2:])]
+        conn.executemany("INSERT INTO chunk_columns VALUES (?, ?, ?)",
+                         [(chunk_id, name, blob) for name, blob in blobs])
+        conn.execute("DELETE FROM pending")
+        logger.debug(f"Sealed {len(rows)} history rows into chunk {chunk_id}")
+
+    def _url_ids(self, site=None, url=None):
+        """URL id -> URL for one URL, one site or every URL"""
+        if url is not None:
+            query, params = "SELECT id, url FROM urls WHERE url = ?", (canonicalize_url(url),)
+        elif site is not None:
+            query, params = "SELECT id, url FROM urls WHERE site = ?", (site.lower(),)
+        else:
+            query, params = "SELECT id, url FROM urls", ()
+        return dict(self._connect().execute(query, params))
+
+    def rows(self, metric, site=None, url=None, start=None, end=None):
+        """
+        Yield (url id, run time, value) for runs of a metric, oldest chunk first
+        Only the run time, URL id and metric columns of chunks overlapping the
+        period are read; runs without a value for the metric are skipped
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric {metric!r}")
+        wanted = self._url_ids(site, url) if site is not None or url is not None else None
+        if wanted is not None and not wanted:
+            return
+        start = int(start) if start is not None else 0
+        end = int(end) if end is not None else 2 ** 62
+
+        def keep(url_id, run_at, value):
+            return value is not None and start <= run_at <= end and (wanted is None or url_id in wanted)
+
+        conn = self._connect()
+        chunk_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM chunks WHERE end_at >= ? AND start_at <= ? ORDER BY start_at", (start, end))]
+        for chunk_id in chunk_ids:
+            blobs = dict(conn.execute(
+                "SELECT name, data FROM chunk_columns WHERE chunk_id = ? AND name IN ('url_id', 'run_at', ?)",
+                (chunk_id, metric)))
+            for row in zip(_decode('I', blobs['url_id']), decode_times(blobs['run_at']), decode_values(blobs[metric])):
+                if keep(*row):
+                    yield row
+        for row in conn.execute(f"SELECT url_id, run_at, {metric} FROM pending ORDER BY run_at").fetchall():
+            if keep(*row):
+                yield row
+
+    def series(self, url, metric='overall_score', start=None, end=None, points=DEFAULT_POINTS):
+        """A URL's runs of a metric as [time, value] pairs, downsampled to at most `points` points"""
+        runs = sorted((run_at, value) for _, run_at, value in self.rows(metric, url=url, start=start, end=end))
+        return {
+            'url': canonicalize_url(url),
+            'metric': metric,
+            'runs': len(runs),
+            'points': [list(point) for point in (downsample(runs, points) if points else runs)],
+        }
+
+    def _latest_runs(self, metric, site=None, start=None, end=None):
+        """URL id -> its two latest (time, value) runs of a metric, newest first"""
+        latest = {}
+        for url_id, run_at, value in self.rows(metric, site=site, start=start, end=end):
+            runs = latest.setdefault(url_id, [])
+            runs.append((run_at, value))
+            if len(runs) > 2:
+                runs.sort(reverse=True)
+                del runs[2:]
+        for runs in latest.values():
+            runs.sort(reverse=True)
+        return latest
+
+    def trends(self, metric='overall_score', site=None, start=None, end=None, limit=None):
+        """
+        Per-URL trend of a metric over a period: first and last value, change and
+        least-squares slope per day, worst changes first
+        """
+        sums = {}
+        for url_id, run_at, value in self.rows(metric, site=site, start=start, end=end):
+            entry = sums.get(url_id)
+            if entry is None:
+                entry = sums[url_id] = {'runs': 0, 'first': (run_at, value), 'last': (run_at, value),
+                                        't': 0.0, 'v': 0.0, 'tt': 0.0, 'tv': 0.0}
+            days = run_at / 86400
+            entry['runs'] += 1
+            entry['t'] += days
+            entry['v'] += value
+            entry['tt'] += days * days
+            entry['tv'] += days * value
+            entry['first'] = min(entry['first'], (run_at, value))
+            entry['last'] = max(entry['last'], (run_at, value))
+
+        urls = self._url_ids(site)
+        trends = []
+        for url_id, entry in sums.items():
+            n = entry['runs']
+            spread = n * entry['tt'] - entry['t'] ** 2
+            slope = (n * entry['tv'] - entry['t'] * entry['v']) / spread if n > 1 and spread > 1e-9 else 0.0
+            trends.append({
+                'url': urls.get(url_id),
+                'runs': n,
+                'first': entry['first'][1],
+                'last': entry['last'][1],
+                'change': round(entry['last'][1] - entry['first'][1], 4),
+                'slope_per_day': round(slope, 4),
+            })
+        sign = -1 if metric in LOWER_IS_BETTER else 1
+        trends.sort(key=lambda trend: sign * trend['change'])
+        return trends[:limit] if limit else trends
+
+    def regressions(self, metric='overall_score', threshold=1, site=None, since=None, limit=None):
+        """
+        URLs whose latest run of a metric is worse than the run before it by at
+        least `threshold`, largest regression first; `since` ignores older runs
+        """
+        urls = self._url_ids(site)
+        regressions = []
+        for url_id, runs in self._latest_runs(metric, site=site, start=since).items():
+            if len(runs) < 2:
+                continue
+            (latest_at, latest), (previous_at, previous) = runs
+            worse_by = previous - latest if metric not in LOWER_IS_BETTER else latest - previous
+            if worse_by >= threshold:
+                regressions.append({
+                    'url': urls.get(url_id),
+                    'previous': previous,
+                    'latest': latest,
+                    'previous_at': previous_at,
+                    'latest_at': latest_at,
+                    'worse_by': round(worse_by, 4),
+                })
+        regressions.sort(key=lambda regression: -regression['worse_by'])
+        return regressions[:limit] if limit else regressions
+
+    def week_over_week(self, metric='overall_score', site=None, now=None, limit=None):
+        """
+        Mean of a metric per URL over the last seven days against the seven days
+        before, for URLs with runs in both weeks, and the mean over all those URLs
+        """
+        now = int(now if now is not None else time.time())
+        weeks = {}
+        for url_id, run_at, value in self.rows(metric, site=site, start=now - 2 * WEEK, end=now):
+            entry = weeks.setdefault(url_id, [0.0, 0, 0.0, 0])
+            offset = 0 if run_at > now - WEEK else 2
+            entry[offset] += value
+            entry[offset + 1] += 1
+
+        urls = self._url_ids(site)
+        changes = []
+        for url_id, (this_sum, this_count, last_sum, last_count) in weeks.items():
+            if this_count and last_count:
+                this_week, last_week = this_sum / this_count, last_sum / last_count
+                changes.append({'url': urls.get(url_id), 'this_week': round(this_week, 4),
+                                'last_week': round(last_week, 4), 'change': round(this_week - last_week, 4)})
+        sign = -1 if metric in LOWER_IS_BETTER else 1
+        changes.sort(key=lambda change: sign * change['change'])
+
+        summary = None
+        if changes:
+            this_week = sum(change['this_week'] for change in changes) / len(changes)
+            last_week = sum(change['last_week'] for change in changes) / len(changes)
+            summary = {'this_week': round(this_week, 4), 'last_week': round(last_week, 4),
+                       'change': round(this_week - last_week, 4)}
+        return {'metric': metric, 'site': site, 'urls': len(changes), 'summary': summary,
+                'changes': changes[:limit] if limit else changes}
+
+
+_stores = {}
+
+
+def get_history():
+    """History store of the current process"""
+    store = _stores.get(os.getpid())
+    if store is None:
+        store = _stores[os.getpid()] = HistoryStore()
+    return store
+
+
+def record_run(url, results, run_at=None):
+    """Append an analysis result to the history unless it is disabled; errors are logged, not raised"""
+    if not HISTORY_ENABLED:
+        return
+    try:
+        get_history().record(url, result_metrics(results), run_at)
+    except Exception as e:
+        logger.error(f"Error recording history of {url}: {str(e)}", exc_info=True)
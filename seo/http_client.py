@@ -0,0 +1,129 @@
+import os
+import re
+import codecs
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = float(os.environ.get('SEO_CONNECT_TIMEOUT', '5'))
+MAX_BODY_BYTES = int(os.environ.get('SEO_MAX_BODY_BYTES', str(10 * 1024 * 1024)))
+POOL_HOSTS = int(os.environ.get('SEO_POOL_HOSTS', '64'))
+POOL_SIZE = int(os.environ.get('SEO_POOL_SIZE', '16'))
+CHUNK_SIZE = 65536
+SNIFF_BYTES = 4096
+
+# gzip and deflate always, br when a brotli package is installed
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept-Encoding': ACCEPT_ENCODING,
+}
+USER_AGENT = DEFAULT_HEADERS['User-Agent']
+
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.IGNORECASE)
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Shared requests session for this process
+    Connections are pooled and kept alive per host; a forked child gets its own session
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(DEFAULT_HEADERS)
+                _sessions[pid] = session
+    return session
+
+
+def make_timeout(timeout):
+    """Split an overall timeout into (connect, read) timeouts"""
+    return (min(CONNECT_TIMEOUT, timeout), timeout)
+
+
+def read_body(response, max_bytes=MAX_BODY_BYTES):
+    """
+    Read a streamed response body, stopping once max_bytes have been read
+    Returns the body and whether it was truncated
+    """
+    chunks = []
+    size = 0
+    try:
+        for chunk in response.iter_content(CHUNK_SIZE):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                logger.warning(f"Body of {response.url} exceeds {max_bytes} bytes, truncating")
+                return b''.join(chunks)[:max_bytes], True
+    finally:
+        response.close()
+    return b''.join(chunks), False
+
+
+def detect_encoding(headers, content):
+    """
+    Character encoding of a page from its Content-Type header, a byte order
+    mark or a <meta charset> in the first bytes; UTF-8 when none is declared
+    """
+    content_type = headers.get('Content-Type', '')
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            charset = value.strip().strip('"\'')
+            if _known_codec(charset):
+                return charset
+
+    for bom, charset in BOMS:
+        if content.startswith(bom):
+            return charset
+
+    match = META_CHARSET.search(content[:SNIFF_BYTES])
+    if match:
+        charset = match.group(1).decode('ascii')
+        if _known_codec(charset):
+            return charset
+
+    return 'utf-8'
+
+
+def _known_codec(charset):
+    try:
+        codecs.lookup(charset)
+        return True
+    except LookupError:
+        return False
+
+
+def fetch(url, timeout=10, max_bytes=MAX_BODY_BYTES, headers=None):
+    """
+    GET a URL through the shared session, reading at most max_bytes of the body
+    Raises requests.RequestException for network errors and error statuses
+    Returns the response (body already consumed), its content and whether it was truncated
+    """
+    response = get_session().get(url, headers=headers, timeout=make_timeout(timeout), stream=True)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        response.close()
+        raise
+    content, truncated = read_body(response, max_bytes)
+    return response, content, truncated
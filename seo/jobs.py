@@ -0,0 +1,394 @@
+import os
+import json
+import atexit
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import multiprocessing
+
+from seo.utils import data_path
+from seo.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('SEO_JOB_WORKERS', '2'))
+POLL_INTERVAL = float(os.environ.get('SEO_JOB_POLL_INTERVAL', '0.5'))
+# A running job whose worker has sent no heartbeat for STALE_AFTER seconds is queued again
+STALE_AFTER = float(os.environ.get('SEO_JOB_STALE_AFTER', '300'))
+HEARTBEAT_INTERVAL = float(os.environ.get('SEO_JOB_HEARTBEAT', '30'))
+RETENTION = float(os.environ.get('SEO_JOB_RETENTION', '86400'))
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobQueue:
+    """
+    Persistent job queue stored in SQLite and shared by web and worker processes
+    Submitting a job whose dedupe key matches a queued or running job returns
+    the existing job instead of creating a new one. Each claim holds a lease
+    token that its worker renews with heartbeats; results are only accepted
+    from the current holder of the lease
+    """
+
+    def __init__(self, path=None):
+        self.path = path or data_path('jobs.sqlite3')
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedupe_key TEXT, params TEXT NOT NULL, "
+            "status TEXT NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+            "claim_token TEXT, heartbeat_at REAL)"
+        )
+        columns = [column['name'] for column in conn.execute("PRAGMA table_info(jobs)")]
+        for column, kind in (('claim_token', 'TEXT'), ('heartbeat_at', 'REAL')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_stages ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, "
+            "stage TEXT NOT NULL, result TEXT NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS job_stages_job ON job_stages (job_id, seq)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, params, dedupe_key=None):
+        """Queue a job, or return the id of an identical job still in progress"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN (?, ?) LIMIT 1",
+                    (dedupe_key, *ACTIVE_STATUSES)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    logger.debug(f"Merged {kind} job into running job {row['id']}")
+                    return row['id']
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, dedupe_key, params, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, dedupe_key, json.dumps(params), time.time())
+            )
+            conn.execute("COMMIT")
+            return job_id
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add_finished(self, kind, params, result):
+        """Record a job whose result is already known, such as a cache hit"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO jobs (id, kind, params, status, result, created_at, started_at, finished_at) "
+            "VALUES (?, ?, ?, 'done', ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params), json.dumps(result, separators=(',', ':')), now, now, now)
+        )
+        return job_id
+
+    def claim(self):
+        """
+        Take the oldest queued job and mark it running under a new lease token
+        Jobs whose worker stopped sending heartbeats are queued again first
+        Returns the job with its 'token', or None when the queue is empty
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL, claim_token = NULL, heartbeat_at = NULL "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?",
+                (now - STALE_AFTER,)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            token = uuid.uuid4().hex
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, claim_token = ?, heartbeat_at = ? WHERE id = ?",
+                    (now, token, now, row['id'])
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {'id': row['id'], 'kind': row['kind'], 'params': json.loads(row['params']), 'token': token}
+
+    def heartbeat(self, job_id, token):
+        """Renew the lease of a running job; False when the lease has been lost to another worker"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND claim_token = ? AND status = 'running'",
+            (time.time(), job_id, token)
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, job_id, token, result):
+        """Store the result of a job; False, and nothing stored, when the lease has been lost"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'done', result = ?, finished_at = ? WHERE id = ? AND claim_token = ?",
+            (json.dumps(result, separators=(',', ':')), time.time(), job_id, token)
+        )
+        return cursor.rowcount > 0
+
+    def fail(self, job_id, token, error):
+        """Mark a job failed; False, and nothing stored, when the lease has been lost"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND claim_token = ?",
+            (error, time.time(), job_id, token)
+        )
+        return cursor.rowcount > 0
+
+    def record_stage(self, job_id, stage, result):
+        """Store the result of one stage of a running job as soon as it finishes"""
+        self._connect().execute(
+            "INSERT INTO job_stages (job_id, stage, result) VALUES (?, ?, ?)",
+            (job_id, stage, json.dumps(result, separators=(',', ':')))
+        )
+
+    def get_stages(self, job_id, after=0):
+        """Return (seq, stage, result) for stages recorded after the given sequence number"""
+        rows = self._connect().execute(
+            "SELECT seq, stage, result FROM job_stages WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after)
+        ).fetchall()
+        return [(row['seq'], row['stage'], json.loads(row['result'])) for row in rows]
+
+    def get(self, job_id, with_result=False):
+        """Return a job's status, and its result when asked; None if unknown"""
+        columns = "*" if with_result else "id, kind, params, status, error, created_at, started_at, finished_at"
+        row = self._connect().execute(f"SELECT {columns} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            'id': row['id'],
+            'kind': row['kind'],
+            'params': json.loads(row['params']),
+            'status': row['status'],
+            'error': row['error'],
+            'created_at': row['created_at'],
+            'started_at': row['started_at'],
+            'finished_at': row['finished_at'],
+        }
+        if with_result:
+            job['result'] = json.loads(row['result']) if row['result'] else None
+        return job
+
+    def purge(self, older_than=RETENTION):
+        """Delete finished jobs older than the retention period, with the result files of batch jobs"""
+        conn = self._connect()
+        cutoff = time.time() - older_than
+        batch_jobs = conn.execute(
+            "SELECT id FROM jobs WHERE kind = 'batch' AND status NOT IN (?, ?) AND finished_at < ?",
+            (*ACTIVE_STATUSES, cutoff)
+        ).fetchall()
+        for row in batch_jobs:
+            output_path = batch_output_path(row['id'])
+            for path in (output_path, output_path + '.checkpoint'):
+                if os.path.exists(path):
+                    os.remove(path)
+        conn.execute(
+            "DELETE FROM jobs WHERE status NOT IN (?, ?) AND finished_at < ?",
+            (*ACTIVE_STATUSES, cutoff)
+        )
+        conn.execute("DELETE FROM job_stages WHERE job_id NOT IN (SELECT id FROM jobs)")
+
+
+_results_cache = None
+
+
+def results_cache():
+    """Results cache of this process, created once so its memory tier is kept between jobs"""
+    global _results_cache
+    if _results_cache is None:
+        from seo.cache import create_cache
+
+        _results_cache = create_cache('results')
+    return _results_cache
+
+
+def analysis_cache_key(params):
+    """Results cache and dedupe key of an analysis job's parameters"""
+    from seo.cache import make_cache_key
+    from seo.models import job_competitor_urls
+
+    key = make_cache_key(params['url'], *job_competitor_urls(params))
+    if params.get('check_links'):
+        key += '|links'
+    return key
+
+
+def run_analyze_job(queue, job_id, params):
+    """
+    Handler for 'analyze' jobs: run the full analysis, cache the results and
+    append them to the score history
+    Each stage result is recorded as it finishes so it can be streamed
+    """
+    from seo.pipeline import run_analysis
+    from seo.history import record_run
+    from seo.models import job_competitor_urls
+
+    results = run_analysis(
+        params['url'], job_competitor_urls(params),
+        on_result=lambda stage, result: queue.record_stage(job_id, stage, result),
+        check_links=bool(params.get('check_links')),
+    )
+    if not results['timed_out_stages']:
+        results_cache().set(analysis_cache_key(params), results)
+    record_run(params['url'], results)
+    return results
+
+
+def crawl_job_key(params):
+    """Dedupe key of a crawl job's parameters"""
+    from seo.cache import make_cache_key
+
+    return f"crawl|{make_cache_key(params['url'])}|{params.get('max_pages')}|{params.get('max_depth')}"
+
+
+def run_crawl_job(queue, job_id, params):
+    """Handler for 'crawl' jobs, from /crawl and scheduled site crawls: crawl the site and return its report"""
+    from seo import crawler
+
+    return crawler.crawl_site(
+        params['url'],
+        max_depth=params.get('max_depth', crawler.DEFAULT_MAX_DEPTH),
+        max_pages=params.get('max_pages', crawler.DEFAULT_MAX_PAGES),
+    )
+
+
+def batch_output_path(job_id):
+    """JSON lines file with the results of a batch job; its checkpoint sits next to it"""
+    return data_path(f'batch-{job_id}.jsonl')
+
+
+def run_batch_job(queue, job_id, params):
+    """
+    Handler for 'batch' jobs from /batch: analyze a list of URLs, or the pages
+    of a site's sitemaps, writing one JSON line per page to the job's output file
+    A job that is claimed again after its worker died resumes from its checkpoint
+    Returns the number of results in the file
+    """
+    from seo.batch import iter_batch, load_checkpoint, write_results, trim_partial_line
+    from seo.sitemap import audit_sitemap
+
+    output_path = batch_output_path(job_id)
+    checkpoint = output_path + '.checkpoint'
+    done = load_checkpoint(checkpoint)
+    if done:
+        logger.info(f"Resuming batch job {job_id}, skipping {len(done)} URLs already analyzed")
+    trim_partial_line(output_path)
+    if params.get('sitemap'):
+        results = audit_sitemap(params['sitemap'], changed_only=bool(params.get('changed_only')), skip=done)
+    else:
+        results = iter_batch(params['urls'], skip=done)
+    with open(output_path, 'a', encoding='utf-8') as output:
+        count = write_results(results, output, checkpoint)
+    return {'count': len(done) + count}
+
+
+JOB_HANDLERS = {
+    'analyze': run_analyze_job,
+    'crawl': run_crawl_job,
+    'batch': run_batch_job,
+}
+
+
+def worker_loop(path=None, poll_interval=POLL_INTERVAL):
+    """Consume jobs from the queue until the process is stopped"""
+    queue = JobQueue(path)
+    logger.info(f"Job worker {os.getpid()} started")
+    last_purge = 0
+    while True:
+        job = queue.claim()
+        if job is None:
+            if time.time() - last_purge > 3600:
+                queue.purge()
+                last_purge = time.time()
+            time.sleep(poll_interval)
+            continue
+        handler = JOB_HANDLERS.get(job['kind'])
+        finished = threading.Event()
+        heartbeat = threading.Thread(target=send_heartbeats, args=(queue, job, finished),
+                                     daemon=True, name='seo-job-heartbeat')
+        heartbeat.start()
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job['kind']}")
+            stored = queue.complete(job['id'], job['token'], handler(queue, job['id'], job['params']))
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}", exc_info=True)
+            stored = queue.fail(job['id'], job['token'], str(e))
+        finally:
+            finished.set()
+            heartbeat.join()
+        if not stored:
+            logger.warning(f"Job {job['id']} was claimed by another worker; its result was discarded")
+        registry.flush(force=True)
+
+
+def send_heartbeats(queue, job, finished, interval=HEARTBEAT_INTERVAL):
+    """Renew a job's lease until it finishes or the lease is lost"""
+    while not finished.wait(interval):
+        try:
+            if not queue.heartbeat(job['id'], job['token']):
+                logger.warning(f"Lost the lease on job {job['id']}")
+                return
+        except Exception as e:
+            logger.error(f"Error renewing the lease on job {job['id']}: {str(e)}")
+
+
+_workers = []
+_workers_lock = threading.Lock()
+_stop_registered = False
+
+
+def ensure_workers(count=JOB_WORKERS, path=None):
+    """
+    Start local worker processes once per process
+    Dead workers are replaced; a count of 0 leaves jobs to external workers.
+    Workers are not daemonic, so batch jobs can start their analysis process
+    pool; they are stopped when this process exits instead
+    """
+    global _stop_registered
+    with _workers_lock:
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        context = multiprocessing.get_context('spawn')
+        while len(_workers) < count:
+            worker = context.Process(target=worker_loop, args=(path,), name='seo-job-worker')
+            worker.start()
+            _workers.append(worker)
+        if _workers and not _stop_registered:
+            # Registered after the first start so it runs before multiprocessing's own
+            # exit handler, which would otherwise wait for the workers forever
+            atexit.register(stop_workers)
+            _stop_registered = True
+
+
+def stop_workers():
+    """Terminate the local worker processes; their running jobs are requeued once their leases expire"""
+    with _workers_lock:
+        for worker in _workers:
+            worker.terminate()
+        for worker in _workers:
+            worker.join()
+        _workers.clear()
+
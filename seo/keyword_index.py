@@ -0,0 +1,243 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+
+from seo.utils import canonicalize_url, data_path
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_INDEX_ENABLED = os.environ.get('SEO_KEYWORD_INDEX', '1') != '0'
+
+# SQLite limits the number of host parameters in one statement
+_TERM_CHUNK = 500
+
+
+class KeywordIndex:
+    """
+    Inverted index of keyword frequencies over every analyzed page
+    Terms get integer ids; each page is stored in SQLite as two packed integer
+    arrays (term ids and counts) and is replaced when the page is re-analyzed.
+    Reference pages, such as competitors, can be queried but are left out of
+    document frequencies so they do not skew the idf of the analyzed pages.
+    Each process keeps an in-memory copy with array-backed postings per term
+    and catches up with pages indexed by other processes before every query.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or data_path('keyword_index.sqlite3')
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self.terms = []                # term id -> term (ids start at 1, index 0 is unused)
+        self.term_ids = {}             # term -> term id
+        self.doc_ids = {}              # canonical URL -> document id
+        self.documents = {}            # document id -> (term ids, counts, keyword total, counted)
+        self.postings = {}             # term id -> array of counted document ids
+        self.counted = 0               # number of pages counted in document frequencies
+        self._seq = 0
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT NOT NULL UNIQUE)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE, seq INTEGER NOT NULL, "
+            "total INTEGER NOT NULL, term_ids BLOB NOT NULL, counts BLOB NOT NULL, updated_at REAL NOT NULL, "
+            "counted INTEGER NOT NULL DEFAULT 1)"
+        )
+        if 'counted' not in [column[1] for column in conn.execute("PRAGMA table_info(documents)")]:
+            conn.execute("ALTER TABLE documents ADD COLUMN counted INTEGER NOT NULL DEFAULT 1")
+        conn.execute("CREATE INDEX IF NOT EXISTS documents_seq ON documents (seq)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add_page(self, url, keyword_counts, counted=True):
+        """
+        Index or re-index a page from its keyword counts (a mapping of keyword to count)
+        With counted=False the page is stored as a reference page, unless it has
+        already been indexed as a counted one
+        """
+        url = canonicalize_url(url)
+        conn = self._connect()
+        words = list(keyword_counts)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)", [(word,) for word in words])
+            ids = {}
+            for start in range(0, len(words), _TERM_CHUNK):
+                chunk = words[start:start + _TERM_CHUNK]
+                rows = conn.execute(
+                    f"SELECT term, id FROM terms WHERE term IN ({','.join('?' * len(chunk))})", chunk)
+                ids.update(rows)
+            pairs = sorted((ids[word], keyword_counts[word]) for word in words)
+            term_ids = array('I', [term_id for term_id, _ in pairs])
+            counts = array('I', [count for _, count in pairs])
+            conn.execute(
+                "INSERT INTO documents (url, seq, total, term_ids, counts, updated_at, counted) "
+                "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM documents), ?, ?, ?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET seq = excluded.seq, total = excluded.total, "
+                "term_ids = excluded.term_ids, counts = excluded.counts, updated_at = excluded.updated_at, "
+                "counted = MAX(documents.counted, excluded.counted)",
+                (url, sum(counts), term_ids.tobytes(), counts.tobytes(), time.time(), int(counted))
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def refresh(self):
+        """Apply terms and pages indexed since the last refresh, by any process"""
+        conn = self._connect()
+        with self._lock:
+            # One read transaction, so every page read refers only to terms read with it
+            conn.execute("BEGIN")
+            try:
+                new_terms = conn.execute("SELECT id, term FROM terms WHERE id >= ? ORDER BY id",
+                                         (len(self.terms) or 1,)).fetchall()
+                rows = conn.execute("SELECT id, url, seq, total, term_ids, counts, counted FROM documents "
+                                    "WHERE seq > ? ORDER BY seq", (self._seq,)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+            for term_id, term in new_terms:
+                if term_id >= len(self.terms):
+                    self.terms.extend([None] * (term_id + 1 - len(self.terms)))
+                self.terms[term_id] = term
+                self.term_ids[term] = term_id
+
+            if not rows:
+                return
+            # Postings of re-indexed pages are dropped in one pass per affected term
+            replaced = {}
+            for doc_id, *_ in rows:
+                previous = self.documents.get(doc_id)
+                if previous is not None and previous[3]:
+                    self.counted -= 1
+                    for term_id in previous[0]:
+                        replaced.setdefault(term_id, set()).add(doc_id)
+            for term_id, doc_ids in replaced.items():
+                postings = array('I', [doc_id for doc_id in self.postings[term_id] if doc_id not in doc_ids])
+                if postings:
+                    self.postings[term_id] = postings
+                else:
+                    del self.postings[term_id]
+
+            for doc_id, url, seq, total, term_blob, count_blob, counted in rows:
+                term_ids = array('I')
+                term_ids.frombytes(term_blob)
+                counts = array('I')
+                counts.frombytes(count_blob)
+                if counted:
+                    self.counted += 1
+                    for term_id in term_ids:
+                        self.postings.setdefault(term_id, array('I')).append(doc_id)
+                self.documents[doc_id] = (term_ids, counts, total, bool(counted))
+                self.doc_ids[url] = doc_id
+            self._seq = rows[-1][2]
+
+    def __len__(self):
+        return len(self.documents)
+
+    def idf(self, term_id):
+        """Smoothed inverse document frequency of a term over the counted pages"""
+        return math.log((1 + self.counted) / (1 + len(self.postings.get(term_id, ())))) + 1
+
+    def _vectors(self, urls):
+        """Term id -> count mappings and keyword totals of pages, or None if a page is not indexed"""
+        vectors = []
+        for url in urls:
+            doc_id = self.doc_ids.get(canonicalize_url(url))
+            if doc_id is None:
+                return None
+            term_ids, counts, total, _ = self.documents[doc_id]
+            vectors.append((dict(zip(term_ids, counts)), total))
+        return vectors
+
+    def top_keywords(self, urls, limit=10):
+        """
+        Keywords of a page or set of pages ranked by TF-IDF against the whole index
+        Returns a list of dictionaries with word, count, density (%) and tfidf,
+        or None when a page is not indexed
+        """
+        if isinstance(urls, str):
+            urls = [urls]
+        self.refresh()
+        with self._lock:
+            vectors = self._vectors(urls)
+            if vectors is None:
+                return None
+            merged = {}
+            for vector, _ in vectors:
+                for term_id, count in vector.items():
+                    merged[term_id] = merged.get(term_id, 0) + count
+            total = sum(total for _, total in vectors) or 1
+            ranked = sorted(((count / total * self.idf(term_id), term_id, count)
+                             for term_id, count in merged.items()), reverse=True)[:limit]
+            return [
+                {'word': self.terms[term_id], 'count': count, 'density': round(count / total * 100, 2),
+                 'tfidf': round(score, 4)}
+                for score, term_id, count in ranked
+            ]
+
+    def overlap(self, urls, limit=20, min_pages=2):
+        """
+        Keywords used by at least min_pages of the given pages
+        densities and tfidf list each page's value in input order (None where a
+        page lacks the keyword); keywords shared by more pages and with higher
+        combined TF-IDF come first. Returns None when a page is not indexed
+        """
+        self.refresh()
+        with self._lock:
+            vectors = self._vectors(urls)
+            if vectors is None:
+                return None
+            pages = {}
+            for vector, _ in vectors:
+                for term_id in vector:
+                    pages[term_id] = pages.get(term_id, 0) + 1
+
+            overlap = []
+            for term_id, page_count in pages.items():
+                if page_count < min_pages:
+                    continue
+                idf = self.idf(term_id)
+                densities = []
+                scores = []
+                for vector, total in vectors:
+                    count = vector.get(term_id)
+                    densities.append(round(count / total * 100, 2) if count else None)
+                    scores.append(round(count / total * idf, 4) if count else None)
+                overlap.append((page_count, sum(score for score in scores if score), term_id, densities, scores))
+
+            overlap.sort(reverse=True)
+            return [
+                {'keyword': self.terms[term_id], 'densities': densities, 'tfidf': scores, 'site_count': page_count}
+                for page_count, _, term_id, densities, scores in overlap[:limit]
+            ]
+
+
+_indexes = {}
+
+
+def get_index():
+    """Keyword index of the current process"""
+    index = _indexes.get(os.getpid())
+    if index is None:
+        index = _indexes[os.getpid()] = KeywordIndex()
+    return index
+
+
+def index_page(url, keyword_counts, counted=True):
+    """Add a page to the keyword index unless indexing is disabled; errors are logged, not raised"""
+    if not KEYWORD_INDEX_ENABLED or not keyword_counts:
+        return
+    try:
+        get_index().add_page(url, keyword_counts, counted=counted)
+    except Exception as e:
+        logger.error(f"Error indexing keywords of {url}: {str(e)}", exc_info=True)
@@ -0,0 +1,231 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from urllib.parse import urljoin, urldefrag, urlparse
+
+import requests
+
+from seo.cache import create_cache, make_cache_key
+from seo.fetcher import fetch_document
+from seo.http_client import get_session, make_timeout
+from seo.metrics import STAGE_ERRORS
+from seo.utils import make_absolute_url
+
+logger = logging.getLogger(__name__)
+
+LINK_CONCURRENCY = int(os.environ.get('SEO_LINK_CONCURRENCY', '16'))
+LINK_PER_HOST = int(os.environ.get('SEO_LINK_PER_HOST', '4'))
+LINK_TIMEOUT = float(os.environ.get('SEO_LINK_TIMEOUT', '10'))
+LINK_CACHE_TTL = int(os.environ.get('SEO_LINK_CACHE_TTL', '3600'))
+LINK_ERROR_TTL = int(os.environ.get('SEO_LINK_ERROR_TTL', '300'))
+MAX_LINKS = int(os.environ.get('SEO_LINK_CHECK_MAX', '200'))
+MAX_REDIRECTS = 10
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Statuses servers commonly answer HEAD with when they only implement GET
+HEAD_FALLBACK_STATUSES = (400, 403, 405, 406, 500, 501)
+
+_cache = None
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def status_cache():
+    """Cache of link check results shared by all pages, analyses and processes"""
+    global _cache
+    if _cache is None:
+        _cache = create_cache('link_status', ttl=LINK_CACHE_TTL)
+    return _cache
+
+
+def _request(session, url, timeout):
+    """HEAD a URL without following redirects, falling back to a one-byte ranged GET"""
+    response = session.head(url, allow_redirects=False, timeout=make_timeout(timeout))
+    response.close()
+    if response.status_code not in HEAD_FALLBACK_STATUSES:
+        return response, 'HEAD'
+    response = session.get(url, allow_redirects=False, stream=True, headers={'Range': 'bytes=0-0'},
+                           timeout=make_timeout(timeout))
+    response.close()
+    return response, 'GET'
+
+
+def check_link(url, timeout=LINK_TIMEOUT):
+    """
+    Check one link, following redirects hop by hop
+    Returns a dictionary with the final status code, the final URL, each
+    redirect hop and an error message when the link could not be reached
+    """
+    session = get_session()
+    redirects = []
+    current = url
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            response, method = _request(session, current, timeout)
+            location = response.headers.get('Location')
+            if response.status_code in REDIRECT_STATUSES and location:
+                redirects.append({'url': current, 'status_code': response.status_code})
+                current = urljoin(current, location)
+                continue
+            status = response.status_code
+            return {
+                'url': url,
+                'final_url': current,
+                'status_code': status,
+                # 416 answers the range request of an existing resource
+                'ok': status < 400 or status == 416,
+                'method': method,
+                'redirects': redirects,
+            }
+        error = f"More than {MAX_REDIRECTS} redirects"
+    except requests.RequestException as e:
+        error = str(e)
+    return {'url': url, 'final_url': current, 'status_code': None, 'ok': False, 'redirects': redirects,
+            'error': error}
+
+
+class _CheckAbandoned(Exception):
+    """Set on a shared link check whose owning task was cancelled before it finished"""
+
+
+async def _check_cached(url, timeout, limit, host_limits):
+    """Check a link once per cache TTL; concurrent checks of the same link share one request"""
+    key = make_cache_key(url)
+    cache = status_cache()
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached
+
+    while True:
+        with _in_flight_lock:
+            future = _in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = _in_flight[key] = Future()
+        if owner:
+            break
+        try:
+            # Shielded so a waiter being cancelled does not cancel the check shared with others
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except _CheckAbandoned:
+            # The owner was cancelled, for example by its stage deadline; check the link here instead
+            continue
+
+    try:
+        host = urlparse(url).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(LINK_PER_HOST))
+        async with limit, host_limit:
+            result = await asyncio.to_thread(check_link, url, timeout)
+        ttl = LINK_CACHE_TTL if result['status_code'] is not None else LINK_ERROR_TTL
+        await asyncio.to_thread(cache.set, key, result, ttl)
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        # Waiters must not hang when this task is cancelled before resolving the future
+        if not future.done():
+            future.set_exception(_CheckAbandoned(f"Check of {url} was cancelled"))
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+async def _check_all(urls, timeout, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+    host_limits = {}
+    return await asyncio.gather(*(_check_cached(url, timeout, limit, host_limits) for url in urls))
+
+
+def check_links(urls, timeout=LINK_TIMEOUT, concurrency=LINK_CONCURRENCY):
+    """
+    Check many links concurrently
+    At most `concurrency` requests run at once and LINK_PER_HOST per host;
+    results come from the shared status cache when available
+    Returns the results in the order of the URLs
+    """
+    if not urls:
+        return []
+    return asyncio.run(_check_all(list(urls), timeout, concurrency))
+
+
+def page_links(document, limit=MAX_LINKS):
+    """Absolute, fragment-free, distinct http(s) links of a page, in page order"""
+    signals = document.signals()
+    links = []
+    seen = set()
+    for href in signals['internal_links'] + signals['external_links']:
+        absolute, _ = urldefrag(make_absolute_url(document.final_url, href))
+        if urlparse(absolute).scheme not in ('http', 'https') or absolute in seen:
+            continue
+        seen.add(absolute)
+        links.append(absolute)
+        if len(links) >= limit:
+            break
+    return links
+
+
+def analyze_links(url, document=None, deadline=None):
+    """
+    Check the health of every link on a webpage
+    Reuses an already fetched document when one is given; request timeouts
+    are capped by the deadline when one is given
+    Returns a dictionary with broken and redirected links and a score
+    """
+    try:
+        if document is None:
+            document = fetch_document(url)
+        document.raise_for_status()
+
+        links = page_links(document)
+        results = check_links(links, timeout=deadline.timeout(LINK_TIMEOUT) if deadline else LINK_TIMEOUT)
+
+        broken = [result for result in results if not result['ok']]
+        redirected = [result for result in results if result['ok'] and result['redirects']]
+        chains = [result for result in redirected if len(result['redirects']) > 1]
+
+        if not broken:
+            score = 5
+        elif len(broken) <= max(1, len(results) // 20):
+            score = 3
+        else:
+            score = 1
+
+        recommendations = []
+        if broken:
+            recommendations.append(f"Fix or remove {len(broken)} broken links")
+        if redirected:
+            recommendations.append(f"Point {len(redirected)} redirecting links directly at their final URL")
+        if chains:
+            recommendations.append(f"Shorten {len(chains)} redirect chains with more than one hop")
+
+        return {
+            'checked_count': len(results),
+            'broken_count': len(broken),
+            'redirect_count': len(redirected),
+            'broken': broken,
+            'redirected': redirected,
+            'score': score,
+            'recommendations': recommendations,
+        }
+
+    except Exception as e:
+        logger.error(f"Error checking links for {url}: {str(e)}", exc_info=True)
+        STAGE_ERRORS.inc(stage='link_health')
+        return links_error_result(str(e))
+
+
+def links_error_result(error):
+    """Result returned by analyze_links when the links could not be checked"""
+    return {
+        'error': error,
+        'checked_count': 0,
+        'broken_count': 0,
+        'redirect_count': 0,
+        'broken': [],
+        'redirected': [],
+        'score': 0,
+        'recommendations': ["Could not check links due to error"]
+    }
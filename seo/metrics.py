@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from seo.utils import data_path
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = float(os.environ.get('SEO_METRICS_FLUSH_INTERVAL', '5'))
+METRICS_RETENTION = float(os.environ.get('SEO_METRICS_RETENTION', str(7 * 86400)))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        return (total or 0) + value
+
+    def samples(self, key, value):
+        yield self.name, key, value
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            entry['counts'][index] += 1
+            entry['sum'] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def dump(self):
+        with self._lock:
+            return [[list(key), {'counts': list(entry['counts']), 'sum': entry['sum']}]
+                    for key, entry in self._values.items()]
+
+    @staticmethod
+    def merge(total, value):
+        if total is None:
+            return {'counts': list(value['counts']), 'sum': value['sum']}
+        total['counts'] = [a + b for a, b in zip(total['counts'], value['counts'])]
+        total['sum'] += value['sum']
+        return total
+
+    def samples(self, key, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), value['counts']):
+            cumulative += count
+            yield f"{self.name}_bucket", key + (('le', _format_bound(bound)),), cumulative
+        yield f"{self.name}_sum", key, value['sum']
+        yield f"{self.name}_count", key, cumulative
+
+
+class Registry:
+    """
+    Metrics of this process, shared with other processes through SQLite
+    Every process periodically writes its own totals; the /metrics endpoint
+    adds up the totals of all processes
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.metrics = {}
+        self.process_key = f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}"
+        self._last_flush = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path or data_path('metrics.sqlite3'), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS process_metrics ("
+                "process TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def reset(self):
+        """Forget values inherited from a parent process so a forked child reports as itself"""
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self.process_key = f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}"
+        self._local = threading.local()
+        for metric in self.metrics.values():
+            metric._lock = threading.Lock()
+            metric._values = {}
+
+    def flush(self, force=False):
+        """Write this process's totals, at most once per flush interval unless forced"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        with self._lock:
+            self._last_flush = now
+            try:
+                data = {name: metric.dump() for name, metric in self.metrics.items()}
+                self._connect().execute(
+                    "INSERT OR REPLACE INTO process_metrics (process, data, updated_at) VALUES (?, ?, ?)",
+                    (self.process_key, json.dumps(data, separators=(',', ':')), time.time())
+                )
+            except sqlite3.Error as e:
+                logger.warning(f"Could not store metrics: {str(e)}")
+
+    def collect(self):
+        """Totals of every metric summed over all processes"""
+        self.flush(force=True)
+        conn = self._connect()
+        conn.execute("DELETE FROM process_metrics WHERE updated_at < ?", (time.time() - METRICS_RETENTION,))
+        totals = {name: {} for name in self.metrics}
+        for (data,) in conn.execute("SELECT data FROM process_metrics"):
+            for name, values in json.loads(data).items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in values:
+                    key = tuple(zip(metric.labelnames, key))
+                    totals[name][key] = metric.merge(totals[name].get(key), value)
+        return totals
+
+    def exposition(self):
+        """All metrics in the Prometheus text exposition format"""
+        totals = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(totals[name].items()):
+                for sample_name, labels, sample_value in metric.samples(key, value):
+                    lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(sample_value)}")
+
+        lines.append("# HELP seo_cache_hit_ratio Share of cache lookups that were hits")
+        lines.append("# TYPE seo_cache_hit_ratio gauge")
+        lookups = {}
+        for key, value in totals.get(CACHE_REQUESTS.name, {}).items():
+            labels = dict(key)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+        for cache, (hits, total) in sorted(lookups.items()):
+            lines.append(f"seo_cache_hit_ratio{_format_labels((('cache', cache),))} {_format_value(hits / total)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.reset)
+
+STAGE_SECONDS = registry.register(Histogram(
+    'seo_stage_duration_seconds', "Time spent in each step of an analysis", ['stage']))
+STAGE_ERRORS = registry.register(Counter(
+    'seo_stage_errors_total', "Errors by analysis step", ['stage']))
+STAGE_TIMEOUTS = registry.register(Counter(
+    'seo_stage_timeouts_total', "Analysis stages abandoned at the deadline", ['stage']))
+FETCH_BYTES = registry.register(Counter(
+    'seo_fetch_bytes_total', "Response body bytes downloaded"))
+FETCH_RESPONSES = registry.register(Counter(
+    'seo_fetch_responses_total', "Page fetches by HTTP status code", ['status']))
+CACHE_REQUESTS = registry.register(Counter(
+    'seo_cache_requests_total', "Cache lookups by cache and result", ['cache', 'result']))
+PAGESPEED_CALLS = registry.register(Counter(
+    'seo_pagespeed_calls_total', "PageSpeed API calls by outcome", ['outcome']))
+
+
+@contextmanager
+def timed(stage, timings=None):
+    """
+    Time a step of the analysis into the stage histogram
+    The duration is also stored in timings[stage] when a dictionary is given
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(elapsed, 4)
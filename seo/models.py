@@ -0,0 +1,321 @@
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+
+def to_dict(value):
+    """
+    Compact JSON-ready form of a result object
+    Fields that are None are left out
+    """
+    if hasattr(value, '__dataclass_fields__'):
+        compact = {}
+        for item in fields(value):
+            item_value = getattr(value, item.name)
+            if item_value is not None:
+                compact[item.name] = to_dict(item_value)
+        return compact
+    if isinstance(value, list):
+        return [to_dict(item) for item in value]
+    return value
+
+
+@dataclass(slots=True)
+class ScoredText:
+    content: Optional[str]
+    length: int = 0
+    score: int = 0
+    feedback: list = field(default_factory=list)
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(result.get('content'), result.get('length', 0), result.get('score', 0),
+                   list(result.get('feedback', [])))
+
+
+@dataclass(slots=True)
+class Headings:
+    h1_count: int = 0
+    h1_content: list = field(default_factory=list)
+    h2_count: int = 0
+    h3_count: int = 0
+    score: int = 0
+    feedback: list = field(default_factory=list)
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(result.get('h1_count', 0), list(result.get('h1_content', [])), result.get('h2_count', 0),
+                   result.get('h3_count', 0), result.get('score', 0), list(result.get('feedback', [])))
+
+
+@dataclass(slots=True)
+class SeoResult:
+    title: ScoredText
+    meta_description: ScoredText
+    headings: Headings
+    internal_links: int = 0
+    external_links: int = 0
+    image_count: int = 0
+    images_missing_alt: int = 0
+    has_viewport: bool = False
+    canonical: Optional[str] = None
+    overall_score: int = 0
+    recommendations: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from the dictionary returned by analyze_seo"""
+        links = result.get('links', {})
+        images = result.get('images', {})
+        return cls(
+            title=ScoredText.from_result(result.get('title', {})),
+            meta_description=ScoredText.from_result(result.get('meta_description', {})),
+            headings=Headings.from_result(result.get('headings', {})),
+            internal_links=links.get('internal_count', 0),
+            external_links=links.get('external_count', 0),
+            image_count=images.get('total_count', 0),
+            images_missing_alt=images.get('missing_alt_count', 0),
+            has_viewport=result.get('mobile', {}).get('has_viewport', False),
+            canonical=result.get('canonical'),
+            overall_score=result.get('overall_score', 0),
+            recommendations=list(result.get('recommendations', [])),
+            error=result.get('error'),
+        )
+
+
+@dataclass(slots=True)
+class Keyword:
+    word: str
+    count: int
+    density: float
+
+
+@dataclass(slots=True)
+class Keyphrase:
+    phrase: str
+    words: int
+    count: int
+    density: float
+
+
+@dataclass(slots=True)
+class ContentResult:
+    word_count: int = 0
+    paragraph_count: int = 0
+    sentence_count: int = 0
+    top_keywords: list = field(default_factory=list)
+    top_phrases: list = field(default_factory=list)
+    readability_score: float = 0
+    readability_level: str = 'Unknown'
+    content_score: float = 0
+    feedback: list = field(default_factory=list)
+    recommendations: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from the dictionary returned by analyze_content"""
+        readability = result.get('readability', {})
+        return cls(
+            word_count=result.get('word_count', 0),
+            paragraph_count=result.get('paragraph_count', 0),
+            sentence_count=result.get('sentence_count', 0),
+            top_keywords=[Keyword(kw['word'], kw['count'], kw['density']) for kw in result.get('top_keywords', [])],
+            top_phrases=[Keyphrase(kp['phrase'], kp['words'], kp['count'], kp['density'])
+                         for kp in result.get('top_phrases', [])],
+            readability_score=readability.get('score', 0),
+            readability_level=readability.get('level', 'Unknown'),
+            content_score=result.get('content_score', 0),
+            feedback=list(result.get('feedback', [])),
+            recommendations=list(result.get('recommendations', [])),
+            error=result.get('error'),
+        )
+
+
+@dataclass(slots=True)
+class SpeedMetric:
+    score: Optional[int]
+    value: Optional[str]
+    raw_value: Optional[float]
+
+    @classmethod
+    def from_result(cls, result):
+        if not result:
+            return None
+        return cls(result.get('score'), result.get('value'), result.get('raw_value'))
+
+
+@dataclass(slots=True)
+class Audit:
+    title: str
+    score: int
+    description: Optional[str] = None
+
+
+SPEED_METRICS = ('first_contentful_paint', 'speed_index', 'largest_contentful_paint', 'time_to_interactive',
+                 'total_blocking_time', 'cumulative_layout_shift')
+
+
+@dataclass(slots=True)
+class SpeedResult:
+    performance_score: Optional[int] = None
+    first_contentful_paint: Optional[SpeedMetric] = None
+    speed_index: Optional[SpeedMetric] = None
+    largest_contentful_paint: Optional[SpeedMetric] = None
+    time_to_interactive: Optional[SpeedMetric] = None
+    total_blocking_time: Optional[SpeedMetric] = None
+    cumulative_layout_shift: Optional[SpeedMetric] = None
+    opportunities: list = field(default_factory=list)
+    passed_audits: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from the dictionary returned by check_page_speed"""
+        return cls(
+            performance_score=result.get('performance_score'),
+            **{name: SpeedMetric.from_result(result.get(name)) for name in SPEED_METRICS},
+            opportunities=[Audit(audit['title'], audit['score'], audit.get('description'))
+                           for audit in result.get('opportunities', [])],
+            passed_audits=[Audit(audit['title'], audit['score']) for audit in result.get('passed_audits', [])],
+            error=result.get('error'),
+        )
+
+
+@dataclass(slots=True)
+class SiteMetrics:
+    url: str
+    domain: str
+    is_main: bool = False
+    seo_score: int = 0
+    content_score: float = 0
+    performance_score: Optional[int] = None
+    word_count: int = 0
+    readability: float = 0
+    title_length: int = 0
+    meta_desc_length: int = 0
+    h1: int = 0
+    h2: int = 0
+    h3: int = 0
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(**{item.name: result[item.name] for item in fields(cls) if item.name in result})
+
+
+@dataclass(slots=True)
+class KeywordOverlap:
+    keyword: str
+    densities: list
+    site_count: int
+
+
+@dataclass(slots=True)
+class ComparisonResult:
+    main_domain: str
+    competitor_domains: list = field(default_factory=list)
+    sites: list = field(default_factory=list)
+    keyword_overlap: list = field(default_factory=list)
+    insights: list = field(default_factory=list)
+    recommendations: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from the dictionary returned by compare_with_competitors"""
+        domains = result.get('domains', {})
+        return cls(
+            main_domain=domains.get('main'),
+            competitor_domains=list(domains.get('competitors', [])),
+            sites=[SiteMetrics.from_result(site) for site in result.get('sites', [])],
+            keyword_overlap=[KeywordOverlap(kw['keyword'], list(kw['densities']), kw['site_count'])
+                             for kw in result.get('keyword_overlap', [])],
+            insights=list(result.get('insights', [])),
+            recommendations=list(result.get('recommendations', [])),
+            error=result.get('error'),
+        )
+
+
+@dataclass(slots=True)
+class LinkCheck:
+    url: str
+    final_url: str
+    status_code: Optional[int] = None
+    redirects: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        return cls(result['url'], result['final_url'], result.get('status_code'),
+                   [dict(hop) for hop in result.get('redirects', [])], result.get('error'))
+
+
+@dataclass(slots=True)
+class LinkHealthResult:
+    checked_count: int = 0
+    broken_count: int = 0
+    redirect_count: int = 0
+    broken: list = field(default_factory=list)
+    redirected: list = field(default_factory=list)
+    score: int = 0
+    recommendations: list = field(default_factory=list)
+    error: Optional[str] = None
+
+    @classmethod
+    def from_result(cls, result):
+        """Build from the dictionary returned by analyze_links"""
+        return cls(
+            checked_count=result.get('checked_count', 0),
+            broken_count=result.get('broken_count', 0),
+            redirect_count=result.get('redirect_count', 0),
+            broken=[LinkCheck.from_result(link) for link in result.get('broken', [])],
+            redirected=[LinkCheck.from_result(link) for link in result.get('redirected', [])],
+            score=result.get('score', 0),
+            recommendations=list(result.get('recommendations', [])),
+            error=result.get('error'),
+        )
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    id: str
+    url: str
+    status: str
+    basic_seo: Optional[SeoResult] = None
+    content_analysis: Optional[ContentResult] = None
+    speed_results: Optional[SpeedResult] = None
+    competitor_analysis: Optional[ComparisonResult] = None
+    competitor_urls: list = field(default_factory=list)
+    link_health: Optional[LinkHealthResult] = None
+    timed_out_stages: list = field(default_factory=list)
+    timings: Optional[dict] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_job(cls, job, with_timings=False):
+        """Build from an analysis job as returned by JobQueue.get(with_result=True)"""
+        result = job.get('result') or {}
+        return cls(
+            id=job['id'],
+            url=job['params']['url'],
+            status=job['status'],
+            basic_seo=SeoResult.from_result(result['basic_seo']) if result.get('basic_seo') else None,
+            content_analysis=(ContentResult.from_result(result['content_analysis'])
+                              if result.get('content_analysis') else None),
+            speed_results=SpeedResult.from_result(result['speed_results']) if result.get('speed_results') else None,
+            competitor_analysis=(ComparisonResult.from_result(result['competitor_analysis'])
+                                 if result.get('competitor_analysis') else None),
+            competitor_urls=job_competitor_urls(job['params']),
+            link_health=LinkHealthResult.from_result(result['link_health']) if result.get('link_health') else None,
+            timed_out_stages=list(result.get('timed_out_stages', [])),
+            timings=result.get('timings') if with_timings else None,
+            error=job.get('error'),
+        )
+
+
+def job_competitor_urls(params):
+    """Competitor URLs of an analysis job, including jobs queued with a single 'competitor_url'"""
+    if params.get('competitor_urls') is not None:
+        return list(params['competitor_urls'])
+    return [params['competitor_url']] if params.get('competitor_url') else []
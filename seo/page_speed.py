@@ -1,39 +1,26 @@
-import requests
 import logging
-import os
-import time
+
+from seo.pagespeed_client import get_client, PageSpeedError
 
 logger = logging.getLogger(__name__)
 
-def check_page_speed(url):
+def check_page_speed(url, document=None, timeout=30):
     """
     Check page speed metrics using Google PageSpeed Insights API
+    When a fetched document is given, its final URL is tested and an
+    unreachable page is reported without spending an API call
     Returns page speed metrics and suggestions for improvement
     """
     try:
-        api_key = os.environ.get('PAGESPEED_API_KEY', '')
-        api_url = f"https://www.googleapis.com/pagespeedonline/v5/runPagespeed?url={url}&strategy=mobile"
-        if api_key:
-            api_url += f"&key={api_key}"
-        
-        response = requests.get(api_url, timeout=30)
-        
-        if response.status_code != 200:
-            logger.warning(f"PageSpeed API error: Status {response.status_code}")
-            return {
-                'error': f"PageSpeed API error: Status {response.status_code}",
-                'performance_score': None,
-                'first_contentful_paint': None,
-                'speed_index': None,
-                'largest_contentful_paint': None,
-                'time_to_interactive': None,
-                'total_blocking_time': None,
-                'cumulative_layout_shift': None,
-                'opportunities': [],
-                'passed_audits': []
-            }
+        if document is not None:
+            document.raise_for_status()
+            url = document.final_url
         
-        data = response.json()
+        try:
+            data = get_client().run(url, timeout=timeout)
+        except PageSpeedError as e:
+            logger.warning(f"{str(e)} for {url}")
+            return speed_error_result(str(e))
         
         lighthouse_result = data.get('lighthouseResult', {})
         categories = lighthouse_result.get('categories', {})
@@ -112,15 +99,20 @@ def check_page_speed(url):
         
     except Exception as e:
         logger.error(f"Error checking page speed for {url}: {str(e)}", exc_info=True)
-        return {
-            'error': str(e),
-            'performance_score': None,
-            'first_contentful_paint': None,
-            'speed_index': None,
-            'largest_contentful_paint': None,
-            'time_to_interactive': None,
-            'total_blocking_time': None,
-            'cumulative_layout_shift': None,
-            'opportunities': [],
-            'passed_audits': []
-        }
+        return speed_error_result(str(e))
+
+
+def speed_error_result(error):
+    """Result returned by check_page_speed when no metrics are available"""
+    return {
+        'error': error,
+        'performance_score': None,
+        'first_contentful_paint': None,
+        'speed_index': None,
+        'largest_contentful_paint': None,
+        'time_to_interactive': None,
+        'total_blocking_time': None,
+        'cumulative_layout_shift': None,
+        'opportunities': [],
+        'passed_audits': []
+    }
@@ -0,0 +1,229 @@
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future
+
+import requests
+
+from seo.cache import create_cache, make_cache_key
+from seo.http_client import get_session, make_timeout
+from seo.metrics import PAGESPEED_CALLS, STAGE_ERRORS, timed
+from seo.utils import data_path
+
+logger = logging.getLogger(__name__)
+
+PAGESPEED_API_URL = os.environ.get('PAGESPEED_API_URL', 'https://www.googleapis.com/pagespeedonline/v5/runPagespeed')
+PAGESPEED_RATE = float(os.environ.get('PAGESPEED_RATE', '4'))
+PAGESPEED_BURST = int(os.environ.get('PAGESPEED_BURST', '4'))
+PAGESPEED_MAX_RETRIES = int(os.environ.get('PAGESPEED_MAX_RETRIES', '3'))
+PAGESPEED_CACHE_TTL = int(os.environ.get('PAGESPEED_CACHE_TTL', '21600'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+AUDIT_FIELDS = ('title', 'description', 'score', 'scoreDisplayMode', 'displayValue', 'numericValue')
+
+
+class PageSpeedError(Exception):
+    """Raised when the PageSpeed API does not return a usable result"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter shared by every thread and process on this machine
+    The bucket's level is kept in SQLite under its name, so web workers, job
+    workers and batch pool processes draw from one quota instead of each
+    getting the full rate
+    """
+
+    def __init__(self, rate, capacity, name='pagespeed', path=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+        self.path = path or data_path('rate_limits.sqlite3')
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS token_buckets ("
+            "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _take(self):
+        """Take a token if one is available; returns the seconds until the next one otherwise"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at FROM token_buckets WHERE name = ?", (self.name,)).fetchone()
+            tokens = float(self.capacity) if row is None else row[0] + max(0.0, now - row[1]) * self.rate
+            tokens = min(self.capacity, tokens)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute("INSERT OR REPLACE INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?)",
+                         (self.name, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def acquire(self, timeout=None):
+        """Take one token, waiting up to timeout seconds; returns False if none became available"""
+        give_up_at = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if give_up_at is not None and time.monotonic() + wait > give_up_at:
+                return False
+            time.sleep(wait)
+
+
+def trim_lighthouse_result(data):
+    """Keep only the parts of a PageSpeed response used by check_page_speed"""
+    lighthouse_result = data.get('lighthouseResult', {})
+    performance = lighthouse_result.get('categories', {}).get('performance', {})
+    audits = {
+        audit_id: {field: audit[field] for field in AUDIT_FIELDS if field in audit}
+        for audit_id, audit in lighthouse_result.get('audits', {}).items()
+    }
+    categories = {'performance': {'score': performance['score']}} if 'score' in performance else {}
+    return {'lighthouseResult': {'categories': categories, 'audits': audits}}
+
+
+class PageSpeedClient:
+    """
+    Client for the PageSpeed Insights API
+    Concurrent requests for the same URL share one API call, calls are paced by
+    a token bucket sized to the API quota, 429 and 5xx responses are retried
+    with jittered exponential backoff, and results are cached for hours
+    """
+
+    def __init__(self, api_url=PAGESPEED_API_URL, api_key=None, rate=PAGESPEED_RATE, burst=PAGESPEED_BURST,
+                 max_retries=PAGESPEED_MAX_RETRIES, cache=None, session=None):
+        self.api_url = api_url
+        self.api_key = api_key if api_key is not None else os.environ.get('PAGESPEED_API_KEY', '')
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate, burst, name='pagespeed')
+        self.cache = cache if cache is not None else create_cache('pagespeed', ttl=PAGESPEED_CACHE_TTL)
+        self.session = session
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.stats = {'api_calls': 0, 'cache_hits': 0, 'coalesced': 0, 'retries': 0, 'rate_limited': 0, 'errors': 0}
+
+    def run(self, url, strategy='mobile', timeout=30):
+        """
+        Return the (trimmed) PageSpeed result for a URL
+        Raises PageSpeedError when no result could be obtained within timeout
+        """
+        key = f"{make_cache_key(url)}|{strategy}"
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            PAGESPEED_CALLS.inc(outcome='cache_hit')
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.stats['coalesced'] += 1
+                PAGESPEED_CALLS.inc(outcome='coalesced')
+
+        if not owner:
+            try:
+                return future.result(timeout=timeout)
+            except TimeoutError:
+                raise PageSpeedError("Timed out waiting for PageSpeed result")
+
+        try:
+            result = self._fetch(url, strategy, timeout)
+            self.cache.set(key, result)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _fetch(self, url, strategy, timeout):
+        give_up_at = time.monotonic() + timeout
+        params = {'url': url, 'strategy': strategy}
+        if self.api_key:
+            params['key'] = self.api_key
+
+        attempt = 0
+        while True:
+            remaining = give_up_at - time.monotonic()
+            if not self.bucket.acquire(timeout=remaining):
+                self.stats['rate_limited'] += 1
+                PAGESPEED_CALLS.inc(outcome='throttled')
+                STAGE_ERRORS.inc(stage='pagespeed')
+                raise PageSpeedError("PageSpeed API rate limit reached, try again later", status_code=429)
+
+            self.stats['api_calls'] += 1
+            retry_after = None
+            try:
+                session = self.session or get_session()
+                with timed('pagespeed'):
+                    response = session.get(self.api_url, params=params,
+                                           timeout=make_timeout(max(0.1, give_up_at - time.monotonic())))
+                PAGESPEED_CALLS.inc(outcome=response.status_code)
+                if response.status_code == 200:
+                    return trim_lighthouse_result(response.json())
+                error = PageSpeedError(f"PageSpeed API error: Status {response.status_code}", response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    self.stats['errors'] += 1
+                    STAGE_ERRORS.inc(stage='pagespeed')
+                    raise error
+                if response.status_code == 429:
+                    self.stats['rate_limited'] += 1
+                retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                PAGESPEED_CALLS.inc(outcome='error')
+                error = PageSpeedError(f"PageSpeed API request failed: {str(e)}")
+
+            delay = min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay >= give_up_at:
+                self.stats['errors'] += 1
+                STAGE_ERRORS.inc(stage='pagespeed')
+                raise error
+            self.stats['retries'] += 1
+            logger.warning(f"{error}; retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Shared PageSpeed client for this process"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PageSpeedClient()
+    return _client
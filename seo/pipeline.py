@@ -0,0 +1,119 @@
+import os
+import time
+import logging
+
+from seo.analyzer import analyze_seo, seo_error_result
+from seo.content import analyze_content, content_error_result
+from seo.page_speed import check_page_speed, speed_error_result
+from seo.competitors import compare_with_competitors, comparison_error_result
+from seo.links import analyze_links, links_error_result
+from seo.rules import rescore_section
+from seo.fetcher import fetch_document
+from seo.snapshots import load_snapshot, save_snapshot, conditional_headers, is_unchanged
+from seo.stages import Deadline, Stage, Once, run_stages
+from seo.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_DEADLINE = float(os.environ.get('SEO_ANALYSIS_DEADLINE', '45'))
+
+
+def run_analysis(url, competitor_urls=None, deadline=None, on_result=None, check_links=False):
+    """
+    Run every analysis stage for a URL concurrently
+    All stages share one deadline; a stage that runs out of time contributes
+    a timed out result instead of delaying the response. on_result receives
+    each stage's name and result as soon as it is available.
+    A page that is unchanged since its last analysis (304 or same content
+    hash) reuses the stored SEO and content results instead of re-parsing.
+    competitor_urls is a list of competitor URLs (a single URL is accepted too);
+    the comparison reuses the main page's stage results.
+    check_links adds the link health stage, which checks every link on the page.
+    Returns the combined results dictionary rendered by the results page,
+    including the time in seconds each stage took under 'timings'
+    """
+    started = time.perf_counter()
+    if isinstance(competitor_urls, str):
+        competitor_urls = [competitor_urls]
+    competitor_urls = list(competitor_urls or [])
+    if deadline is None:
+        deadline = Deadline(ANALYSIS_DEADLINE)
+    timings = {}
+
+    def fetch():
+        fetch_started = time.perf_counter()
+        try:
+            return fetch_document(url, timeout=deadline.timeout(10), headers=conditional_headers(snapshot))
+        finally:
+            timings['fetch'] = round(time.perf_counter() - fetch_started, 4)
+
+    snapshot = load_snapshot(url)
+    document = Once(fetch)
+    unchanged = Once(lambda: is_unchanged(snapshot, document.get()))
+
+    def reuse_or(key, analyze):
+        if unchanged.get():
+            logger.debug(f"{url} is unchanged, reusing stored {key}")
+            # Stored signals are scored again, so rule changes apply without re-parsing
+            return rescore_section(key, snapshot[key])
+        return analyze(url, document.get())
+
+    basic_seo = Once(lambda: reuse_or('basic_seo', analyze_seo))
+    # Only pages analyzed here count towards the keyword index's document frequencies
+    content_analysis = Once(lambda: reuse_or(
+        'content_analysis', lambda url, document: analyze_content(url, document, index=True)))
+    speed_results = Once(lambda: check_page_speed(url, timeout=deadline.timeout(30)))
+
+    stages = [
+        Stage('basic_seo', basic_seo.get, seo_error_result),
+        Stage('content_analysis', content_analysis.get, content_error_result),
+        Stage('speed_results', speed_results.get, speed_error_result),
+    ]
+    if competitor_urls:
+        main_results = lambda: {'basic_seo': basic_seo.get(), 'content_analysis': content_analysis.get(),
+                                'speed_results': speed_results.get()}
+        stages.append(Stage(
+            'competitor_analysis',
+            lambda: compare_with_competitors(url, competitor_urls, main_results=main_results, deadline=deadline),
+            lambda error: comparison_error_result(url, competitor_urls, error)
+        ))
+
+    if check_links:
+        # A 304 response has no body to take the links from
+        link_document = lambda: None if document.get().not_modified else document.get()
+        stages.append(Stage(
+            'link_health',
+            lambda: analyze_links(url, link_document(), deadline=deadline),
+            links_error_result
+        ))
+
+    for stage in stages:
+        stage.func = timed_stage(stage.name, stage.func, timings)
+    stage_results, timed_out = run_stages(stages, deadline, on_result)
+
+    if 'basic_seo' not in timed_out and 'content_analysis' not in timed_out:
+        try:
+            save_snapshot(url, document.get(), stage_results['basic_seo'], stage_results['content_analysis'],
+                          previous=snapshot)
+        except Exception as e:
+            logger.error(f"Error storing snapshot of {url}: {str(e)}", exc_info=True)
+
+    return {
+        'url': url,
+        'basic_seo': stage_results['basic_seo'],
+        'content_analysis': stage_results['content_analysis'],
+        'speed_results': stage_results['speed_results'],
+        'competitor_analysis': stage_results.get('competitor_analysis'),
+        'competitor_urls': competitor_urls,
+        'link_health': stage_results.get('link_health'),
+        'timed_out_stages': timed_out,
+        'timings': dict(timings, total=round(time.perf_counter() - started, 4)),
+    }
+
+
+def timed_stage(name, func, timings):
+    """Wrap a stage function so its duration is recorded in metrics and timings"""
+    def run():
+        with timed(name, timings):
+            return func()
+    return run
@@ -0,0 +1,401 @@
+"""
+Offline replay of archived pages through the analysis pipeline
+Pages come from WARC files (plain or per-record gzipped), HAR exports or a
+directory of saved HTML files, so earlier crawls can be re-scored without
+any network access
+"""
+import os
+import json
+import mmap
+import zlib
+import base64
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from requests import HTTPError
+from requests.structures import CaseInsensitiveDict
+
+from seo.batch import analyze_document
+from seo.fetcher import FetchedDocument
+from seo.http_client import detect_encoding, MAX_BODY_BYTES
+from seo.sitemap import parse_lastmod
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_SUFFIX = '.idx'
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+HTML_EXTENSIONS = ('.html', '.htm')
+_SCAN_CHUNK = 65536
+
+
+def _parse_headers(lines):
+    headers = CaseInsensitiveDict()
+    for line in lines:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip()] = value.strip()
+    return headers
+
+
+def _split_head(data):
+    """Header lines and the offset of the body of an HTTP or WARC message"""
+    end = data.find(b'\r\n\r\n')
+    separator = 4
+    if end < 0:
+        end = data.find(b'\n\n')
+        separator = 2
+    if end < 0:
+        return None, len(data)
+    return data[:end].decode('iso-8859-1').splitlines(), end + separator
+
+
+def _dechunk(body):
+    """Body of a response sent with chunked transfer encoding"""
+    parts = []
+    pos = 0
+    while True:
+        line_end = body.find(b'\r\n', pos)
+        if line_end < 0:
+            break
+        size = int(body[pos:line_end].split(b';')[0] or b'0', 16)
+        if size == 0:
+            break
+        parts.append(body[line_end + 2:line_end + 2 + size])
+        pos = line_end + 2 + size + 2
+    return b''.join(parts)
+
+
+def _decode_body(headers, body):
+    """Undo transfer and content encodings recorded with an archived response"""
+    if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+        body = _dechunk(body)
+    encoding = headers.get('Content-Encoding', '').lower().strip()
+    if encoding in ('gzip', 'x-gzip'):
+        body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, MAX_BODY_BYTES + 1)
+    elif encoding == 'deflate':
+        body = zlib.decompressobj().decompress(body, MAX_BODY_BYTES + 1)
+    elif encoding == 'br':
+        if brotli is None:
+            raise ValueError("Body is brotli-encoded; install the brotli package to replay it")
+        body = brotli.decompress(body)
+    return body
+
+
+def make_document(url, status_code, headers, body, fetched_at=None):
+    """
+    FetchedDocument for an archived response, cut off at MAX_BODY_BYTES like a live fetch
+    Archived 4xx and 5xx responses carry an error, as a live fetch of them would;
+    fetched_at is the Unix time the response was archived, when known
+    """
+    truncated = len(body) > MAX_BODY_BYTES
+    if truncated:
+        body = body[:MAX_BODY_BYTES]
+    error = None
+    if status_code and status_code >= 400:
+        error = HTTPError(f"{status_code} Error (archived) for url: {url}")
+    return FetchedDocument(url, status_code=status_code, headers=headers, content=body,
+                           encoding=detect_encoding(headers, body), error=error, truncated=truncated,
+                           fetched_at=fetched_at)
+
+
+def is_redirect(document):
+    return document.status_code is not None and 300 <= document.status_code < 400
+
+
+def is_html(headers):
+    content_type = headers.get('Content-Type', '').split(';')[0].strip().lower()
+    return not content_type or content_type in HTML_TYPES
+
+
+class WarcArchive:
+    """
+    Response records of a WARC file, read through a memory map
+    The first pass over the file writes an offset index next to it
+    (<file>.idx: offset, length and URL of each HTML response record), so
+    later runs and every worker process seek straight to a record instead of
+    parsing the archive again. Each record of a .warc.gz is its own gzip
+    member and is inflated on its own.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.compressed = path.endswith('.gz')
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def _index_header(self):
+        stat = os.stat(self.path)
+        return f"# {stat.st_size} {stat.st_mtime_ns}\n"
+
+    def records(self):
+        """Yield (key, url) of each HTML response record; the key is an (offset, length) pair"""
+        index_path = self.path + INDEX_SUFFIX
+        header = self._index_header()
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as index:
+                if index.readline() == header:
+                    for line in index:
+                        offset, length, url = line.rstrip('\n').split('\t', 2)
+                        yield (int(offset), int(length)), url
+                    return
+        try:
+            index = open(index_path + '.tmp', 'w', encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"Cannot write WARC index {index_path}: {str(e)}")
+            index = None
+        try:
+            if index:
+                index.write(header)
+            for offset, length, url in self._scan():
+                if index:
+                    index.write(f"{offset}\t{length}\t{url}\n")
+                yield (offset, length), url
+        except BaseException:
+            if index:
+                index.close()
+                os.remove(index_path + '.tmp')
+            raise
+        if index:
+            index.close()
+            os.replace(index_path + '.tmp', index_path)
+
+    def _scan(self):
+        """Offset, length and target URL of each HTML response record, in file order"""
+        scan = self._scan_members if self.compressed else self._scan_plain
+        for offset, length, warc_headers, http_head in scan():
+            if warc_headers.get('WARC-Type') != 'response' or not warc_headers.get('WARC-Target-URI'):
+                continue
+            http_lines, _ = _split_head(http_head)
+            if not http_lines or not is_html(_parse_headers(http_lines[1:])):
+                continue
+            yield offset, length, warc_headers['WARC-Target-URI'].strip('<>')
+
+    def _scan_plain(self):
+        data = self._map
+        pos = 0
+        while True:
+            pos = data.find(b'WARC/', pos)
+            if pos < 0:
+                return
+            head_end = data.find(b'\r\n\r\n', pos)
+            if head_end < 0:
+                return
+            warc_headers = _parse_headers(data[pos:head_end].decode('iso-8859-1').splitlines()[1:])
+            end = head_end + 4 + int(warc_headers.get('Content-Length', 0))
+            yield pos, end - pos, warc_headers, data[head_end + 4:min(end, head_end + 4 + _SCAN_CHUNK)]
+            pos = end
+
+    def _scan_members(self):
+        data = self._map
+        pos = 0
+        while pos < len(data):
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            head = b''
+            read = pos
+            while not decompressor.eof and read < len(data):
+                chunk = data[read:read + _SCAN_CHUNK]
+                read += len(chunk)
+                # Only the WARC and HTTP headers are kept; the rest is inflated just to find the member end
+                while chunk and not decompressor.eof:
+                    piece = decompressor.decompress(chunk, _SCAN_CHUNK)
+                    if len(head) < _SCAN_CHUNK:
+                        head += piece
+                    chunk = decompressor.unconsumed_tail
+            if not decompressor.eof:
+                decompressor.flush()
+            if not decompressor.eof:
+                logger.warning(f"Truncated gzip member at offset {pos} of {self.path}")
+                return
+            end = read - len(decompressor.unused_data)
+            lines, body_start = _split_head(head)
+            if lines:
+                yield pos, end - pos, _parse_headers(lines[1:]), head[body_start:]
+            pos = end
+
+    def document(self, key):
+        """FetchedDocument of the record at an (offset, length) key"""
+        offset, length = key
+        record = self._map[offset:offset + length]
+        if self.compressed:
+            # Inflated only as far as a body of MAX_BODY_BYTES plus room for the headers
+            record = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(record, MAX_BODY_BYTES + _SCAN_CHUNK)
+        lines, block_start = _split_head(record)
+        warc_headers = _parse_headers(lines[1:])
+        block = record[block_start:block_start + int(warc_headers.get('Content-Length', len(record)))]
+        http_lines, body_start = _split_head(block)
+        headers = _parse_headers(http_lines[1:])
+        status_code = int(http_lines[0].split()[1])
+        return make_document(warc_headers['WARC-Target-URI'].strip('<>'), status_code, headers,
+                             _decode_body(headers, block[body_start:]), parse_lastmod(warc_headers.get('WARC-Date')))
+
+
+class HarArchive:
+    """
+    HTML responses recorded in a HAR export
+    Unlike WARC files, a HAR is one JSON document with no offset index: every
+    worker process parses and holds the whole file, so memory grows with the
+    HAR's size times the number of processes. Use WARC for large captures
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, encoding='utf-8') as f:
+            self.entries = json.load(f)['log']['entries']
+
+    def records(self):
+        """Yield (key, url) of each HTML response; the key is the entry's position"""
+        for position, entry in enumerate(self.entries):
+            response = entry.get('response', {})
+            content = response.get('content', {})
+            if content.get('text') is None or not is_html({'Content-Type': content.get('mimeType', '')}):
+                continue
+            yield position, entry['request']['url']
+
+    def document(self, key):
+        entry = self.entries[key]
+        response = entry['response']
+        content = response['content']
+        # Bodies are already decoded in a HAR; the recorded encoding headers no longer apply
+        headers = CaseInsensitiveDict({header['name']: header['value'] for header in response.get('headers', [])
+                                       if header['name'].lower() not in ('content-encoding', 'transfer-encoding')})
+        headers.setdefault('Content-Type', content.get('mimeType', ''))
+        if content.get('encoding') == 'base64':
+            body = base64.b64decode(content['text'])
+        else:
+            # HAR stores text bodies decoded; re-encode them as UTF-8 and say so
+            body = content['text'].encode('utf-8')
+            headers['Content-Type'] = headers['Content-Type'].split(';')[0] + '; charset=utf-8'
+        return make_document(entry['request']['url'], response.get('status'), headers, body,
+                             parse_lastmod(entry.get('startedDateTime')))
+
+
+class SnapshotDirectory:
+    """
+    Saved HTML files under a directory
+    A page's URL, status code and headers come from a sibling <file>.json
+    ({"url": ..., "status_code": ..., "headers": {...}}); without one the
+    URL is derived from the path, as laid out by `wget --mirror`
+    (example.com/about/index.html is https://example.com/about/)
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def records(self):
+        """Yield (key, url) of each saved page; the key is its path relative to the directory"""
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(HTML_EXTENSIONS):
+                    relative = os.path.relpath(os.path.join(root, name), self.path)
+                    yield relative, self._metadata(relative).get('url') or self._path_url(relative)
+
+    def _metadata(self, relative):
+        metadata_path = os.path.join(self.path, relative + '.json')
+        if not os.path.exists(metadata_path):
+            return {}
+        with open(metadata_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _path_url(relative):
+        path = relative.replace(os.sep, '/')
+        if path.endswith('/index.html'):
+            path = path[:-len('index.html')]
+        return 'https://' + path
+
+    def document(self, key):
+        metadata = self._metadata(key)
+        path = os.path.join(self.path, key)
+        with open(path, 'rb') as f:
+            body = f.read(MAX_BODY_BYTES + 1)
+        headers = CaseInsensitiveDict(metadata.get('headers') or {})
+        # A saved page was archived when its file was written
+        return make_document(metadata.get('url') or self._path_url(key), metadata.get('status_code', 200),
+                             headers, body, os.path.getmtime(path))
+
+
+def open_archive(path):
+    """Archive reader for a WARC file, a HAR file or a snapshot directory"""
+    if os.path.isdir(path):
+        return SnapshotDirectory(path)
+    if path.endswith('.har'):
+        return HarArchive(path)
+    if path.endswith(('.warc', '.warc.gz')):
+        return WarcArchive(path)
+    raise ValueError(f"Unsupported archive: {path} (expected .warc, .warc.gz, .har or a directory)")
+
+
+_archives = {}
+
+
+def _get_archive(path):
+    """Archive reader of the current process, opened once per archive"""
+    key = (os.getpid(), path)
+    archive = _archives.get(key)
+    if archive is None:
+        archive = _archives[key] = open_archive(path)
+    return archive
+
+
+def analyze_record(path, key, url):
+    """
+    Analyze one archived page in a worker process
+    Only the archive path and record key cross the process boundary; the
+    worker reads the record from its own memory map. Error responses are
+    reported like failed fetches; redirects return None, since their target
+    is archived as a record of its own
+    """
+    try:
+        document = _get_archive(path).document(key)
+        if document.error is not None:
+            return {'url': url, 'error': str(document.error)}
+        if is_redirect(document):
+            logger.debug(f"Skipping archived redirect {url} -> {document.headers.get('Location')}")
+            return None
+        return analyze_document(document)
+    except Exception as e:
+        logger.error(f"Error replaying {url} from {path}: {str(e)}", exc_info=True)
+        return {'url': url, 'error': str(e)}
+
+
+def iter_replay(path, processes=None, skip=None):
+    """
+    Analyze every page of an archive and yield one result dictionary per page as each finishes
+    Records are read lazily from the offset index, so only a bounded window of
+    pages is in flight at any time. Pages whose URL is in skip are not analyzed,
+    and archived redirects yield no result. Pool processes are spawned, as in batches
+    """
+    processes = processes or os.cpu_count() or 1
+    max_analyses = processes * 4
+    path = os.path.abspath(path)
+    records = iter(_get_archive(path).records())
+    analyses = set()
+
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        exhausted = False
+        while True:
+            while not exhausted and len(analyses) < max_analyses:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                    break
+                key, url = record
+                if skip is not None and url in skip:
+                    continue
+                analyses.add(pool.submit(analyze_record, path, key, url))
+
+            if not analyses:
+                break
+            done, analyses = wait(analyses, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is not None:
+                    yield result
@@ -0,0 +1,304 @@
+"""
+Declarative scoring of pages from their signal vectors
+Extraction turns a page into a flat vector of numeric signals; a ruleset
+(seo/rules.json by default, SEO_RULES_PATH to override) turns signal vectors
+into scores, feedback and recommendations. Each scoring component is a list of
+chains; the first case of a chain whose conditions all hold adds its points and
+feedback, like an if/elif chain. Because results keep their signals, stored
+results can be re-scored after a rules change without fetching or parsing again.
+"""
+import os
+import json
+import logging
+import operator
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+RULES_PATH = os.environ.get('SEO_RULES_PATH') or DEFAULT_RULES_PATH
+RESCORE_BATCH_SIZE = 1024
+
+SIGNALS = {
+    'basic_seo': ('title_length', 'meta_desc_length', 'h1_count', 'h2_count', 'h3_count', 'has_viewport',
+                  'image_count', 'images_missing_alt', 'internal_link_count', 'external_link_count'),
+    'content_analysis': ('word_count', 'paragraph_count', 'sentence_count', 'readability', 'keyword_count',
+                         'top_keyword_density'),
+}
+
+OPS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def seo_signals(signals):
+    """Signal vector of the basic SEO section from a page's extracted signals"""
+    return {
+        'title_length': len(signals['title']) if signals['title'] else 0,
+        'meta_desc_length': len(signals['meta_description']) if signals['meta_description'] else 0,
+        'h1_count': len(signals['h1_content']),
+        'h2_count': signals['h2_count'],
+        'h3_count': signals['h3_count'],
+        'has_viewport': 1 if signals['has_viewport'] else 0,
+        'image_count': signals['image_count'],
+        'images_missing_alt': signals['images_missing_alt'],
+        'internal_link_count': signals['internal_link_count'],
+        'external_link_count': signals['external_link_count'],
+    }
+
+
+def content_signals(stats, top_keywords, readability):
+    """Signal vector of the content section from text statistics"""
+    return {
+        'word_count': stats['word_count'],
+        'paragraph_count': stats['paragraph_count'],
+        'sentence_count': stats['sentence_count'],
+        'readability': readability,
+        'keyword_count': len(top_keywords),
+        'top_keyword_density': top_keywords[0]['density'] if top_keywords else 0,
+    }
+
+
+def signal_vector(section, values):
+    """Signals of a section as a flat list in SIGNALS order"""
+    return [float(values[name]) for name in SIGNALS[section]]
+
+
+def validate_ruleset(ruleset):
+    """Raise ValueError when a ruleset refers to unknown sections, signals, components or operators"""
+    for section, rules in ruleset['sections'].items():
+        if section not in SIGNALS:
+            raise ValueError(f"Unknown section {section!r}")
+        names = [component['name'] for component in rules['components']]
+        cases = [case for component in rules['components'] for chain in component['chains'] for case in chain]
+        cases += [case for chain in rules.get('recommendations', []) for case in chain]
+        for case in cases:
+            for condition in case['when']:
+                if condition['op'] not in OPS:
+                    raise ValueError(f"Unknown operator {condition['op']!r} in {section}")
+                for key in ('signal', 'of'):
+                    if key in condition and condition[key] not in SIGNALS[section]:
+                        raise ValueError(f"Unknown signal {condition[key]!r} in {section}")
+                if 'score' in condition and condition['score'] not in names:
+                    raise ValueError(f"Unknown component {condition['score']!r} in {section}")
+            if case.get('feedback_of') and case['feedback_of'] not in names:
+                raise ValueError(f"Unknown component {case['feedback_of']!r} in {section}")
+    return ruleset
+
+
+_rulesets = {}
+_rulesets_lock = threading.Lock()
+
+
+def load_ruleset(path=None):
+    """Load and validate a ruleset file; each file is read once per process"""
+    path = path or RULES_PATH
+    ruleset = _rulesets.get(path)
+    if ruleset is None:
+        with _rulesets_lock:
+            ruleset = _rulesets.get(path)
+            if ruleset is None:
+                with open(path, encoding='utf-8') as f:
+                    ruleset = _rulesets[path] = validate_ruleset(json.load(f))
+    return ruleset
+
+
+def _python_where(mask, value, otherwise):
+    return value if mask else otherwise
+
+
+def _evaluate(rules, columns, where):
+    """
+    Evaluate a section's rules over signal columns
+    Columns are numbers for one page or equally long arrays for many; `where`
+    selects between values accordingly. Returns the component scores, the
+    index of the matching case of each component chain and of each
+    recommendation chain (-1 when none matched), and the section score
+    """
+    scores = {}
+    choices = {}
+
+    def holds(conditions):
+        mask = True
+        for condition in conditions:
+            left = scores[condition['score']] if 'score' in condition else columns[condition['signal']]
+            right = condition['value']
+            if 'of' in condition:
+                right = right * columns[condition['of']]
+            mask = mask & OPS[condition['op']](left, right)
+        return mask
+
+    def first_match(chain):
+        choice = -1
+        for index in range(len(chain) - 1, -1, -1):
+            choice = where(holds(chain[index]['when']), index, choice)
+        return choice
+
+    for component in rules['components']:
+        score = component.get('base', 0)
+        component_choices = []
+        for chain in component['chains']:
+            choice = first_match(chain)
+            added = 0
+            for index, case in enumerate(chain):
+                added = where(choice == index, case.get('add', 0), added)
+            score = score + added
+            component_choices.append(choice)
+        scores[component['name']] = score
+        choices[component['name']] = component_choices
+
+    aggregate = rules['aggregate']
+    section_score = sum(scores.values())
+    if aggregate['method'] == 'mean':
+        section_score = section_score / len(scores)
+    if 'max' in aggregate:
+        section_score = where(section_score > aggregate['max'], aggregate['max'], section_score)
+
+    recommendations = [first_match(chain) for chain in rules.get('recommendations', [])]
+    return scores, choices, recommendations, section_score
+
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _round(value, rounding):
+    if rounding == 'int':
+        return int(value)
+    return round(float(value), rounding)
+
+
+def _page_scores(rules, values, scores, choices, recommendations, section_score):
+    """Scores, feedback and recommendations of one page from its evaluated choices"""
+    components = {}
+    for component in rules['components']:
+        feedback = []
+        for chain, choice in zip(component['chains'], choices[component['name']]):
+            if choice >= 0 and chain[choice].get('feedback'):
+                feedback.append(chain[choice]['feedback'])
+        components[component['name']] = {'score': _number(scores[component['name']]), 'feedback': feedback}
+
+    texts = []
+    fields = None
+    for chain, choice in zip(rules.get('recommendations', []), recommendations):
+        if choice < 0:
+            continue
+        case = chain[choice]
+        if case.get('feedback_of'):
+            texts.extend(case.get('prefix', '') + feedback for feedback in components[case['feedback_of']]['feedback'])
+        else:
+            if fields is None:
+                fields = {name: _number(value) for name, value in values.items()}
+            texts.append(case['text'].format(**fields))
+
+    return {
+        'components': components,
+        'score': _round(section_score, rules['aggregate'].get('round', 1)),
+        'recommendations': texts,
+    }
+
+
+def score_signals(section, values, ruleset=None):
+    """
+    Score one page's signal vector
+    Returns a dictionary with each component's score and feedback, the
+    section score and the recommendations
+    """
+    rules = (ruleset or load_ruleset())['sections'][section]
+    evaluated = _evaluate(rules, values, _python_where)
+    return _page_scores(rules, values, *evaluated)
+
+
+def score_batch(section, vectors, ruleset=None):
+    """
+    Score many pages' signal vectors (dictionaries of signals) at once
+    Uses NumPy arrays, evaluating every rule once for the whole batch, when
+    available; plain Python otherwise. Returns one score_signals result per page
+    """
+    if not vectors:
+        return []
+    if numpy is None:
+        return [score_signals(section, values, ruleset) for values in vectors]
+
+    rules = (ruleset or load_ruleset())['sections'][section]
+    matrix = numpy.array([signal_vector(section, values) for values in vectors], dtype=numpy.float64)
+    columns = {name: matrix[:, position] for position, name in enumerate(SIGNALS[section])}
+    scores, choices, recommendations, section_score = _evaluate(rules, columns, numpy.where)
+
+    size = len(vectors)
+    # Plain lists make the per-page assembly below much cheaper than indexing arrays
+    broadcast = lambda value: numpy.broadcast_to(value, (size,)).tolist()
+    scores = {name: broadcast(value) for name, value in scores.items()}
+    choices = {name: [broadcast(choice) for choice in chain] for name, chain in choices.items()}
+    recommendations = [broadcast(choice) for choice in recommendations]
+    section_score = broadcast(section_score)
+    return [
+        _page_scores(
+            rules, values,
+            {name: value[row] for name, value in scores.items()},
+            {name: [choice[row] for choice in chain] for name, chain in choices.items()},
+            [choice[row] for choice in recommendations],
+            section_score[row],
+        )
+        for row, values in enumerate(vectors)
+    ]
+
+
+def apply_scores(section, result, scored, ruleset=None):
+    """Write scores, feedback and recommendations into a section's result dictionary"""
+    rules = (ruleset or load_ruleset())['sections'][section]
+    result[rules['score_key']] = scored['score']
+    result['recommendations'] = scored['recommendations']
+    for component in rules['components']:
+        if component.get('result_key'):
+            result.setdefault(component['result_key'], {}).update(scored['components'][component['name']])
+    if rules.get('feedback_key'):
+        result[rules['feedback_key']] = [feedback for component in rules['components']
+                                         for feedback in scored['components'][component['name']]['feedback']]
+    return result
+
+
+def rescore_section(section, result, ruleset=None):
+    """Re-score one stored section result from its signals; results without signals are returned as they are"""
+    if 'error' in result or not result.get('signals'):
+        return result
+    return apply_scores(section, dict(result), score_signals(section, result['signals'], ruleset), ruleset)
+
+
+def rescore_results(results, ruleset=None, batch_size=RESCORE_BATCH_SIZE):
+    """
+    Re-score stored analysis results (dictionaries with 'basic_seo' and
+    'content_analysis', as written by batch, crawl and replay runs) with a
+    ruleset, from the signals they kept; results are updated in place and
+    yielded in order. Sections without signals or with errors are left as they are
+    """
+    ruleset = ruleset or load_ruleset()
+    batch = []
+    for result in results:
+        batch.append(result)
+        if len(batch) >= batch_size:
+            yield from _rescore_batch(batch, ruleset)
+            batch = []
+    yield from _rescore_batch(batch, ruleset)
+
+
+def _rescore_batch(batch, ruleset):
+    for section in ruleset['sections']:
+        targets = [result[section] for result in batch
+                   if isinstance(result.get(section), dict) and 'error' not in result[section]
+                   and result[section].get('signals')]
+        scored = score_batch(section, [target['signals'] for target in targets], ruleset)
+        for target, page in zip(targets, scored):
+            apply_scores(section, target, page, ruleset)
+    return batch
@@ -0,0 +1,433 @@
+"""
+Recurring audits of URL lists, sitemaps and crawls
+Schedules and the state of every scheduled URL are kept in SQLite, so the
+scheduler picks up where it left off after a restart. Each URL runs at a
+fixed phase of its schedule's interval, derived from a hash of the URL, plus
+random jitter, which spreads a large list evenly over the interval. Due URLs
+are dispatched to the job queue within a global and a per-host budget of
+jobs in flight. Hosts whose pages fail to fetch are backed off, and all
+dispatching pauses while the PageSpeed API or page fetches report too many
+errors. Pages whose content has not changed since their last audit are skipped.
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+
+from seo.fetcher import fetch_document
+from seo.jobs import JobQueue, analysis_cache_key, crawl_job_key, ensure_workers, JOB_WORKERS
+from seo.metrics import registry, FETCH_RESPONSES, PAGESPEED_CALLS
+from seo.snapshots import conditional_headers, is_unchanged
+from seo.utils import canonicalize_url, data_path
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_POLL_INTERVAL = float(os.environ.get('SEO_SCHEDULE_POLL_INTERVAL', '5'))
+SCHEDULE_CONCURRENCY = int(os.environ.get('SEO_SCHEDULE_CONCURRENCY', '4'))
+SCHEDULE_PER_HOST = int(os.environ.get('SEO_SCHEDULE_PER_HOST', '1'))
+SCHEDULE_JITTER = float(os.environ.get('SEO_SCHEDULE_JITTER', '0.05'))
+SCHEDULE_MAX_SKIPS = int(os.environ.get('SEO_SCHEDULE_MAX_SKIPS', '6'))
+BACKOFF_BASE = float(os.environ.get('SEO_SCHEDULE_BACKOFF_BASE', '60'))
+BACKOFF_MAX = float(os.environ.get('SEO_SCHEDULE_BACKOFF_MAX', str(6 * 3600)))
+PAGESPEED_LIMIT_SHARE = float(os.environ.get('SEO_SCHEDULE_PAGESPEED_LIMIT', '0.2'))
+FETCH_ERROR_SHARE = float(os.environ.get('SEO_SCHEDULE_ERROR_LIMIT', '0.3'))
+# Error shares are judged over windows of at least this many calls, or this many seconds
+LOAD_WINDOW_CALLS = 20
+LOAD_WINDOW_SECONDS = 600
+
+KINDS = ('urls', 'sitemap', 'crawl')
+PRECHECK_TIMEOUT = 10
+# SQLite limits the number of host parameters in one statement
+_URL_CHUNK = 500
+
+
+def parse_interval(value):
+    """Seconds in an interval such as '3600', '90m', '12h' or '1d'"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+    value = str(value).strip().lower()
+    if value[-1:] in units:
+        seconds = float(value[:-1]) * units[value[-1]]
+    else:
+        seconds = float(value)
+    if seconds <= 0:
+        raise ValueError(f"Invalid interval {value!r}")
+    return seconds
+
+
+def url_phase(url):
+    """Fixed position of a URL within any interval, as a fraction in [0, 1)"""
+    digest = hashlib.blake2b(canonicalize_url(url).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') / 2 ** 64
+
+
+def next_due(url, interval, after, min_gap=0.5, jitter=SCHEDULE_JITTER):
+    """
+    Next run time of a URL after a given time
+    Runs fall on the URL's phase of each interval, at least `min_gap` of an
+    interval after the given time, moved by up to `jitter` of the interval either way
+    """
+    slot = url_phase(url) * interval
+    due = slot + (int((after - slot) // interval) + 1) * interval
+    if due - after < min_gap * interval:
+        due += interval
+    return due + random.uniform(-jitter, jitter) * interval
+
+
+def backoff_delay(failures):
+    """Jittered exponential delay after a number of consecutive failures"""
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, failures - 1)) * random.uniform(0.5, 1.5)
+
+
+class ScheduleStore:
+    """
+    Schedules, scheduled URLs, host backoff and load state stored in SQLite
+    A scheduled URL is 'idle' until it is due and dispatched; it stays
+    'dispatched' while its job is queued or running
+    """
+
+    def __init__(self, path=None):
+        self.path = path or data_path('schedules.sqlite3')
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS schedules ("
+            "id INTEGER PRIMARY KEY, kind TEXT NOT NULL, target TEXT NOT NULL, interval REAL NOT NULL, "
+            "options TEXT NOT NULL, created_at REAL NOT NULL, expanded_at REAL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS scheduled_urls ("
+            "schedule_id INTEGER NOT NULL, url TEXT NOT NULL, host TEXT NOT NULL, due_at REAL NOT NULL, "
+            "status TEXT NOT NULL DEFAULT 'idle', job_id TEXT, last_run_at REAL, last_outcome TEXT, "
+            "content_hash TEXT, etag TEXT, last_modified TEXT, skips INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (schedule_id, url))")
+        conn.execute("CREATE INDEX IF NOT EXISTS scheduled_urls_due ON scheduled_urls (status, due_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS host_backoff ("
+            "host TEXT PRIMARY KEY, failures INTEGER NOT NULL, until REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS scheduler_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add_schedule(self, kind, target, interval, options=None, urls=None):
+        """Create a schedule; a 'urls' schedule takes its URLs now, others when they are expanded"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown schedule kind {kind!r}")
+        conn = self._connect()
+        schedule_id = conn.execute(
+            "INSERT INTO schedules (kind, target, interval, options, created_at) VALUES (?, ?, ?, ?, ?)",
+            (kind, target, interval, json.dumps(options or {}), time.time())).lastrowid
+        if kind == 'crawl':
+            self.set_urls(schedule_id, interval, [target])
+        elif urls is not None:
+            self.set_urls(schedule_id, interval, urls)
+        return schedule_id
+
+    def remove_schedule(self, schedule_id):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            removed = conn.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,)).rowcount
+            conn.execute("DELETE FROM scheduled_urls WHERE schedule_id = ?", (schedule_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return bool(removed)
+
+    def schedules(self):
+        """All schedules with their URL counts"""
+        rows = self._connect().execute(
+            "SELECT s.*, COUNT(u.url) AS url_count, MIN(u.due_at) AS next_due_at, "
+            "SUM(u.status = 'dispatched') AS in_flight "
+            "FROM schedules s LEFT JOIN scheduled_urls u ON u.schedule_id = s.id GROUP BY s.id ORDER BY s.id")
+        return [dict(row, options=json.loads(row['options'])) for row in rows]
+
+    def schedule(self, schedule_id):
+        row = self._connect().execute("SELECT * FROM schedules WHERE id = ?", (schedule_id,)).fetchone()
+        return dict(row, options=json.loads(row['options'])) if row else None
+
+    def set_urls(self, schedule_id, interval, urls, now=None):
+        """
+        Make a schedule's URLs exactly the given ones: new URLs are due at their
+        phase of the coming interval, known URLs keep their state
+        """
+        now = now if now is not None else time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS current_urls (url TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM current_urls")
+            for start in range(0, len(urls), _URL_CHUNK):
+                keys = [canonicalize_url(url) for url in urls[start:start + _URL_CHUNK]]
+                rows = [(key, urlparse(key).netloc, next_due(key, interval, now, min_gap=0)) for key in keys]
+                conn.executemany("INSERT OR IGNORE INTO current_urls VALUES (?)", [row[:1] for row in rows])
+                conn.executemany(
+                    "INSERT OR IGNORE INTO scheduled_urls (schedule_id, url, host, due_at) VALUES (?, ?, ?, ?)",
+                    [(schedule_id, *row) for row in rows])
+            conn.execute(
+                "DELETE FROM scheduled_urls WHERE schedule_id = ? AND status = 'idle' "
+                "AND url NOT IN (SELECT url FROM current_urls)", (schedule_id,))
+            conn.execute("UPDATE schedules SET expanded_at = ? WHERE id = ?", (now, schedule_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def to_expand(self, now):
+        """Sitemap schedules never expanded or last expanded more than an interval ago"""
+        rows = self._connect().execute(
+            "SELECT * FROM schedules WHERE kind = 'sitemap' AND (expanded_at IS NULL OR expanded_at + interval <= ?)",
+            (now,))
+        return [dict(row, options=json.loads(row['options'])) for row in rows]
+
+    def due(self, now, limit):
+        """Idle URLs due by now, of hosts not backed off, earliest first"""
+        return [dict(row) for row in self._connect().execute(
+            "SELECT u.*, s.kind, s.interval, s.options FROM scheduled_urls u JOIN schedules s ON s.id = u.schedule_id "
+            "WHERE u.status = 'idle' AND u.due_at <= ? "
+            "AND u.host NOT IN (SELECT host FROM host_backoff WHERE until > ?) "
+            "ORDER BY u.due_at LIMIT ?", (now, now, limit))]
+
+    def dispatched(self):
+        return [dict(row) for row in self._connect().execute(
+            "SELECT u.*, s.interval FROM scheduled_urls u JOIN schedules s ON s.id = u.schedule_id "
+            "WHERE u.status = 'dispatched'")]
+
+    def update_url(self, schedule_id, url, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE scheduled_urls SET {assignments} WHERE schedule_id = ? AND url = ?",
+                                (*fields.values(), schedule_id, url))
+
+    def host_failed(self, host, now=None):
+        """Back a host off for longer after each consecutive failure"""
+        now = now if now is not None else time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT failures FROM host_backoff WHERE host = ?", (host,)).fetchone()
+        failures = (row['failures'] if row else 0) + 1
+        until = now + backoff_delay(failures)
+        conn.execute("INSERT OR REPLACE INTO host_backoff VALUES (?, ?, ?)", (host, failures, until))
+        logger.warning(f"Backing off {host} for {until - now:.0f}s after {failures} failures")
+
+    def host_succeeded(self, host):
+        self._connect().execute("DELETE FROM host_backoff WHERE host = ?", (host,))
+
+    def get_state(self, key, default=None):
+        row = self._connect().execute("SELECT value FROM scheduler_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def set_state(self, key, value):
+        self._connect().execute("INSERT OR REPLACE INTO scheduler_state VALUES (?, ?)", (key, json.dumps(value)))
+
+
+def load_totals():
+    """
+    PageSpeed calls and rate-limited calls, page fetches and failed fetches,
+    summed over every process from the shared metrics
+    """
+    totals = registry.collect()
+    pagespeed_calls = pagespeed_limited = fetches = fetch_errors = 0
+    for key, value in totals[PAGESPEED_CALLS.name].items():
+        outcome = dict(key)['outcome']
+        if outcome in ('cache_hit', 'coalesced'):
+            continue
+        pagespeed_calls += value
+        if outcome in ('429', 'throttled'):
+            pagespeed_limited += value
+    for key, value in totals[FETCH_RESPONSES.name].items():
+        status = dict(key)['status']
+        fetches += value
+        if status == 'error' or (status.isdigit() and (int(status) >= 500 or int(status) == 429)):
+            fetch_errors += value
+    return {'pagespeed_calls': pagespeed_calls, 'pagespeed_limited': pagespeed_limited,
+            'fetches': fetches, 'fetch_errors': fetch_errors}
+
+
+def load_pressure(previous, current):
+    """
+    Why dispatching should pause, judged from the change between two load
+    totals, or None. Counters of processes that exited may drop out, so
+    negative changes count as zero
+    """
+    change = {key: max(0, current[key] - previous.get(key, 0)) for key in current}
+    if change['pagespeed_calls'] and change['pagespeed_limited'] / change['pagespeed_calls'] > PAGESPEED_LIMIT_SHARE:
+        return f"{change['pagespeed_limited']} of {change['pagespeed_calls']} PageSpeed calls were rate limited"
+    if change['fetches'] and change['fetch_errors'] / change['fetches'] > FETCH_ERROR_SHARE:
+        return f"{change['fetch_errors']} of {change['fetches']} page fetches failed"
+    return None
+
+
+class Scheduler:
+    """Dispatches due scheduled URLs to the job queue within budgets"""
+
+    def __init__(self, store=None, queue=None, concurrency=SCHEDULE_CONCURRENCY, per_host=SCHEDULE_PER_HOST):
+        self.store = store or ScheduleStore()
+        self.queue = queue or JobQueue()
+        self.concurrency = concurrency
+        self.per_host = per_host
+
+    def tick(self, now=None):
+        """One round of collecting finished jobs, checking load, expanding sitemaps and dispatching"""
+        now = now if now is not None else time.time()
+        in_flight = self.collect_finished(now)
+        if self.paused(now):
+            return 0
+        for schedule in self.store.to_expand(now):
+            self.expand(schedule, now)
+        return self.dispatch(in_flight, now)
+
+    def collect_finished(self, now):
+        """Settle URLs whose jobs have finished; returns the number of jobs per host still in flight"""
+        in_flight = {}
+        for row in self.store.dispatched():
+            job = self.queue.get(row['job_id'], with_result=True) if row['job_id'] else None
+            if job is not None and job['status'] in ('queued', 'running'):
+                in_flight[row['host']] = in_flight.get(row['host'], 0) + 1
+                continue
+            outcome = job_outcome(job)
+            fields = {'status': 'idle', 'job_id': None, 'last_run_at': now, 'last_outcome': outcome,
+                      'due_at': next_due(row['url'], row['interval'], now)}
+            if outcome == 'done':
+                self.store.host_succeeded(row['host'])
+            else:
+                # Forget the content hash so the page is audited again, not skipped as unchanged
+                fields['content_hash'] = None
+                self.store.host_failed(row['host'], now)
+            self.store.update_url(row['schedule_id'], row['url'], **fields)
+        return in_flight
+
+    def paused(self, now):
+        """
+        Whether dispatching is paused because of load
+        Load totals are compared once a window has seen enough calls or time;
+        each window under pressure doubles the pause
+        """
+        load = self.store.get_state('load', {})
+        if load.get('paused_until', 0) > now:
+            return True
+        current = load_totals()
+        baseline = load.get('totals')
+        if baseline is None:
+            self.store.set_state('load', dict(load, totals=current, since=now))
+            return False
+        calls = max(current['pagespeed_calls'] - baseline['pagespeed_calls'], current['fetches'] - baseline['fetches'])
+        if calls < LOAD_WINDOW_CALLS and now - load.get('since', now) < LOAD_WINDOW_SECONDS:
+            return False
+        reason = load_pressure(baseline, current)
+        strikes = load.get('strikes', 0) + 1 if reason else 0
+        paused_until = now + backoff_delay(strikes) if reason else 0
+        self.store.set_state('load', {'totals': current, 'since': now, 'strikes': strikes, 'paused_until': paused_until})
+        if reason:
+            logger.warning(f"Pausing scheduled audits for {paused_until - now:.0f}s: {reason}")
+            return True
+        return False
+
+    def expand(self, schedule, now):
+        """Refresh the URLs of a sitemap schedule from the site's sitemaps"""
+        from seo.sitemap import iter_sitemap_entries
+
+        try:
+            urls = [entry['url'] for entry in iter_sitemap_entries(schedule['target'])]
+        except Exception as e:
+            logger.error(f"Error reading sitemaps of {schedule['target']}: {str(e)}", exc_info=True)
+            return
+        if not urls:
+            logger.warning(f"No URLs found in the sitemaps of {schedule['target']}, keeping the previous list")
+            return
+        self.store.set_urls(schedule['id'], schedule['interval'], urls, now)
+        logger.info(f"Schedule {schedule['id']} covers {len(urls)} sitemap URLs")
+
+    def dispatch(self, in_flight, now):
+        """Queue jobs for due URLs while the global and per-host budgets allow; returns the number queued"""
+        budget = self.concurrency - sum(in_flight.values())
+        dispatched = 0
+        if budget <= 0:
+            return 0
+        failed_hosts = set()
+        for row in self.store.due(now, limit=budget * 10):
+            if dispatched >= budget:
+                break
+            if in_flight.get(row['host'], 0) >= self.per_host or row['host'] in failed_hosts:
+                continue
+            if row['kind'] != 'crawl':
+                check = self.precheck(row, now)
+                if check == 'failed':
+                    failed_hosts.add(row['host'])
+                if check != 'changed':
+                    continue
+            options = json.loads(row['options'])
+            if row['kind'] == 'crawl':
+                params = dict(options, url=row['url'])
+                job_id = self.queue.enqueue('crawl', params, dedupe_key=crawl_job_key(params))
+            else:
+                params = {'url': row['url'], 'competitor_urls': [], 'check_links': bool(options.get('check_links'))}
+                job_id = self.queue.enqueue('analyze', params, dedupe_key=analysis_cache_key(params))
+            self.store.update_url(row['schedule_id'], row['url'], status='dispatched', job_id=job_id, skips=0)
+            in_flight[row['host']] = in_flight.get(row['host'], 0) + 1
+            dispatched += 1
+        if dispatched:
+            logger.info(f"Dispatched {dispatched} scheduled audits")
+        return dispatched
+
+    def precheck(self, row, now):
+        """
+        Revalidate a due page against the content hash of its last audit
+        Returns 'unchanged' for a page that is rescheduled without a job (at
+        most SCHEDULE_MAX_SKIPS times in a row), 'failed' when the fetch failed
+        and the host was backed off, and 'changed' otherwise, after storing
+        the new hash and validators for the audit about to be queued
+        """
+        if row['skips'] >= SCHEDULE_MAX_SKIPS:
+            return 'changed'
+        previous = {'content_hash': row['content_hash'], 'etag': row['etag'], 'last_modified': row['last_modified']}
+        document = fetch_document(row['url'], timeout=PRECHECK_TIMEOUT, headers=conditional_headers(previous))
+        if document.error is not None or document.status_code >= 500 or document.status_code == 429:
+            self.store.host_failed(row['host'], now)
+            return 'failed'
+        if row['content_hash'] and is_unchanged(previous, document):
+            logger.debug(f"{row['url']} is unchanged, skipping its audit")
+            self.store.update_url(row['schedule_id'], row['url'], last_run_at=now, last_outcome='unchanged',
+                                  skips=row['skips'] + 1, due_at=next_due(row['url'], row['interval'], now))
+            return 'unchanged'
+        if not document.not_modified:
+            self.store.update_url(row['schedule_id'], row['url'], content_hash=document.content_hash,
+                                  etag=document.headers.get('ETag'), last_modified=document.headers.get('Last-Modified'))
+        self.store.host_succeeded(row['host'])
+        return 'changed'
+
+
+def job_outcome(job):
+    """'done' for a finished job whose page could be fetched and analyzed, 'failed' otherwise"""
+    if job is None:
+        return 'failed'
+    if job['status'] != 'done':
+        return 'failed'
+    result = job.get('result') or {}
+    if 'error' in result or 'error' in (result.get('basic_seo') or {}):
+        return 'failed'
+    return 'done'
+
+
+def run_scheduler(poll_interval=SCHEDULE_POLL_INTERVAL, workers=JOB_WORKERS):
+    """Run the scheduler until the process is stopped, keeping `workers` local job workers running"""
+    scheduler = Scheduler()
+    logger.info(f"Scheduler {os.getpid()} started with {len(scheduler.store.schedules())} schedules")
+    while True:
+        if workers:
+            ensure_workers(workers)
+        try:
+            scheduler.tick()
+        except Exception as e:
+            logger.error(f"Scheduler tick failed: {str(e)}", exc_info=True)
+        registry.flush()
+        time.sleep(poll_interval)
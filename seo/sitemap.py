@@ -0,0 +1,261 @@
+import os
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from urllib.parse import urlparse
+from xml.etree.ElementTree import XMLPullParser, ParseError
+
+import requests
+
+from seo.batch import iter_batch
+from seo.crawler import VisitedSet, load_robots
+from seo.http_client import get_session, make_timeout
+from seo.utils import normalize_url, canonicalize_url, data_path
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_TIMEOUT = float(os.environ.get('SEO_SITEMAP_TIMEOUT', '30'))
+MAX_SITEMAP_FILES = int(os.environ.get('SEO_SITEMAP_MAX_FILES', '100'))
+# The sitemap protocol limits a sitemap to 50 MB uncompressed; this also bounds gzip bombs
+MAX_SITEMAP_BYTES = int(os.environ.get('SEO_SITEMAP_MAX_BYTES', str(50 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+# SQLite limits the number of host parameters in one statement
+_URL_CHUNK = 500
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def parse_lastmod(value):
+    """Unix time of a W3C datetime or date as used by <lastmod>; None when missing or invalid"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def sitemap_sources(url):
+    """
+    Sitemaps to read for a site
+    A URL ending in .xml or .gz is taken as a sitemap itself; otherwise the
+    Sitemap lines of the site's robots.txt are used, or /sitemap.xml without any
+    """
+    url = normalize_url(url)
+    parsed = urlparse(url)
+    if parsed.path.endswith(('.xml', '.gz')):
+        return [url]
+    robots = load_robots(url)
+    sitemaps = robots.site_maps() if robots else None
+    return sitemaps or [f"{parsed.scheme}://{parsed.netloc}/sitemap.xml"]
+
+
+def _inflate(decompressor, data):
+    """Decompressed pieces of gzip data of at most CHUNK_SIZE bytes each"""
+    while True:
+        piece = decompressor.decompress(data, CHUNK_SIZE)
+        data = decompressor.unconsumed_tail
+        if piece:
+            yield piece
+        # A full piece may leave output pending even when all input was consumed
+        if not data and len(piece) < CHUNK_SIZE:
+            return
+
+
+def _chunks(url, timeout):
+    """Decoded body of a sitemap in chunks, gunzipped when the file itself is gzip compressed"""
+    response = get_session().get(url, stream=True, timeout=make_timeout(timeout))
+    try:
+        response.raise_for_status()
+        decompressor = None
+        size = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            if decompressor is None:
+                # Content-Encoding is decoded by requests; a .xml.gz file is still gzip data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk.startswith(GZIP_MAGIC) else False
+            # Inflate in bounded pieces so a highly compressed chunk never expands in memory at once
+            pieces = _inflate(decompressor, chunk) if decompressor else (chunk,)
+            for piece in pieces:
+                size += len(piece)
+                if size > MAX_SITEMAP_BYTES:
+                    raise ValueError(f"Sitemap is larger than {MAX_SITEMAP_BYTES} bytes")
+                yield piece
+    finally:
+        response.close()
+
+
+def parse_sitemap(url, timeout=SITEMAP_TIMEOUT):
+    """
+    Stream-parse one sitemap or sitemap index
+    Yields ('url', loc, lastmod) for each page and ('sitemap', loc, lastmod) for
+    each child sitemap of an index. Elements are discarded as soon as they are
+    read, so memory does not grow with the number of URLs
+    """
+    parser = XMLPullParser(events=('start', 'end'))
+    root = None
+    depth = 0
+    fields = {}
+    for chunk in _chunks(url, timeout):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            name = _local_name(element.tag)
+            # Only direct children of <url> count; extensions such as image:loc are nested deeper
+            if depth == 2 and name in ('loc', 'lastmod'):
+                fields[name] = (element.text or '').strip()
+            elif depth == 1 and name in ('url', 'sitemap'):
+                if fields.get('loc'):
+                    yield name, fields['loc'], parse_lastmod(fields.get('lastmod'))
+                fields = {}
+                root.clear()
+    parser.close()
+
+
+def iter_sitemap_entries(url, timeout=SITEMAP_TIMEOUT, max_files=MAX_SITEMAP_FILES):
+    """
+    Yield every page listed in a site's sitemaps, following sitemap index files
+    Each entry is a dictionary with the normalized 'url', its 'lastmod' as Unix
+    time (or None) and the 'sitemap' it was listed in. Pages listed more than
+    once are yielded once; a sitemap that cannot be read is logged and skipped
+    """
+    pending = list(sitemap_sources(url))
+    read = VisitedSet()
+    seen = VisitedSet()
+    while pending and len(read) < max_files:
+        sitemap_url = pending.pop(0)
+        if not read.add(sitemap_url):
+            continue
+        children = []
+        try:
+            for kind, loc, lastmod in parse_sitemap(sitemap_url, timeout):
+                if kind == 'sitemap':
+                    children.append(loc)
+                elif seen.add(loc):
+                    yield {'url': normalize_url(loc), 'lastmod': lastmod, 'sitemap': sitemap_url}
+        except (requests.RequestException, ParseError, ValueError, zlib.error) as e:
+            logger.warning(f"Could not read sitemap {sitemap_url}: {str(e)}")
+        pending.extend(children)
+    if pending:
+        logger.warning(f"Stopped after {max_files} sitemaps, {len(pending)} not read")
+
+
+class AuditLog:
+    """Time each page was last audited from a sitemap, stored in SQLite"""
+
+    def __init__(self, path=None):
+        self.path = path or data_path('sitemap_audits.sqlite3')
+        self._local = threading.local()
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS audits (url TEXT PRIMARY KEY, audited_at REAL NOT NULL)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def last_audits(self, urls):
+        """Canonical URL -> time of last audit for those of the URLs that were audited"""
+        keys = [canonicalize_url(url) for url in urls]
+        audits = {}
+        for start in range(0, len(keys), _URL_CHUNK):
+            chunk = keys[start:start + _URL_CHUNK]
+            audits.update(self._connect().execute(
+                f"SELECT url, audited_at FROM audits WHERE url IN ({','.join('?' * len(chunk))})", chunk))
+        return audits
+
+    def record(self, url, audited_at=None):
+        """Record that a page has been audited"""
+        self._connect().execute("INSERT OR REPLACE INTO audits VALUES (?, ?)",
+                                (canonicalize_url(url), audited_at or time.time()))
+
+
+_logs = {}
+
+
+def get_audit_log():
+    """Sitemap audit log of the current process"""
+    log = _logs.get(os.getpid())
+    if log is None:
+        log = _logs[os.getpid()] = AuditLog()
+    return log
+
+
+def changed_entries(entries, log=None):
+    """
+    Sitemap entries changed since their last audit
+    An entry is kept when it was never audited, has no lastmod, or its lastmod
+    is later than the last audit. Entries are looked up in chunks, so the
+    stream is never held in memory as a whole
+    """
+    log = log or get_audit_log()
+    entries = iter(entries)
+    while True:
+        chunk = list(islice(entries, _URL_CHUNK))
+        if not chunk:
+            return
+        audits = log.last_audits([entry['url'] for entry in chunk])
+        for entry in chunk:
+            audited_at = audits.get(canonicalize_url(entry['url']))
+            if audited_at is None or entry['lastmod'] is None or entry['lastmod'] > audited_at:
+                yield entry
+
+
+def canonical_mismatch(url, basic_seo):
+    """The page's canonical URL when it differs from the URL listed in the sitemap, else None"""
+    canonical = (basic_seo or {}).get('canonical')
+    if canonical and canonicalize_url(canonical) != canonicalize_url(url):
+        return canonical
+    return None
+
+
+def audit_sitemap(url, changed_only=False, limit=None, **options):
+    """
+    Analyze the pages listed in a site's sitemaps, yielding one batch result per page
+    With changed_only, pages whose lastmod is not later than their last audit
+    are skipped. Each result gets a 'sitemap' entry with the page's lastmod and
+    the canonical URL when it does not match the sitemap URL. Pages analyzed
+    without error are recorded in the audit log.
+    Other options are passed on to iter_batch
+    """
+    entries = iter_sitemap_entries(url)
+    if changed_only:
+        entries = changed_entries(entries)
+    if limit:
+        entries = islice(entries, limit)
+
+    lastmods = {}
+
+    def urls():
+        for entry in entries:
+            lastmods[entry['url']] = entry['lastmod']
+            yield entry['url']
+
+    log = get_audit_log()
+    for result in iter_batch(urls(), **options):
+        lastmod = lastmods.pop(result['url'], None)
+        result['sitemap'] = {
+            'lastmod': datetime.fromtimestamp(lastmod, timezone.utc).isoformat() if lastmod else None,
+            'canonical_mismatch': canonical_mismatch(result['url'], result.get('basic_seo')),
+        }
+        if 'error' not in result and 'error' not in result.get('basic_seo', {}):
+            log.record(result['url'])
+        yield result
@@ -0,0 +1,57 @@
+"""
+Bounded-memory frequency counters for streams of items
+"""
+
+
+class SpaceSaving:
+    """
+    Approximate top-k counter in the style of Space-Saving (Metwally et al.)
+    Counts are exact until 2 * capacity distinct items have been seen; then
+    the counter keeps the `capacity` items with the highest counts and
+    remembers the highest count it dropped. An item that arrives later
+    starts from that count and records it as its error, so counts never
+    underestimate and overestimate by at most `error`. Evicting in batches
+    keeps each update a dictionary operation.
+    """
+
+    __slots__ = ('capacity', 'counts', 'errors', 'floor')
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    def add(self, item):
+        """Count one occurrence of an item"""
+        count = self.counts.get(item)
+        if count is not None:
+            self.counts[item] = count + 1
+            return
+        if len(self.counts) >= 2 * self.capacity:
+            self._evict()
+        self.counts[item] = self.floor + 1
+        self.errors[item] = self.floor
+
+    def update(self, items):
+        """Count each item of an iterable"""
+        for item in items:
+            self.add(item)
+
+    def _evict(self):
+        """Keep the `capacity` items with the highest counts"""
+        ranked = sorted(self.counts.items(), key=lambda pair: pair[1], reverse=True)
+        self.floor = max(self.floor, ranked[self.capacity][1])
+        self.counts = dict(ranked[:self.capacity])
+        self.errors = {item: self.errors[item] for item in self.counts}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def top(self, k=10, min_count=1):
+        """
+        The k items with the highest counts as (item, count, error) tuples
+        Ties are broken by the smaller error, then by first insertion
+        """
+        ranked = sorted(self.counts.items(), key=lambda pair: (-pair[1], self.errors[pair[0]]))
+        return [(item, count, self.errors[item]) for item, count in ranked[:k] if count >= min_count]
@@ -0,0 +1,68 @@
+import os
+import logging
+
+from seo.cache import create_cache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TTL = int(os.environ.get('SEO_SNAPSHOT_TTL', str(7 * 86400)))
+
+_store = None
+
+
+def get_store():
+    """Cache holding the last analyzed snapshot of each page"""
+    global _store
+    if _store is None:
+        _store = create_cache('snapshots', ttl=SNAPSHOT_TTL)
+    return _store
+
+
+def load_snapshot(url):
+    """Last stored snapshot of a page, or None"""
+    return get_store().get(make_cache_key(url))
+
+
+def conditional_headers(snapshot):
+    """If-None-Match / If-Modified-Since headers revalidating a snapshot"""
+    headers = {}
+    if snapshot:
+        if snapshot.get('etag'):
+            headers['If-None-Match'] = snapshot['etag']
+        if snapshot.get('last_modified'):
+            headers['If-Modified-Since'] = snapshot['last_modified']
+    return headers
+
+
+def is_unchanged(snapshot, document):
+    """
+    Whether a freshly fetched document still matches a snapshot
+    True on a 304 response or when the body hashes to the stored value
+    """
+    if not snapshot or document.error is not None:
+        return False
+    if document.not_modified:
+        return True
+    return document.content_hash == snapshot.get('content_hash')
+
+
+def save_snapshot(url, document, basic_seo, content_analysis, previous=None):
+    """
+    Store the analysis results of a page with its validators and content hash
+    A 304 response keeps the previous validators and hash and only renews the TTL
+    Results containing errors are not stored
+    """
+    if 'error' in basic_seo or 'error' in content_analysis or document.error is not None:
+        return
+    if document.not_modified and previous:
+        snapshot = dict(previous)
+    else:
+        snapshot = {
+            'final_url': document.final_url,
+            'etag': document.headers.get('ETag'),
+            'last_modified': document.headers.get('Last-Modified'),
+            'content_hash': document.content_hash,
+        }
+    snapshot['basic_seo'] = basic_seo
+    snapshot['content_analysis'] = content_analysis
+    get_store().set(make_cache_key(url), snapshot)
@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from seo.metrics import STAGE_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+STAGE_WORKERS = int(os.environ.get('SEO_STAGE_WORKERS', '32'))
+
+_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix='seo-stage')
+
+
+class Deadline:
+    """
+    Time budget shared by every stage of one analysis
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left before the deadline, never negative"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, limit):
+        """Cap a network timeout so it cannot outlive the deadline"""
+        return max(0.1, min(limit, self.remaining()))
+
+
+class Stage:
+    """
+    One unit of analysis work run by run_stages
+    The fallback callable builds the result used when the stage times out
+    """
+
+    def __init__(self, name, func, fallback):
+        self.name = name
+        self.func = func
+        self.fallback = fallback
+
+
+class Once:
+    """
+    Compute a value on first use and share it between stages
+    Concurrent callers wait for the first computation instead of repeating it
+    """
+
+    def __init__(self, func):
+        self._func = func
+        self._lock = threading.Lock()
+        self._done = False
+        self._value = None
+
+    def get(self):
+        with self._lock:
+            if not self._done:
+                self._value = self._func()
+                self._done = True
+        return self._value
+
+
+def run_stages(stages, deadline, on_result=None):
+    """
+    Run analysis stages concurrently within a shared deadline
+    Stages that have not finished when the deadline passes are abandoned and
+    replaced by their fallback result, so the caller is never held past it.
+    on_result, when given, is called with each stage name and result as soon
+    as that stage finishes.
+    Returns a dictionary of stage name to result and the list of timed out stages
+    """
+    futures = {_executor.submit(stage.func): stage for stage in stages}
+    results = {}
+    pending = set(futures)
+
+    while pending:
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage = futures[future]
+            try:
+                results[stage.name] = future.result()
+            except Exception as e:
+                logger.error(f"Stage {stage.name} failed: {str(e)}", exc_info=True)
+                results[stage.name] = stage.fallback(str(e))
+            _notify(on_result, stage.name, results[stage.name])
+
+    timed_out = []
+    for future in pending:
+        stage = futures[future]
+        future.cancel()
+        logger.warning(f"Stage {stage.name} did not finish within {deadline.seconds}s")
+        results[stage.name] = stage.fallback(f"Timed out after {deadline.seconds} seconds")
+        timed_out.append(stage.name)
+        STAGE_TIMEOUTS.inc(stage=stage.name)
+        _notify(on_result, stage.name, results[stage.name])
+
+    return results, timed_out
+
+
+def _notify(on_result, name, result):
+    if on_result is None:
+        return
+    try:
+        on_result(name, result)
+    except Exception as e:
+        logger.error(f"Error reporting result of stage {name}: {str(e)}", exc_info=True)
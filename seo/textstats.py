@@ -0,0 +1,229 @@
+import re
+import logging
+from collections import Counter
+
+from seo.sketches import SpaceSaving
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {'the', 'and', 'are', 'for', 'was', 'with', 'this', 'that', 'from', 'they', 'were', 'have', 'what',
+              'your', 'will', 'been'}
+
+# One scan yields whitespace separated tokens and paragraph breaks
+TOKEN_PATTERN = re.compile(r'\S+|\n\s*\n')
+KEYWORD_PATTERN = re.compile(r'\b[a-zA-Z]{3,15}\b')
+TERMINATOR_PATTERN = re.compile(r'[.!?]+')
+VOWELS = frozenset('aeiouy')
+
+MAX_CACHED_TOKENS = 500000
+
+_token_cache = {}
+
+
+def count_syllables(word):
+    """Approximate syllable count of a word by counting vowel groups"""
+    word = word.lower()
+    if len(word) <= 3:
+        return 1
+
+    if word.endswith('es') or word.endswith('ed'):
+        word = word[:-2]
+    elif word.endswith('e'):
+        word = word[:-1]
+
+    count = 0
+    prev_is_vowel = False
+    for char in word:
+        is_vowel = char in VOWELS
+        if is_vowel and not prev_is_vowel:
+            count += 1
+        prev_is_vowel = is_vowel
+
+    return max(1, count)
+
+
+def _token_info(token):
+    """
+    Per-token facts, cached across documents: syllables, keywords, how the
+    token opens, closes and contains sentences, and whether it ends a phrase
+    """
+    info = _token_cache.get(token)
+    if info is None:
+        keywords = tuple(word for word in KEYWORD_PATTERN.findall(token.lower()) if word not in STOP_WORDS)
+        parts = TERMINATOR_PATTERN.split(token)
+        if len(parts) == 1:
+            sentence = None
+        else:
+            inner = sum(1 for part in parts[1:-1] if part)
+            sentence = (bool(parts[0]), inner, bool(parts[-1]))
+        ends_phrase = not keywords or not token[-1].isalnum()
+        info = (count_syllables(token), keywords, sentence, ends_phrase)
+        if len(_token_cache) >= MAX_CACHED_TOKENS:
+            _token_cache.clear()
+        _token_cache[token] = info
+    return info
+
+
+def text_stats(text, phrase_capacity=None):
+    """
+    Word, sentence, paragraph and syllable counts plus keyword frequencies of a text
+    The text is scanned once; work per distinct token is cached. With
+    phrase_capacity set, bigram and trigram keyphrases (runs of keywords not
+    broken by stop words or punctuation) are counted in the same scan by
+    SpaceSaving counters holding at most that many phrases each
+    Returns a dictionary of counts and a Counter of keywords in first-seen order
+    """
+    word_count = 0
+    syllable_count = 0
+    sentence_count = 0
+    paragraph_count = 1
+    in_sentence = False
+    token_counts = {}
+    counting_phrases = phrase_capacity is not None
+    if counting_phrases:
+        bigrams = SpaceSaving(phrase_capacity)
+        trigrams = SpaceSaving(phrase_capacity)
+    previous = second_previous = None
+
+    for token in TOKEN_PATTERN.findall(text):
+        if token[0] == '\n':
+            paragraph_count += 1
+            previous = second_previous = None
+            continue
+        word_count += 1
+        token_counts[token] = token_counts.get(token, 0) + 1
+
+        info = _token_info(token)
+        if counting_phrases:
+            for keyword in info[1]:
+                if previous is not None:
+                    bigrams.add(previous + ' ' + keyword)
+                    if second_previous is not None:
+                        trigrams.add(second_previous + ' ' + previous + ' ' + keyword)
+                second_previous, previous = previous, keyword
+            if info[3]:
+                previous = second_previous = None
+
+        sentence = info[2]
+        if sentence is None:
+            in_sentence = True
+        else:
+            opens, inner, closes = sentence
+            if opens or in_sentence:
+                sentence_count += 1
+            sentence_count += inner
+            in_sentence = closes
+
+    if in_sentence:
+        sentence_count += 1
+
+    keyword_counts = Counter()
+    for token, count in token_counts.items():
+        syllables, keywords = (_token_cache.get(token) or _token_info(token))[:2]
+        syllable_count += syllables * count
+        for keyword in keywords:
+            keyword_counts[keyword] += count
+
+    stats = {
+        'word_count': word_count,
+        'sentence_count': sentence_count,
+        'paragraph_count': paragraph_count,
+        'syllable_count': syllable_count,
+        'keyword_counts': keyword_counts,
+        'keyword_total': sum(keyword_counts.values()),
+    }
+    if counting_phrases:
+        stats['phrase_counts'] = {2: bigrams, 3: trigrams}
+    return stats
+
+
+def flesch_reading_ease(stats):
+    """Flesch Reading Ease score of text_stats results, clamped to 0-100"""
+    if stats['sentence_count'] == 0 or stats['word_count'] == 0:
+        return 0
+    avg_sentence_length = stats['word_count'] / stats['sentence_count']
+    avg_syllables_per_word = stats['syllable_count'] / stats['word_count']
+    score = 206.835 - (1.015 * avg_sentence_length) - (84.6 * avg_syllables_per_word)
+    return max(0, min(100, score))
+
+
+def rank_keywords(stats, limit=10):
+    """Most frequent keywords with their share of all keywords as a percentage"""
+    total = stats['keyword_total']
+    if total == 0:
+        return []
+    return [
+        {'word': word, 'count': count, 'density': round((count / total) * 100, 2)}
+        for word, count in stats['keyword_counts'].most_common(limit)
+    ]
+
+
+def rank_phrases(stats, limit=10, min_count=2):
+    """
+    Most frequent bigram and trigram keyphrases of text_stats results computed with phrase_capacity
+    Density is the share of all keywords covered by the phrase's occurrences, as a percentage
+    """
+    total = stats['keyword_total']
+    if total == 0 or 'phrase_counts' not in stats:
+        return []
+    candidates = []
+    for words, counter in stats['phrase_counts'].items():
+        candidates.extend((count, words, phrase) for phrase, count, _ in counter.top(limit, min_count))
+    candidates.sort(key=lambda candidate: (-candidate[0], -candidate[1]))
+    return [
+        {'phrase': phrase, 'words': words, 'count': count, 'density': round((count * words / total) * 100, 2)}
+        for count, words, phrase in candidates[:limit]
+    ]
+
+
+def batch_text_stats(texts):
+    """
+    Text statistics for many documents at once
+    Token facts are shared across the whole batch through the token cache
+    Returns a list of text_stats results in input order
+    """
+    return [text_stats(text or '') for text in texts]
+
+
+def corpus_summary(stats_list):
+    """
+    Aggregate text statistics over a corpus
+    Uses NumPy arrays when available, plain Python otherwise
+    Returns per-document readability scores and corpus totals and averages
+    """
+    if not stats_list:
+        return {'documents': 0, 'readability_scores': [], 'total_words': 0,
+                'average_words': 0, 'average_readability': 0, 'keyword_counts': Counter()}
+
+    keyword_counts = Counter()
+    for stats in stats_list:
+        keyword_counts.update(stats['keyword_counts'])
+
+    if numpy is not None:
+        words = numpy.array([stats['word_count'] for stats in stats_list], dtype=numpy.float64)
+        sentences = numpy.array([stats['sentence_count'] for stats in stats_list], dtype=numpy.float64)
+        syllables = numpy.array([stats['syllable_count'] for stats in stats_list], dtype=numpy.float64)
+        valid = (words > 0) & (sentences > 0)
+        safe_words = numpy.where(valid, words, 1)
+        safe_sentences = numpy.where(valid, sentences, 1)
+        scores = 206.835 - 1.015 * (safe_words / safe_sentences) - 84.6 * (syllables / safe_words)
+        scores = numpy.where(valid, numpy.clip(scores, 0, 100), 0)
+        readability_scores = scores.tolist()
+        total_words = int(words.sum())
+    else:
+        readability_scores = [flesch_reading_ease(stats) for stats in stats_list]
+        total_words = sum(stats['word_count'] for stats in stats_list)
+
+    return {
+        'documents': len(stats_list),
+        'readability_scores': readability_scores,
+        'total_words': total_words,
+        'average_words': total_words / len(stats_list),
+        'average_readability': sum(readability_scores) / len(readability_scores),
+        'keyword_counts': keyword_counts,
+    }
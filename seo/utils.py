@@ -1,5 +1,8 @@
+import os
 import re
-from urllib.parse import urlparse, urljoin
+from urllib.parse import urlparse, urljoin, urlunparse, parse_qsl, urlencode
+
+from seo.textstats import text_stats, flesch_reading_ease
 
 
 def is_valid_url(url):
@@ -18,6 +21,29 @@ def normalize_url(url):
     return url
 
 
+def canonicalize_url(url):
+    """
+    Normalize URL into a canonical form suitable for cache keys and deduplication
+    Lowercases scheme and host, drops default ports and fragments, sorts the query
+    """
+    parsed = urlparse(normalize_url(url.strip()))
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+    port = parsed.port
+    if port and not ((scheme == 'http' and port == 80) or (scheme == 'https' and port == 443)):
+        host = f"{host}:{port}"
+    path = parsed.path or '/'
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return urlunparse((scheme, host, path, parsed.params, query, ''))
+
+
+def data_path(filename):
+    """Path of a file in the local data directory, created on first use"""
+    data_dir = os.environ.get('SEO_DATA_DIR', 'instance')
+    os.makedirs(data_dir, exist_ok=True)
+    return os.path.join(data_dir, filename)
+
+
 def get_domain(url):
     """Extract domain from URL"""
     parsed_url = urlparse(url)
@@ -61,51 +87,7 @@ def calculate_readability_score(text):
     Calculate Flesch Reading Ease score
     Formula: 206.835 - 1.015 * (total words / total sentences) - 84.6 * (total syllables / total words)
     """
-    # Count words
-    words = re.findall(r'\b\w+\b', text.lower())
-    word_count = len(words)
-    
-    # Count sentences (approximate)
-    sentences = re.split(r'[.!?]+', text)
-    sentence_count = len([s for s in sentences if len(s.strip()) > 0])
-    
-    if sentence_count == 0 or word_count == 0:
-        return 0
-    
-    # Approximate syllable count (this is a simplification)
-    def count_syllables(word):
-        word = word.lower()
-        if len(word) <= 3:
-            return 1
-        
-        # Count vowel groups as syllables
-        count = 0
-        vowels = 'aeiouy'
-        prev_is_vowel = False
-        
-        for char in word:
-            is_vowel = char in vowels
-            if is_vowel and not prev_is_vowel:
-                count += 1
-            prev_is_vowel = is_vowel
-        
-        # Handle common word endings
-        if word.endswith('e') and not word.endswith('le'):
-            count -= 1
-        
-        return max(1, count)  # Every word has at least one syllable
-    
-    syllable_count = sum(count_syllables(word) for word in words)
-    
-    # Calculate averages
-    avg_sentence_length = word_count / sentence_count
-    avg_syllables_per_word = syllable_count / word_count
-    
-    # Apply Flesch Reading Ease formula
-    score = 206.835 - (1.015 * avg_sentence_length) - (84.6 * avg_syllables_per_word)
-    
-    # Ensure score is within bounds
-    return max(0, min(100, score))
+    return flesch_reading_ease(text_stats(text))
 
 
 def get_readability_level(score):
@@ -63,14 +63,24 @@ function createGaugeChart(canvasId, score, label) {
     });
 }
 
+// Colors for comparison datasets: your website first, then each competitor
+const comparisonColors = [
+    [54, 162, 235], [255, 99, 132], [255, 159, 64], [75, 192, 192], [153, 102, 255], [255, 205, 86],
+    [201, 203, 207], [40, 167, 69], [220, 53, 69], [23, 162, 184], [102, 16, 242]
+];
+
+function comparisonColor(index, alpha) {
+    const rgb = comparisonColors[index % comparisonColors.length];
+    return `rgba(${rgb[0]}, ${rgb[1]}, ${rgb[2]}, ${alpha})`;
+}
+
 /**
  * Creates a bar chart for score comparisons
  * @param {string} canvasId - The canvas element ID
  * @param {Array} labels - The labels for each bar
- * @param {Array} yourScores - Your website's scores
- * @param {Array} competitorScores - Competitor's scores
+ * @param {Array} sites - One {label, data} entry per website, your website first
  */
-function createComparisonChart(canvasId, labels, yourScores, competitorScores) {
+function createComparisonChart(canvasId, labels, sites) {
     const canvas = document.getElementById(canvasId);
     if (!canvas) return;
     
@@ -79,22 +89,13 @@ function createComparisonChart(canvasId, labels, yourScores, competitorScores) {
         type: 'bar',
         data: {
             labels: labels,
-            datasets: [
-                {
-                    label: 'Your Website',
-                    backgroundColor: 'rgba(54, 162, 235, 0.7)',
-                    borderColor: 'rgba(54, 162, 235, 1)',
-                    borderWidth: 1,
-                    data: yourScores
-                },
-                {
-                    label: 'Competitor',
-                    backgroundColor: 'rgba(255, 99, 132, 0.7)',
-                    borderColor: 'rgba(255, 99, 132, 1)',
-                    borderWidth: 1,
-                    data: competitorScores
-                }
-            ]
+            datasets: sites.map((site, index) => ({
+                label: site.label,
+                backgroundColor: comparisonColor(index, 0.7),
+                borderColor: comparisonColor(index, 1),
+                borderWidth: 1,
+                data: site.data
+            }))
         },
         options: {
             responsive: true,
@@ -125,10 +126,9 @@ function createComparisonChart(canvasId, labels, yourScores, competitorScores) {
  * Creates a radar chart for keyword density comparison
  * @param {string} canvasId - The canvas element ID
  * @param {Array} keywords - The keywords to compare
- * @param {Array} yourDensity - Your website's keyword density values
- * @param {Array} competitorDensity - Competitor's keyword density values
+ * @param {Array} sites - One {label, data} entry of keyword densities per website, your website first
  */
-function createKeywordRadarChart(canvasId, keywords, yourDensity, competitorDensity) {
+function createKeywordRadarChart(canvasId, keywords, sites) {
     const canvas = document.getElementById(canvasId);
     if (!canvas) return;
     
@@ -137,22 +137,13 @@ function createKeywordRadarChart(canvasId, keywords, yourDensity, competitorDens
         type: 'radar',
         data: {
             labels: keywords,
-            datasets: [
-                {
-                    label: 'Your Website',
-                    backgroundColor: 'rgba(54, 162, 235, 0.2)',
-                    borderColor: 'rgba(54, 162, 235, 1)',
-                    pointBackgroundColor: 'rgba(54, 162, 235, 1)',
-                    data: yourDensity
-                },
-                {
-                    label: 'Competitor',
-                    backgroundColor: 'rgba(255, 99, 132, 0.2)',
-                    borderColor: 'rgba(255, 99, 132, 1)',
-                    pointBackgroundColor: 'rgba(255, 99, 132, 1)',
-                    data: competitorDensity
-                }
-            ]
+            datasets: sites.map((site, index) => ({
+                label: site.label,
+                backgroundColor: comparisonColor(index, 0.2),
+                borderColor: comparisonColor(index, 1),
+                pointBackgroundColor: comparisonColor(index, 1),
+                data: site.data
+            }))
         },
         options: {
             scales: {
@@ -222,3 +213,84 @@ function createContentMetricsChart(canvasId, contentData) {
         }
     });
 }
+
+/**
+ * Creates a line chart of a page's score history
+ * @param {string} canvasId - The canvas element ID
+ * @param {Array} points - [unix time, value] pairs, as returned by /api/v1/history
+ * @param {string} label - The label for the series
+ */
+function createHistoryChart(canvasId, points, label) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas) return;
+    
+    const ctx = canvas.getContext('2d');
+    return new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: points.map(point => new Date(point[0] * 1000).toLocaleDateString()),
+            datasets: [{
+                label: label,
+                data: points.map(point => point[1]),
+                borderColor: comparisonColor(0, 1),
+                backgroundColor: comparisonColor(0, 0.2),
+                fill: true,
+                tension: 0.2
+            }]
+        },
+        options: {
+            ...commonChartOptions,
+            scales: {
+                y: {
+                    beginAtZero: true
+                }
+            }
+        }
+    });
+}
+
+/**
+ * Loads a page's downsampled score history and charts it
+ * The chart's container stays hidden until there are at least two runs
+ * @param {string} canvasId - The canvas element ID
+ * @param {string} url - The analyzed page
+ * @param {string} metric - The metric to chart, e.g. 'overall_score'
+ * @param {string} label - The label for the series
+ */
+function loadHistoryChart(canvasId, url, metric, label) {
+    const canvas = document.getElementById(canvasId);
+    if (!canvas) return;
+    
+    const params = new URLSearchParams({url: url, metric: metric, points: 200});
+    fetch('/api/v1/history?' + params.toString())
+        .then(response => response.ok ? response.json() : null)
+        .then(series => {
+            if (!series || series.points.length < 2) return;
+            const container = canvas.closest('[data-history]');
+            if (container) container.classList.remove('d-none');
+            createHistoryChart(canvasId, series.points, label);
+        })
+        .catch(() => {});
+}
+
+/**
+ * Initializes the score widgets inside a results fragment
+ * Used when result panels are inserted into the page as they stream in
+ * @param {HTMLElement} container - The element containing the fragment
+ */
+function initResultWidgets(container) {
+    container.querySelectorAll('.circular-progress').forEach(function(progressBar) {
+        const value = progressBar.getAttribute('data-value');
+        progressBar.style.background = `conic-gradient(
+            var(--bs-primary) ${value}%, 
+            var(--bs-dark) ${value}%
+        )`;
+    });
+    
+    container.querySelectorAll('canvas[data-score]').forEach(function(canvas) {
+        const score = parseFloat(canvas.getAttribute('data-score'));
+        if (score) {
+            createGaugeChart(canvas.id, score);
+        }
+    });
+}